@@ -2,7 +2,7 @@
 # MACHINE SHOP PRODUCTION MONITORING SYSTEM
 # =========================================
 
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context
 import pandas as pd
 import os
 import io
@@ -10,6 +10,10 @@ from flask import send_file
 
 import os
 import zipfile
+import tempfile
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import io
 from google.oauth2 import service_account
@@ -159,6 +163,9 @@ except Exception as e:
 DATA_FOLDER = "data"
 UPLOAD_FOLDER = "uploads"
 
+# derived files under data/ (rebuilt from the tables, never backed up)
+DERIVED_DATA_FOLDERS = {"_columnar", "_exports"}
+
 PART_MASTER_FILE = os.path.join(DATA_FOLDER, "part_master.csv")
 
 # Ensure folders exist
@@ -208,6 +215,11 @@ if not os.path.exists(ABSENTEEISM_FILE):
         ABSENTEEISM_FILE, index=False
     )
 
+# Production transaction files (appended by Production Entry)
+PRODUCTION_MAIN_FILE = os.path.join(DATA_FOLDER, "production_main.csv")
+PRODUCTION_OTHER_FILE = os.path.join(DATA_FOLDER, "production_other_machine.csv")
+PRODUCTION_LOSS_FILE = os.path.join(DATA_FOLDER, "production_loss.csv")
+
 # =========================================
 # 🔐 GOOGLE DRIVE AUTO BACKUP ENGINE
 # =========================================
@@ -233,7 +245,7 @@ def backup_to_drive():
 
         if not os.path.exists(KEY_FILE):
             print("❌ KEY FILE NOT FOUND in Render secrets")
-            return
+            return False
 
         print("🟢 Key file found")
 
@@ -264,7 +276,7 @@ def backup_to_drive():
 
         if not items:
             print("❌ BACKUP FOLDER NOT FOUND IN DRIVE")
-            return
+            return False
 
         folder_id = items[0]['id']
         print("🟢 Folder found:", folder_id)
@@ -275,11 +287,18 @@ def backup_to_drive():
         print("🔵 Creating zip:", zip_name)
 
         with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk("data"):
-                for file in files:
-                    if file.endswith(".csv"):
-                        full_path = os.path.join(root, file)
-                        zipf.write(full_path, os.path.basename(full_path))
+            # SQLite tables are exported as CSV so the restore path stays the same
+            # (paths relative to data/, so month partitions keep their folder)
+            if storage.name == "sqlite":
+                for path in storage.tables():
+                    zipf.writestr(os.path.relpath(path, "data"), storage.export_csv(path))
+            else:
+                for root, dirs, files in os.walk("data"):
+                    dirs[:] = [d for d in dirs if d not in DERIVED_DATA_FOLDERS]
+                    for file in files:
+                        if file.endswith(".csv"):
+                            full_path = os.path.join(root, file)
+                            zipf.write(full_path, os.path.relpath(full_path, "data"))
 
         print("🟢 Zip created")
 
@@ -369,480 +388,3654 @@ def backup_to_drive():
 
         os.remove(zip_name)
 
+        return True
+
     except Exception as e:
         print("🔴 GOOGLE DRIVE BACKUP FAILED:", str(e))
+        return False
 
 # =========================================
-# MANAGEMENT DASHBOARD – KPI HELPERS
+# 🔁 BACKGROUND BACKUP QUEUE (DEBOUNCED)
 # =========================================
+# Request handlers only mark "data changed". A single worker thread
+# waits for writes to go quiet, then takes ONE snapshot for the whole
+# burst, so save latency never includes a Drive round-trip.
+import threading
+import atexit
+import time
+
+BACKUP_DEBOUNCE_SECONDS = 30     # quiet period before a snapshot
+BACKUP_MAX_DELAY_SECONDS = 300   # never hold a pending backup longer
+BACKUP_SHUTDOWN_TIMEOUT = 120    # max wait for the final flush
+# gunicorn SIGKILLs a worker --graceful-timeout seconds after SIGTERM
+# (default 30): the procfile sets 150, above this flush timeout plus
+# time to finish in-flight requests. Keep the two in step.
+
+# Called (no arguments) on the worker thread before every snapshot, so
+# housekeeping such as ledger compaction rides on the same debounce.
+BACKUP_PRE_HOOKS = []
+
+
+class BackupQueue:
+
+    def __init__(self, backup_fn, debounce, max_delay):
+        self.backup_fn = backup_fn
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+        self._pending = 0
+        self._first_request = None
+        self._last_request = None
+
+        self.metrics = {
+            "requested": 0,
+            "coalesced": 0,
+            "snapshots": 0,
+            "failures": 0,
+            "in_progress": False,
+            "last_success": None,
+            "last_failure": None,
+            "last_duration_sec": None
+        }
 
-from datetime import datetime, timedelta
-import pandas as pd
-import os
+    # ---------- PRODUCER (REQUEST HANDLERS) ----------
+    def request(self):
+        with self._cond:
+            now = time.monotonic()
 
+            if self._pending:
+                self.metrics["coalesced"] += 1
+            else:
+                self._first_request = now
 
-def load_csv(path):
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        return pd.DataFrame()
-    return pd.read_csv(path)
+            self._pending += 1
+            self._last_request = now
+            self.metrics["requested"] += 1
 
+            self._ensure_worker()
+            self._cond.notify_all()
 
-def get_dashboard_kpis():
-    import pandas as pd
+    def _ensure_worker(self):
+        # Worker is started lazily so every gunicorn worker (forked
+        # after import) gets its own thread.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
 
-    # ---------------- LOAD DATA ----------------
-    main_df = load_csv("data/production_main.csv")
-    other_df = load_csv("data/production_other_machine.csv")
-    loss_df = load_csv("data/production_loss.csv")
+        self._stopping = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="backup-queue",
+            daemon=True
+        )
+        self._thread.start()
 
-    prod_df = pd.concat([main_df, other_df], ignore_index=True)
+    # ---------- CONSUMER (WORKER THREAD) ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+
+                if not self._pending:
+                    return
+
+                # wait for the burst to settle (or the max delay / shutdown)
+                while not self._stopping:
+                    now = time.monotonic()
+                    wake_at = min(
+                        self._last_request + self.debounce,
+                        self._first_request + self.max_delay
+                    )
+                    if now >= wake_at:
+                        break
+                    self._cond.wait(wake_at - now)
+
+                self._pending = 0
+                self._first_request = None
+                self.metrics["in_progress"] = True
+
+            self._snapshot()
+
+    def _snapshot(self):
+        started = time.monotonic()
+        ok = False
+
+        for hook in BACKUP_PRE_HOOKS:
+            try:
+                hook()
+            except Exception as e:
+                print("🔴 Backup pre-hook error:", str(e))
 
-    def empty_dashboard():
-        return {
-            "last_days": [],
-            "production_cards": {
-                "date": "No Data",
-                "total_good_qty": 0,
-                "total_defects": 0
-            },
-            "top_parts": [],
-            "loss_pies": [],
-            "performance": []
-        }
-    
-    if prod_df.empty:
-        return empty_dashboard()
-
-    # ---------------- NORMALIZE ----------------
-    prod_df["Date"] = pd.to_datetime(prod_df["Date"], errors="coerce").dt.date
-    prod_df["Time_Min"] = pd.to_numeric(prod_df["Time_Min"], errors="coerce").fillna(0)
-    prod_df["Good_Qty"] = pd.to_numeric(prod_df["Good_Qty"], errors="coerce").fillna(0)
-    prod_df["Mach_Rej"] = pd.to_numeric(prod_df["Mach_Rej"], errors="coerce").fillna(0)
-    prod_df["Op_No"] = (
-        prod_df["Operation"]
-        .astype(str)
-        .str.extract(r"(\d+)")
-        .astype(float)
-    )
+        try:
+            ok = bool(self.backup_fn())
+        except Exception as e:
+            print("🔴 Backup queue error:", str(e))
 
-    if not loss_df.empty:
-        loss_df["Date"] = pd.to_datetime(loss_df["Date"], errors="coerce").dt.date
-        loss_df["Time_Min"] = pd.to_numeric(loss_df["Time_Min"], errors="coerce").fillna(0)
+        with self._cond:
+            stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.metrics["in_progress"] = False
+            self.metrics["last_duration_sec"] = round(time.monotonic() - started, 2)
 
-    # ---------------- LAST WORKING DAYS ----------------
-    available_days = sorted(
-        d for d in prod_df["Date"].dropna().unique()
-        if d.weekday() != 3  # skip Thursday
-    )
+            if ok:
+                self.metrics["snapshots"] += 1
+                self.metrics["last_success"] = stamp
+            else:
+                self.metrics["failures"] += 1
+                self.metrics["last_failure"] = stamp
 
-    if len(available_days) == 0:
-        return empty_dashboard()
+            self._cond.notify_all()
 
-    # 🔵 For KPI + Top Parts + Loss → last 3 days
-    last_3_days = available_days[-3:]
+    # ---------- SHUTDOWN ----------
+    def flush(self, timeout=BACKUP_SHUTDOWN_TIMEOUT):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
 
-    # 🟣 For Shop Performance → last 10 working days
-    last_10_days = available_days[-10:]
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
 
-    prev_day = last_3_days[-1]
+    def status(self):
+        with self._cond:
+            data = dict(self.metrics)
+            data["queue_depth"] = self._pending
+            data["worker_alive"] = bool(self._thread and self._thread.is_alive())
+            return data
 
-    # ==================================================
-    # 🔷 TOP 5 PARTS – LAST OP OUTPUT (LAST 3 WORKING DAYS)
-    # ==================================================
 
-    df_ops = prod_df.copy()
+backup_queue = BackupQueue(
+    backup_to_drive,
+    debounce=BACKUP_DEBOUNCE_SECONDS,
+    max_delay=BACKUP_MAX_DELAY_SECONDS
+)
 
-    # Extract numeric operation number (OP10 → 10)
-    df_ops["Op_No"] = (
-        df_ops["Operation"]
-        .astype(str)
-        .str.extract(r"(\d+)", expand=False)
-    )
+atexit.register(backup_queue.flush)
 
-    df_ops = df_ops[df_ops["Op_No"].notna()]
-    df_ops["Op_No"] = df_ops["Op_No"].astype(int)
 
-    top_parts_daily = {}
+def request_backup():
+    backup_queue.request()
 
-    for day in last_3_days:
-        day_df = df_ops[df_ops["Date"] == day]
+# =========================================
+# 🗄 STORAGE BACKENDS (CSV FILES / SQLITE)
+# =========================================
+# Every table is still addressed by its data/*.csv path. The backend
+# decides where the rows actually live:
+#   csv    (default) one file per table, as before
+#   sqlite one WAL-mode database, data/production.db, one table per
+#          file name, all values kept as the text the CSV would hold
+# Select with STORAGE_BACKEND=sqlite. Tables missing from the database
+# are seeded once from the matching CSV (see also: flask migrate-sqlite).
+import csv
+import json
+import sqlite3
+import click
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "csv").strip().lower()
+SQLITE_DB_FILE = os.path.join(DATA_FOLDER, "production.db")
+
+# derived files that stay plain files under every backend
+STORAGE_FILE_ONLY = {"store_balances.csv"}
+
+SQLITE_INDEXES = {
+    "production_main": [("Date", "Operator", "Machine")],
+    "production_other_machine": [("Date", "Operator", "Machine")],
+    "production_loss": [("Date", "Operator", "Machine")],
+    "operator_absenteeism": [("Date", "Operator")],
+    "store_ledger": [("Item", "Inward_Type"), ("Timestamp",)],
+    "part_master": [("Part Number", "Operation No")],
+    "operator_master": [("Operator ID",)],
+    "machine_master": [("Machine No",)],
+    "store_items": [("Item Code",)]
+}
+
+
+# ---------- WRITE COORDINATION (THREADS + GUNICORN WORKERS) ----------
+# One advisory lock per table, held on data/<table>.csv.lock, around
+# every write and every read-modify-write cycle. Locks are re-entrant
+# within a thread, so a route holding a table lock can still call
+# save_table()/update_rows() on it. Acquisition retries with backoff
+# and gives up with LockTimeout after LOCK_TIMEOUT_SECONDS.
+import contextlib
+from contextlib import contextmanager
+from functools import wraps
 
-        if day_df.empty:
-            top_parts_daily[day.strftime("%d-%m-%Y")] = {}
-            continue
+try:
+    import fcntl
+except ImportError:     # Windows (run_app.bat): single process, thread lock only
+    fcntl = None
 
-        # 🔥 STEP 1: find highest operation per part that day
-        final_ops = (
-            day_df.groupby("Part")["Op_No"]
-            .max()
-            .reset_index()
-            .rename(columns={"Op_No": "FinalOp"})
-        )
+LOCK_TIMEOUT_SECONDS = 30
+LOCK_BACKOFF_START = 0.005
+LOCK_BACKOFF_MAX = 0.2
 
-        day_df = day_df.merge(final_ops, on="Part", how="left")
 
-        # 🔥 STEP 2: keep ONLY final operation rows
-        final_df = day_df[day_df["Op_No"] == day_df["FinalOp"]]
+class LockTimeout(TimeoutError):
+    pass
 
-        # 🔥 STEP 3: sum Good Qty of final operation
-        part_qty = (
-            final_df
-            .groupby("Part")["Good_Qty"]
-            .sum()
-            .to_dict()
-        )
 
-        top_parts_daily[day.strftime("%d-%m-%Y")] = part_qty
+def backoff_delays(timeout):
+    """Sleep intervals (doubling, capped) until `timeout` seconds are used up."""
+    deadline = time.monotonic() + timeout
+    delay = LOCK_BACKOFF_START
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return
+        yield min(delay, left)
+        delay = min(delay * 2, LOCK_BACKOFF_MAX)
+
+
+class TableLocks:
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._guard = threading.Lock()
+        self._thread_locks = {}         # path -> threading.Lock
+        self._held = threading.local()  # path -> (depth, lock file)
+        self._stats = {}
+
+    def _stat(self, key):
+        return self._stats.setdefault(key, {
+            "acquired": 0,
+            "contended": 0,
+            "timeouts": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0
+        })
 
-    # Rank parts across last 3 days
-    all_parts = set()
-    for d in top_parts_daily.values():
-        all_parts.update(d.keys())
+    def _acquire(self, key, timeout):
+        with self._guard:
+            thread_lock = self._thread_locks.setdefault(key, threading.Lock())
 
-    ranking = []
-    for part in all_parts:
-        if not part or str(part).strip().lower() in ["nan", "none"]:
-            continue   # 🔥 skip invalid parts
+        if not thread_lock.acquire(timeout=timeout):
+            return None, None
 
-        total = sum(
-            top_parts_daily[day].get(part, 0)
-            for day in top_parts_daily
-        )
-        ranking.append((part, total))
-
-    top_5_parts = sorted(ranking, key=lambda x: x[1], reverse=True)[:5]
-
-    top_parts_table = []
-    for part, _ in top_5_parts:
-        row = {"Part": part}
-        for day in top_parts_daily:
-            row[day] = int(top_parts_daily[day].get(part, 0))
-        top_parts_table.append(row)
-
-    # ==================================================
-    # 🔴 KPI CARDS – PREVIOUS WORKING DAY
-    # ==================================================
-    prev_df = prod_df[prod_df["Date"] == prev_day]
-
-    total_good_qty = int(prev_df["Good_Qty"].sum())
-    total_defects = int(prev_df["Mach_Rej"].sum())
-
-    # ==================================================
-    # 🔴 LOSS PIES – LAST 3 DAYS
-    # ==================================================
-    loss_pies = []
-
-    if not loss_df.empty:
-        for d in last_3_days:
-            d_loss = loss_df[loss_df["Date"] == d]
-
-            pie_data = (
-                d_loss.groupby("Loss_Reason", as_index=False)
-                .agg(Time_Min=("Time_Min", "sum"))
-            ) if not d_loss.empty else pd.DataFrame()
-
-            loss_pies.append({
-                "date": d.strftime("%d-%m-%Y"),
-                "data": [
-                    {"label": r["Loss_Reason"], "value": int(r["Time_Min"])}
-                    for _, r in pie_data.iterrows()
-                    if r["Time_Min"] > 0
-                ]
-            })
+        if fcntl is None:
+            return thread_lock, None
 
-    # ==================================================
-    # 🟣 SHOP PERFORMANCE – LAST 3 DAYS
-    # ==================================================
-    performance = []
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        f = open(key + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return thread_lock, f
+        except BlockingIOError:
+            pass
 
-    for d in last_10_days:
-        ddf = prod_df[prod_df["Date"] == d]
+        for delay in backoff_delays(timeout):
+            time.sleep(delay)
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return thread_lock, f
+            except BlockingIOError:
+                continue
+
+        f.close()
+        thread_lock.release()
+        return None, None
+
+    @contextmanager
+    def hold(self, path, timeout=None):
+        key = os.path.abspath(path)
+        held = self._held.__dict__
+
+        if key in held:
+            depth, lock = held[key]
+            held[key] = (depth + 1, lock)
+            try:
+                yield
+            finally:
+                depth, lock = held[key]
+                held[key] = (depth - 1, lock)
+            return
 
-        machines = ddf["Machine"].nunique()
-        available_time = machines * 960
+        started = time.monotonic()
+        thread_lock, f = self._acquire(key, self.timeout if timeout is None else timeout)
+        waited_ms = (time.monotonic() - started) * 1000
 
-        loss_time = (
-            loss_df[loss_df["Date"] == d]["Time_Min"].sum()
-            if not loss_df.empty else 0
-        )
+        with self._guard:
+            stat = self._stat(os.path.basename(path))
+            if thread_lock is None:
+                stat["timeouts"] += 1
+            else:
+                stat["acquired"] += 1
+                stat["wait_total_ms"] += waited_ms
+                stat["wait_max_ms"] = max(stat["wait_max_ms"], waited_ms)
+                if waited_ms >= 1:
+                    stat["contended"] += 1
 
-        good = ddf["Good_Qty"].sum()
-        reject = ddf["Mach_Rej"].sum()
-        used_time = ddf["Time_Min"].sum()
+        if thread_lock is None:
+            raise LockTimeout(f"Timed out waiting for the lock on {path}")
 
-        availability = ((available_time - loss_time) / available_time * 100) if available_time else 0
-        performance_pct = (used_time / available_time * 100) if available_time else 0
-        quality = (good / (good + reject) * 100) if (good + reject) else 0
-        oee = (availability * performance_pct * quality) / 10000
+        held[key] = (1, (thread_lock, f))
+        try:
+            yield
+        finally:
+            del held[key]
+            if f is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+            thread_lock.release()
+
+    def stats(self):
+        with self._guard:
+            return {
+                name: dict(stat, wait_total_ms=round(stat["wait_total_ms"], 1),
+                           wait_max_ms=round(stat["wait_max_ms"], 1))
+                for name, stat in sorted(self._stats.items())
+            }
 
-        performance.append({
-            "date": d.strftime("%d-%m-%Y"),
-            "availability": round(max(min(availability, 100), 0), 2),
-            "performance": round(max(min(performance_pct, 100), 0), 2),
-            "quality": round(max(min(quality, 100), 0), 2),
-            "oee": round(max(min(oee, 100), 0), 2)
-        })
 
-    # ==================================================
-    # ✅ FINAL PAYLOAD
-    # ==================================================
-    return {
-        "last_days": [d.strftime("%d-%m-%Y") for d in last_3_days],
-        "production_cards": {
-            "date": prev_day.strftime("%d-%m-%Y"),
-            "total_good_qty": total_good_qty,
-            "total_defects": total_defects
-        },
-        "top_parts": top_parts_table,
-        "loss_pies": loss_pies,
-        "performance": performance
-    }
+table_locks = TableLocks(LOCK_TIMEOUT_SECONDS)
 
-# =====================================================
-# MASTER PROFESSIONAL EXCEL FORMAT ENGINE (GLOBAL)
-# =====================================================
 
-def create_professional_excel(
-    writer,
-    sheet_name,
-    report_title,
-    filters_text,
-    df,
-    start_row=5
-):
-    """
-    Universal corporate Excel formatter for all reports
-    """
+def file_lock(path, timeout=None):
+    """Exclusive, re-entrant lock on one table (threads and processes)."""
+    return table_locks.hold(path, timeout=timeout)
 
-    workbook  = writer.book
-    worksheet = workbook.add_worksheet(sheet_name)
-    writer.sheets[sheet_name] = worksheet
 
-    # ================= FORMATS =================
-    company_fmt = workbook.add_format({
-        "bold": True,
-        "font_size": 16,
-        "align": "center",
-        "font_name": "Calibri"
-    })
+@app.errorhandler(LockTimeout)
+def lock_timeout(e):
+    print("🔴", str(e))
+    return "BUSY_TRY_AGAIN", 503
 
-    system_fmt = workbook.add_format({
-        "bold": True,
-        "font_size": 12,
-        "align": "center",
-        "font_name": "Calibri"
-    })
 
-    report_fmt = workbook.add_format({
-        "bold": True,
-        "font_size": 12,
-        "align": "center",
-        "font_name": "Calibri"
-    })
+@contextlib.contextmanager
+def files_locked(paths):
+    """file_lock on every path, taken in a fixed order (no lock cycles)."""
+    with contextlib.ExitStack() as stack:
+        for path in sorted(set(paths), key=os.path.abspath):
+            stack.enter_context(file_lock(path))
+        yield
 
-    filter_fmt = workbook.add_format({
-        "italic": True,
-        "font_size": 10,
-        "align": "center",
-        "font_name": "Calibri"
-    })
 
-    header_fmt = workbook.add_format({
-        "bold": True,
-        "border": 1,
-        "align": "center",
-        "valign": "vcenter",
-        "bg_color": "#D9E1F2",   # visible corporate header color
-        "font_name": "Calibri"
-    })
+def write_locked(*paths):
+    """
+    Route decorator: hold the table locks for the whole request when it
+    writes (any method but GET/HEAD), so load -> modify -> save cannot
+    interleave with another worker. Locks are taken in a fixed order.
+    """
 
-    cell_fmt = workbook.add_format({
-        "border": 1,
-        "align": "center",
-        "font_name": "Calibri"
-    })
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in ("GET", "HEAD"):
+                return view(*args, **kwargs)
 
-    # ================= CORPORATE HEADER =================
-    last_col = len(df.columns) - 1
+            with files_locked(paths):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
 
-    worksheet.merge_range(0, 0, 0, last_col,
-        "CATI Manufacturing Pvt. Ltd.", company_fmt)
 
-    worksheet.merge_range(1, 0, 1, last_col,
-        "Production Monitoring System", system_fmt)
+def atomic_write(path, write_fn, mode="w"):
+    """
+    write_fn(f) into a temp file next to `path`, fsync, then os.replace()
+    it over `path`: readers see the old file or the new one, never a
+    truncated one. os.replace is retried briefly (Windows refuses it
+    while another process has the file open).
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(folder, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
 
-    worksheet.merge_range(2, 0, 2, last_col,
-        report_title, report_fmt)
+    try:
+        with open(tmp, mode, newline="" if "b" not in mode else None) as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
 
-    worksheet.merge_range(3, 0, 3, last_col,
-        f"Applied Filters: {filters_text}", filter_fmt)
+        for delay in backoff_delays(LOCK_TIMEOUT_SECONDS):
+            try:
+                os.replace(tmp, path)
+                return
+            except PermissionError:
+                time.sleep(delay)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# Rows are matched on the text the table holds, under both backends:
+# a query-string "30" matches an Operation No written as 30. Blank cells
+# never match (SQLite keeps them as NULL).
+TEXT_READ = {"dtype": str, "keep_default_na": False}
+
+
+def match_text(value):
+    return "" if value is None else str(value)
+
+
+def match_mask(df, where):
+    """df read with TEXT_READ; True where every {column: value} matches."""
+    mask = pd.Series(True, index=df.index)
+    for col, value in where.items():
+        text = match_text(value)
+        mask &= (df[col] == text) & (text != "")
+    return mask
+
+
+# ---------- DATE RANGES ----------
+# Dates are written as ISO text (YYYY-MM-DD) by every entry path, so a
+# range of days is a text range: [first day, day after the last).
+def day_range(first, last):
+    after = pd.Timestamp(last) + pd.Timedelta(days=1)
+    return pd.Timestamp(first).strftime("%Y-%m-%d"), after.strftime("%Y-%m-%d")
+
+
+def day_mask(df, days):
+    if "Date" not in df.columns:
+        return pd.Series(False, index=df.index)
+    text = df["Date"].astype(str)
+    return (text >= days[0]) & (text < days[1])
+
+
+# ---------- TYPED FRAMES FROM TEXT ROWS (SQLITE READS) ----------
+# SQLite keeps every cell as the text the CSV would hold. Each table also
+# stores, per column, the dtype pd.read_csv would infer for that text
+# (kind, has blanks), kept up to date on every write, so a read builds
+# the frame straight from the cursor rows.
+CSV_NA_TEXT = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null"
+}
+CSV_BOOL_TEXT = {
+    "True": True, "TRUE": True, "true": True,
+    "False": False, "FALSE": False, "false": False
+}
+
+
+def text_kind(values):
+    """[kind, has_na] read_csv would give a column of these texts."""
+    s = pd.Series(values, dtype=object)
+    na = s.isna() | s.isin(CSV_NA_TEXT)
+    s = s[~na]
+
+    if s.empty:
+        kind = "empty"
+    elif s.isin(CSV_BOOL_TEXT.keys()).all():
+        kind = "bool"
+    elif pd.to_numeric(s, errors="coerce").notna().all():
+        kind = "int" if s.str.fullmatch(r"\s*[+-]?\d{1,18}\s*").all() else "float"
+    else:
+        kind = "str"
+    return [kind, bool(na.any())]
+
+
+def merge_kinds(a, b):
+    """Kind of a column holding the rows of a, then the rows of b."""
+    if a[0] == "empty" or a[0] == b[0]:
+        kind = b[0]
+    elif b[0] == "empty":
+        kind = a[0]
+    elif {a[0], b[0]} == {"int", "float"}:
+        kind = "float"
+    else:
+        kind = "str"
+    return [kind, a[1] or b[1]]
 
-    # ================= TABLE HEADER =================
-    for col_num, col_name in enumerate(df.columns):
-        worksheet.write(start_row, col_num, col_name, header_fmt)
 
-    # ================= TABLE DATA =================
-    data_start = start_row + 1
+def column_kinds(columns, rows):
+    """{column: [kind, has_na]} of text rows (None = blank cell)."""
+    cells = list(zip(*rows)) if rows else [()] * len(columns)
+    return {col: text_kind(list(values)) for col, values in zip(columns, cells)}
 
-    for r in range(len(df)):
-        for c in range(len(df.columns)):
-            worksheet.write(data_start + r, c, df.iloc[r, c], cell_fmt)
 
-    # ================= AUTO COLUMN WIDTH =================
-    for i, col in enumerate(df.columns):
-        max_len = max(
-            df[col].astype(str).map(len).max(),
-            len(col)
-        ) + 4
-        worksheet.set_column(i, i, max_len)
+def typed_column(values, kind, has_na):
+    s = pd.Series(values, dtype=object)
 
-    # ================= FREEZE =================
-    worksheet.freeze_panes(data_start, 0)
+    if kind == "empty":
+        # all blank -> float NaN; no rows at all -> object (header only)
+        return s.astype("float64") if has_na else s
 
-    return worksheet
+    # the NA scan is only needed where the kinds say there are blanks
+    if has_na:
+        s = s.where(~(s.isna() | s.isin(CSV_NA_TEXT)))
 
-# =========================================
-# HOME
-# =========================================
+    if kind == "int" and not has_na:
+        return s.astype("int64")
+    if kind in ("int", "float"):
+        return s.astype("float64")
+    if kind == "bool":
+        flags = s.map(CSV_BOOL_TEXT)
+        return flags.astype(bool) if not has_na else flags.where(s.notna())
+    return s.astype("str")
 
-@app.route("/")
-def home():
-    return render_template("home.html")
 
-# =========================================
-# PRODUCTION MODULE HOME
-# =========================================
-@app.route("/production")
-def production_home():
-    return render_template("production_home.html")
+def text_frame(columns, rows, kinds, dtype=None, keep_default_na=True):
+    """
+    The frame pd.read_csv(**read_kwargs) gives for these text rows;
+    dtype=str / keep_default_na=False as read_csv treats them.
+    """
+    cells = list(zip(*rows)) if rows else [()] * len(columns)
+    data = {}
+    for col, values in zip(columns, cells):
+        if dtype is str and not keep_default_na:
+            data[col] = pd.Series(
+                ["" if v is None else v for v in values], dtype="str"
+            )
+        elif dtype is str:
+            s = pd.Series(values, dtype=object)
+            data[col] = s.where(~(s.isna() | s.isin(CSV_NA_TEXT))).astype("str")
+        else:
+            kind, has_na = kinds.get(col) or text_kind(list(values))
+            data[col] = typed_column(values, kind, has_na)
+    return pd.DataFrame(data, columns=columns)
 
-# =========================================
-# PART MASTER (MASTER–DETAIL VIEW)
-# =========================================
 
-@app.route("/part_master", methods=["GET", "POST"])
-def part_master():
+class CsvStorage:
 
-    df = pd.read_csv(PART_MASTER_FILE)
+    name = "csv"
 
-    # ==============================
-    # HANDLE POST
-    # ==============================
-    if request.method == "POST":
+    def signature(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
 
-        # -------- MANUAL ADD --------
-        if "part_number" in request.form:
-            part_no = request.form["part_number"].strip()
-            op_no = request.form["operation_no"].strip()
-            cycle_time = float(request.form["cycle_time"])
-            machine_type = request.form["machine_type"].strip()
+    def blank(self, sig):
+        """True for a missing or zero-byte file (no header row)."""
+        return sig is None or sig[1] == 0
 
-            target_per_hour = int(60 // cycle_time)
+    def read(self, path, days=None, **read_kwargs):
+        df = pd.read_csv(path, **read_kwargs)
+        return df if days is None else df[day_mask(df, days)].reset_index(drop=True)
 
-            duplicate = df[
-                (df["Part Number"] == part_no) &
-                (df["Operation No"] == op_no)
-            ]
+    def write(self, df, path, **to_csv_kwargs):
+        atomic_write(path, lambda f: df.to_csv(f, index=False, **to_csv_kwargs))
 
-            if len(duplicate) == 0:
-                new_row = {
-                    "Part Number": part_no,
-                    "Operation No": op_no,
-                    "Cycle Time (min)": cycle_time,
-                    "Machine Type": machine_type,
-                    "Target Per Hour": target_per_hour
-                }
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                df.to_csv(PART_MASTER_FILE, index=False)
+    def _header(self, path):
+        with open(path, newline="") as f:
+            return next(csv.reader(f), None)
 
-        # -------- EXCEL UPLOAD --------
-        if "excel_file" in request.files:
-            file = request.files["excel_file"]
-            if file and file.filename != "":
+    def append(self, df, path, **to_csv_kwargs):
+        if self.blank(self.signature(path)):
+            df.to_csv(path, mode="a", index=False, header=True, **to_csv_kwargs)
+            return
 
-                upload_df = pd.read_excel(file)
+        header = self._header(path)
+
+        if list(df.columns) != header:
+            if not set(df.columns) <= set(header):
+                # new column -> whole-file rewrite, same as concat + save
+                self.write(pd.concat([self.read(path), df], ignore_index=True),
+                           path, **to_csv_kwargs)
+                return
+            df = df.reindex(columns=header)
+
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+        # fsync so an acknowledged transaction survives a crash/restart
+        with open(path, "a", newline="") as f:
+            df.to_csv(f, index=False, header=False, **to_csv_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_appended(self, path, old_sig):
+        """Raw CSV text of the rows written after old_sig (no header)."""
+        with open(path, "rb") as f:
+            f.seek(old_sig[1])
+            return f.read()
+
+    def delete_rows(self, path, where):
+        df = self.read(path, **TEXT_READ)
+        mask = match_mask(df, where)
+        removed = df[mask]
+        if not removed.empty:
+            self.write(df[~mask], path)
+        return removed
+
+    def update_rows(self, path, where, updates):
+        df = self.read(path, **TEXT_READ)
+        mask = match_mask(df, where)
+        before = df[mask].copy()
+
+        if mask.any():
+            for col, value in updates.items():
+                df.loc[mask, col] = match_text(value)
+            self.write(df, path)
+        return before, df[mask]
+
+    def export_csv(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def remove(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def partitions(self, folder):
+        """Partition keys (file names without .csv) stored under folder."""
+        if not os.path.isdir(folder):
+            return []
+        return partition_names(folder, [
+            os.path.splitext(f)[0] for f in os.listdir(folder) if f.endswith(".csv")
+        ])
 
-                for _, row in upload_df.iterrows():
-                    part_no = str(row["Part Number"]).strip()
-                    op_no = str(row["Operation No"]).strip()
-                    cycle_time = float(row["Cycle Time (min)"])
-                    machine_type = str(row["Machine Type"]).strip()
+    def tables(self):
+        found = []
+        for root, dirs, files in os.walk(DATA_FOLDER):
+            dirs[:] = sorted(d for d in dirs if d not in DERIVED_DATA_FOLDERS)
+            found += [
+                os.path.join(root, f) for f in sorted(files)
+                if f.endswith(".csv") and f not in STORAGE_FILE_ONLY
+            ]
+        return found
 
-                    target_per_hour = int(60 // cycle_time)
 
-                    duplicate = df[
-                        (df["Part Number"] == part_no) &
-                        (df["Operation No"] == op_no)
-                    ]
+class SqliteStorage(CsvStorage):
 
-                    if len(duplicate) == 0:
-                        new_row = {
-                            "Part Number": part_no,
-                            "Operation No": op_no,
-                            "Cycle Time (min)": cycle_time,
-                            "Machine Type": machine_type,
-                            "Target Per Hour": target_per_hour
-                        }
-                        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                    
-                    else:
-                        # UPDATE
-                        df.loc[
-                            (df["Part Number"] == part_no) &
-                            (df["Operation No"] == op_no),
-                            ["Cycle Time (min)", "Machine Type", "Target Per Hour"]
-                        ] = [cycle_time, machine_type, target_per_hour]
-
-                df.to_csv(PART_MASTER_FILE, index=False)
+    name = "sqlite"
 
-        backup_to_drive()
-        return redirect(url_for("part_master"))
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._seed_lock = threading.Lock()
 
-    # ==============================
-    # GET DATA FOR UI
-    # ==============================
+    # ---------- CONNECTION (PER THREAD, PER PROCESS) ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
 
-    parts = sorted(df["Part Number"].unique().tolist())
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _table_versions "
+            "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _table_kinds "
+            "(name TEXT PRIMARY KEY, version INTEGER NOT NULL, kinds TEXT NOT NULL)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _table(path):
+        """data/part_master.csv -> part_master, data/production_main/2026-10.csv
+        -> production_main/2026-10"""
+        rel = os.path.relpath(os.path.splitext(path)[0], DATA_FOLDER)
+        return rel.replace(os.sep, "/")
+
+    @staticmethod
+    def _q(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _columns(self, conn, table):
+        rows = conn.execute(f"PRAGMA table_info({self._q(table)})").fetchall()
+        return [r[1] for r in rows]
+
+    def _version(self, conn, table):
+        row = conn.execute(
+            "SELECT version FROM _table_versions WHERE name = ?", (table,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _bump(self, conn, table, kinds=None):
+        """New table version; kinds: the column kinds of the new contents
+        (None: worked out again on the next read)."""
+        conn.execute(
+            "INSERT INTO _table_versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+            (table,)
+        )
+        if kinds is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO _table_kinds (name, version, kinds) "
+                "VALUES (?, ?, ?)",
+                (table, self._version(conn, table), json.dumps(kinds))
+            )
 
-    selected_part = request.args.get("part")
-    operations = []
+    def _kinds(self, conn, table, version):
+        """Stored column kinds, if they describe this version of the table."""
+        row = conn.execute(
+            "SELECT version, kinds FROM _table_kinds WHERE name = ?", (table,)
+        ).fetchone()
+        return json.loads(row[1]) if row and row[0] == version else None
+
+    # ---------- ONE-SHOT SEED FROM CSV ----------
+    def _seed(self, conn, path):
+        """Import data/<table>.csv the first time a table is touched."""
+        table = self._table(path)
+        known = conn.execute(
+            "SELECT 1 FROM _table_versions WHERE name = ?", (table,)
+        ).fetchone()
+        if known:
+            return
 
-    if selected_part:
-        operations = df[df["Part Number"] == selected_part].to_dict(orient="records")
-    
-    return render_template(
-        "part_master.html",
-        parts=parts,
-        selected_part=selected_part,
-        operations=operations
-    )
+        with self._seed_lock:
+            self.import_csv(path, overwrite=False)
 
-# =========================================
-# DELETE OPERATION (SAFE: BY KEY)
-# =========================================
+    def import_csv(self, path, overwrite=True):
+        conn = self._conn()
+        table = self._table(path)
 
-@app.route("/delete_part_op")
-def delete_part_op():
-    part = request.args.get("part")
-    op = request.args.get("op")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            known = conn.execute(
+                "SELECT 1 FROM _table_versions WHERE name = ?", (table,)
+            ).fetchone()
+            if known and not overwrite:
+                conn.execute("COMMIT")
+                return False
+
+            rows = []
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, newline="", encoding="utf-8") as f:
+                    rows = list(csv.reader(f))
+
+            conn.execute(f"DROP TABLE IF EXISTS {self._q(table)}")
+            kinds = {}
+            if rows:
+                self._create(conn, table, rows[0])
+                kinds = column_kinds(rows[0], self._insert(conn, table, rows[0], rows[1:]))
+            self._bump(conn, table, kinds)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return True
+
+    # ---------- LOW LEVEL ----------
+    def _create(self, conn, table, columns):
+        cols = ", ".join(f"{self._q(c)} TEXT" for c in columns)
+        conn.execute(f"CREATE TABLE {self._q(table)} ({cols})")
+
+        for i, index_cols in enumerate(SQLITE_INDEXES.get(table.split("/")[0], [])):
+            if set(index_cols) <= set(columns):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._q(f'ix_{table}_{i}')} "
+                    f"ON {self._q(table)} ({', '.join(self._q(c) for c in index_cols)})"
+                )
 
-    df = pd.read_csv(PART_MASTER_FILE)
+    def _insert(self, conn, table, columns, rows):
+        """Insert CSV text rows (blank -> NULL); returns them as stored."""
+        width = len(columns)
+        rows = [
+            [v if v != "" else None for v in (r + [""] * width)[:width]]
+            for r in rows if r
+        ]
+        if rows:
+            conn.executemany(
+                f"INSERT INTO {self._q(table)} "
+                f"({', '.join(self._q(c) for c in columns)}) "
+                f"VALUES ({', '.join('?' * width)})",
+                rows
+            )
+        return rows
+
+    @staticmethod
+    def _to_rows(df, **to_csv_kwargs):
+        """Header + rows exactly as df.to_csv() would write them."""
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, **to_csv_kwargs)
+        buf.seek(0)
+        return list(csv.reader(buf))
+
+    @staticmethod
+    def _to_csv_text(columns, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if columns is not None:
+            writer.writerow(columns)
+        writer.writerows(["" if v is None else v for v in r] for r in rows)
+        return buf.getvalue()
+
+    def _select(self, conn, table, columns, where=None, after_rowid=None, days=None):
+        sql = f"SELECT {', '.join(self._q(c) for c in columns)} FROM {self._q(table)}"
+        args = []
+        clauses = []
+
+        for col, value in (where or {}).items():
+            clauses.append(f"{self._q(col)} = ?")
+            args.append(match_text(value))
+        if after_rowid is not None:
+            clauses.append("rowid > ?")
+            args.append(after_rowid)
+        if days is not None:
+            # ISO date text: served by the (Date, ...) index
+            clauses.append('"Date" >= ? AND "Date" < ?')
+            args += list(days)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+
+        return conn.execute(sql + " ORDER BY rowid", args).fetchall()
+
+    def _frame(self, columns, rows, kinds=None, **read_kwargs):
+        """The frame pd.read_csv(**read_kwargs) gives for these rows."""
+        if not columns:
+            return pd.DataFrame()
+        if set(read_kwargs) - {"dtype", "keep_default_na", "engine"} or (
+            read_kwargs.get("dtype", str) is not str
+        ):
+            # options text_frame does not cover: parse the CSV text
+            return pd.read_csv(io.StringIO(self._to_csv_text(columns, rows)), **read_kwargs)
+        return text_frame(
+            columns, rows, kinds or {},
+            dtype=read_kwargs.get("dtype"),
+            keep_default_na=read_kwargs.get("keep_default_na", True)
+        )
 
-    df = df[~((df["Part Number"] == part) & (df["Operation No"] == op))]
+    # ---------- STORAGE API ----------
+    def signature(self, path):
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+
+        version = conn.execute(
+            "SELECT version FROM _table_versions WHERE name = ?", (table,)
+        ).fetchone()
+        columns = self._columns(conn, table)
+        if not version or not columns:
+            return None
 
-    df.to_csv(PART_MASTER_FILE, index=False)
+        last_rowid = conn.execute(
+            f"SELECT COALESCE(MAX(rowid), 0) FROM {self._q(table)}"
+        ).fetchone()[0]
+        return (version[0], last_rowid, 0)
+
+    def blank(self, sig):
+        return sig is None
+
+    def read(self, path, days=None, **read_kwargs):
+        """
+        Rows as pd.read_csv would parse the CSV, built from the cursor rows.
+        days=(first, after): only Date text in [first, after), an index
+        range scan.
+        """
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+
+        conn.execute("BEGIN")   # one snapshot: version, kinds and rows agree
+        try:
+            version = self._version(conn, table)
+            columns = self._columns(conn, table)
+            kinds = self._kinds(conn, table, version)
+            missing = kinds is None and bool(columns)
+            if missing:
+                kinds = column_kinds(columns, self._select(conn, table, columns))
+            rows = self._select(conn, table, columns, days=days) if columns else []
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if missing:
+            # kinds dropped by a delete / update: keep them for this version
+            conn.execute(
+                "INSERT INTO _table_kinds (name, version, kinds) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = excluded.version, "
+                "kinds = excluded.kinds WHERE excluded.version > _table_kinds.version",
+                (table, version, json.dumps(kinds))
+            )
 
-    backup_to_drive()
-    return redirect(url_for("part_master", part=part))
+        return self._frame(columns, rows, kinds, **read_kwargs)
 
-# =========================================
-# EDIT OPERATION (SAVE)
-# =========================================
+    def write(self, df, path, **to_csv_kwargs):
+        conn = self._conn()
+        table = self._table(path)
+        rows = self._to_rows(df, **to_csv_kwargs) if len(df.columns) else []
 
-@app.route("/edit_part_op", methods=["POST"])
-def edit_part_op():
-    part = request.form["part_number"]
-    old_op = request.form["old_operation_no"]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {self._q(table)}")
+            kinds = {}
+            if rows:
+                self._create(conn, table, rows[0])
+                kinds = column_kinds(rows[0], self._insert(conn, table, rows[0], rows[1:]))
+            self._bump(conn, table, kinds)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def append(self, df, path, **to_csv_kwargs):
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+        rows = self._to_rows(df, **to_csv_kwargs)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self._columns(conn, table)
+            kinds = self._kinds(conn, table, self._version(conn, table))
+            had_rows = conn.execute(
+                f"SELECT 1 FROM {self._q(table)} LIMIT 1"
+            ).fetchone() is not None if existing else False
+
+            if not existing:
+                self._create(conn, table, rows[0])
+                kinds = {}
+            else:
+                for col in rows[0]:
+                    if col not in existing:
+                        conn.execute(
+                            f"ALTER TABLE {self._q(table)} ADD COLUMN {self._q(col)} TEXT"
+                        )
+            added = self._insert(conn, table, rows[0], rows[1:])
+
+            if kinds is not None:
+                # the kinds of old rows + new rows, as one read_csv would see them
+                new = column_kinds(rows[0], added)
+                for col in set(kinds) | set(new):
+                    kinds[col] = merge_kinds(
+                        kinds.get(col, ["empty", had_rows]),
+                        new.get(col, ["empty", bool(added)])
+                    )
+            self._bump(conn, table, kinds)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def read_appended(self, path, old_sig):
+        conn = self._conn()
+        table = self._table(path)
+        columns = self._columns(conn, table)
+        rows = self._select(conn, table, columns, after_rowid=old_sig[1])
+        return self._to_csv_text(None, rows).encode("utf-8")
+
+    def delete_rows(self, path, where):
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+        columns = self._columns(conn, table)
+        if not columns:
+            return pd.DataFrame()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._select(conn, table, columns, where)
+            if removed:
+                clause = " AND ".join(f"{self._q(c)} = ?" for c in where)
+                conn.execute(
+                    f"DELETE FROM {self._q(table)} WHERE {clause}",
+                    [match_text(v) for v in where.values()]
+                )
+                self._bump(conn, table)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return self._frame(columns, removed, **TEXT_READ)
+
+    def update_rows(self, path, where, updates):
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+        columns = self._columns(conn, table)
+        if not columns:
+            return pd.DataFrame(), pd.DataFrame()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for col in updates:
+                if col not in columns:
+                    conn.execute(
+                        f"ALTER TABLE {self._q(table)} ADD COLUMN {self._q(col)} TEXT"
+                    )
+                    columns.append(col)
+
+            matched = conn.execute(
+                f"SELECT rowid, {', '.join(self._q(c) for c in columns)} "
+                f"FROM {self._q(table)} WHERE "
+                + " AND ".join(f"{self._q(c)} = ?" for c in where)
+                + " ORDER BY rowid",
+                [match_text(v) for v in where.values()]
+            ).fetchall()
+
+            rowids = [r[0] for r in matched]
+            before = self._frame(columns, [r[1:] for r in matched], **TEXT_READ)
+            after = before
+
+            if rowids:
+                # the same text a CSV rewrite of these rows would hold
+                texts = {col: match_text(value) for col, value in updates.items()}
+                after = before.copy()
+                for col, text in texts.items():
+                    after[col] = text
+
+                conn.executemany(
+                    f"UPDATE {self._q(table)} SET "
+                    + ", ".join(f"{self._q(c)} = ?" for c in texts)
+                    + " WHERE rowid = ?",
+                    [
+                        [t if t != "" else None for t in texts.values()] + [rowid]
+                        for rowid in rowids
+                    ]
+                )
+                self._bump(conn, table)
+
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return before, after
+
+    def export_csv(self, path):
+        conn = self._conn()
+        self._seed(conn, path)
+        table = self._table(path)
+        columns = self._columns(conn, table)
+        if not columns:
+            return b""
+        rows = self._select(conn, table, columns)
+        return self._to_csv_text(columns, rows).encode("utf-8")
+
+    def remove(self, path):
+        conn = self._conn()
+        table = self._table(path)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {self._q(table)}")
+            # the version row stays, so the table is never re-seeded from CSV
+            self._bump(conn, table)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _live_tables(self, conn):
+        return {
+            r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall()
+        } - {"_table_versions"}
+
+    def partitions(self, folder):
+        conn = self._conn()
+        prefix = self._table(folder) + "/"
+
+        known = {
+            r[0] for r in conn.execute("SELECT name FROM _table_versions").fetchall()
+        }
+        keys = {
+            n[len(prefix):] for n in self._live_tables(conn) if n.startswith(prefix)
+        }
+        # CSV partitions not imported yet are seeded on first read
+        keys |= {
+            k for k in CsvStorage.partitions(self, folder) if prefix + k not in known
+        }
+        return partition_names(folder, keys)
+
+    def tables(self):
+        conn = self._conn()
+        known = {
+            r[0] for r in conn.execute("SELECT name FROM _table_versions").fetchall()
+        }
+        names = self._live_tables(conn)
+        names |= {
+            self._table(p) for p in CsvStorage.tables(self)
+            if self._table(p) not in known
+        }
+        return [os.path.join(DATA_FOLDER, *n.split("/")) + ".csv" for n in sorted(names)]
+
+
+if STORAGE_BACKEND == "sqlite":
+    storage = SqliteStorage(SQLITE_DB_FILE)
+else:
+    storage = CsvStorage()
+
+print(f"🗄 Storage backend: {storage.name}")
+
+
+def table_signature(path):
+    return storage.signature(path)
+
+
+def table_exists(path):
+    return table_signature(path) is not None
+
+
+def table_is_blank(path):
+    """Missing, or an empty file without even a header row."""
+    return storage.blank(table_signature(path))
+
+
+@app.cli.command("migrate-sqlite")
+@click.option("--overwrite", is_flag=True,
+              help="Re-import tables that already exist in the database.")
+def migrate_sqlite_command(overwrite):
+    """Import data/*.csv into data/production.db (one table per file)."""
+    target = SqliteStorage(SQLITE_DB_FILE)
+
+    for path in CsvStorage().tables():
+        f = os.path.relpath(path, DATA_FOLDER)
+        if target.import_csv(path, overwrite=overwrite):
+            print(f"🟢 {f} -> {target._table(path)}")
+        else:
+            print(f"⚪ {f} already migrated (use --overwrite)")
+
+
+# key columns the master pages delete / edit rows by (query-string text)
+STORAGE_ROW_KEYS = {
+    "part_master.csv": ["Part Number", "Operation No"],
+    "operator_master.csv": ["Operator ID"],
+    "machine_master.csv": ["Machine No"],
+    "store_items.csv": ["Item Code"]
+}
+
+
+@app.cli.command("verify-storage-parity")
+def verify_storage_parity_command():
+    """Run the master edits / deletes on scratch copies under both backends."""
+    import shutil
+
+    failed = 0
+    scratch = tempfile.mkdtemp(prefix="storage_parity_")
+    try:
+        for name, keys in STORAGE_ROW_KEYS.items():
+            source = os.path.join(DATA_FOLDER, name)
+            if table_is_blank(source):
+                print(f"⚪ {name}: no rows")
+                continue
+
+            # the keys as the routes receive them: text, first rows + a miss
+            text = storage.read(source, **TEXT_READ)
+            wheres = [dict(zip(keys, row)) for row in text[keys].head(3).to_numpy()]
+            wheres.append({k: "__missing__" for k in keys})
+            other = [c for c in text.columns if c not in keys][:1]
+
+            results = []
+            for backend in ("csv", "sqlite"):
+                folder = os.path.join(scratch, backend)
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, name)
+                with open(path, "wb") as f:
+                    f.write(storage.export_csv(source))
+
+                target = (
+                    CsvStorage() if backend == "csv"
+                    else SqliteStorage(os.path.join(folder, "parity.db"))
+                )
+                counts = []
+                for where in wheres[1:]:
+                    _, after = target.update_rows(path, where, {c: "PARITY" for c in other})
+                    counts.append(len(after))
+                counts.append(len(target.delete_rows(path, wheres[0])))
+                results.append((counts, target.read(path, **TEXT_READ)))
+
+            (csv_counts, csv_df), (sql_counts, sql_df) = results
+            if csv_counts == sql_counts and csv_df.equals(sql_df):
+                print(f"✅ {name}: rows matched {csv_counts} under both backends")
+            else:
+                failed += 1
+                print(f"❌ {name}: csv {csv_counts} vs sqlite {sql_counts}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if failed:
+        raise SystemExit(1)
+
+# =========================================
+# 🧊 COLUMNAR SNAPSHOTS (ARROW IPC NEXT TO THE CSV)
+# =========================================
+# The CSV (or SQLite table) stays the source of record. Whenever a
+# table is parsed, the typed frame (after its normalizer: real dates,
+# float quantities) is also written to data/_columnar/ as an Arrow IPC
+# file stamped with the table signature it came from. Any worker that
+# misses its in-memory cache memory-maps that file instead of parsing
+# text again. A changed table (any write) no longer matches the stamp,
+# so the next parse regenerates it and removes the table's snapshots of
+# older states. Needs pyarrow (requirements.txt); without it tables
+# are parsed from CSV as before.
+import hashlib
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+COLUMNAR_FOLDER = os.path.join(DATA_FOLDER, "_columnar")
+COLUMNAR_FORMAT_VERSION = 1
+
+
+class ColumnarSnapshots:
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.enabled = pa is not None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _key(self, path, normalize, read_kwargs):
+        code = normalize.__code__.co_code.hex() if normalize else ""
+        return json.dumps([
+            COLUMNAR_FORMAT_VERSION, pd.__version__,
+            os.path.relpath(path, DATA_FOLDER),
+            normalize.__name__ if normalize else None,
+            hashlib.sha1(code.encode()).hexdigest(),
+            sorted((k, repr(v)) for k, v in read_kwargs.items())
+        ])
+
+    @staticmethod
+    def _name(path):
+        return os.path.splitext(os.path.relpath(path, DATA_FOLDER))[0].replace(os.sep, "__")
+
+    def _file(self, path, key, sig):
+        """<table>.<variant>.<table state>.arrow"""
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        state = hashlib.sha1(json.dumps(list(sig)).encode()).hexdigest()[:12]
+        return os.path.join(self.folder, f"{self._name(path)}.{digest}.{state}.arrow")
+
+    def discard(self, path, keep=None):
+        """Remove the table's snapshots (all but the table state of `keep`)."""
+        if not os.path.isdir(self.folder):
+            return
+        prefix = self._name(path) + "."
+        state = keep.rsplit(".", 2)[-2] if keep else None
+        for f in os.listdir(self.folder):
+            if f.startswith(prefix) and f.endswith(".arrow") and f.rsplit(".", 2)[-2] != state:
+                try:
+                    os.remove(os.path.join(self.folder, f))
+                except OSError:
+                    pass    # being replaced by another worker / open on Windows
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def load(self, path, sig, normalize, read_kwargs):
+        """Frame for table state `sig`, or None if there is no matching snapshot."""
+        if not self.enabled or sig is None:
+            return None
+
+        key = self._key(path, normalize, read_kwargs)
+        target = self._file(path, key, sig)
+        if not os.path.exists(target):
+            return None
+
+        try:
+            with pa.memory_map(target, "r") as source:
+                reader = pa.ipc.open_file(source)
+                meta = reader.schema.metadata or {}
+                if (
+                    meta.get(b"snapshot_key") != key.encode()
+                    or meta.get(b"source_signature") != json.dumps(list(sig)).encode()
+                ):
+                    return None
+                df = reader.read_all().to_pandas()
+        except Exception as e:
+            print("🔴 Columnar snapshot unreadable:", target, str(e))
+            self._count("errors")
+            return None
+
+        self._count("hits")
+        return df
+
+    def save(self, path, sig, normalize, read_kwargs, df):
+        if not self.enabled or sig is None or not len(df.columns):
+            return
+
+        key = self._key(path, normalize, read_kwargs)
+
+        try:
+            table = pa.Table.from_pandas(df)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b"snapshot_key": key.encode(),
+                b"source_signature": json.dumps(list(sig)).encode()
+            })
+
+            def write(f):
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+
+            os.makedirs(self.folder, exist_ok=True)
+            target = self._file(path, key, sig)
+            atomic_write(target, write, mode="wb")
+            self.discard(path, keep=target)
+        except Exception as e:
+            # e.g. an object column mixing numbers and text: stay on CSV
+            print("🔴 Columnar snapshot skipped:", os.path.basename(path), str(e))
+            self._count("errors")
+            return
+
+        self._count("writes")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "writes": self.writes,
+                "errors": self.errors
+            }
+
+
+columnar = ColumnarSnapshots(COLUMNAR_FOLDER)
+
+if not columnar.enabled:
+    print("⚠ pyarrow not installed: columnar snapshots disabled, tables are parsed from CSV")
+
+# =========================================
+# ⚡ TABLE CACHE (PARSED CSV, KEYED ON FILE STAT)
+# =========================================
+# Every page used to re-parse the full CSV. Parsed frames are now kept
+# in memory while the file's (mtime, size, inode) is unchanged. Writes
+# made through save_table()/append_table() drop the entry immediately;
+# writes from other gunicorn workers are caught by the stat signature.
+from collections import OrderedDict
+
+TABLE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class TableCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (signature, df, nbytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, path, normalize, read_kwargs):
+        return (
+            os.path.abspath(path),
+            normalize.__name__ if normalize else None,
+            tuple(sorted(read_kwargs.items()))
+        )
+
+    def peek(self, path, normalize=None, **read_kwargs):
+        """A copy of the parsed table if it is cached and current, else None."""
+        key = self._key(path, normalize, read_kwargs)
+        sig = table_signature(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self.hits += 1
+                return entry[1].copy()
+        return None
+
+    def get(self, path, normalize=None, **read_kwargs):
+        key = self._key(path, normalize, read_kwargs)
+        sig = table_signature(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+            self.misses += 1
+
+        # ---------- PARSE OUTSIDE THE LOCK ----------
+        df = columnar.load(path, sig, normalize, read_kwargs)
+
+        if df is None:
+            if storage.blank(sig):
+                df = pd.DataFrame()
+            else:
+                df = storage.read(path, **read_kwargs)
+
+            if normalize is not None:
+                df = normalize(df)
+
+            if not storage.blank(sig):
+                columnar.save(path, sig, normalize, read_kwargs, df)
+
+        nbytes = int(df.memory_usage(deep=True).sum())
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (sig, df, nbytes)
+                self.bytes += nbytes
+
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+        return df.copy()
+
+    def invalidate(self, path):
+        target = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == target]:
+                self.bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+table_cache = TableCache(TABLE_CACHE_MAX_BYTES)
+
+
+def load_table(path, normalize=None, **read_kwargs):
+    """
+    Cached pd.read_csv(). Missing or empty files give an empty frame.
+    The caller always receives its own copy and may modify it freely.
+    """
+    return table_cache.get(path, normalize=normalize, **read_kwargs)
+
+
+def load_days(path, first, last, **read_kwargs):
+    """
+    Rows of one table dated first..last (as load_table would parse them).
+    A table already in the cache is sliced; otherwise SQLite answers with
+    an index range scan on Date, and CSV is parsed (and cached) whole.
+    """
+    days = day_range(first, last)
+
+    df = table_cache.peek(path, **read_kwargs)
+    if df is None and isinstance(storage, SqliteStorage):
+        return storage.read(path, days=days, **read_kwargs)
+    if df is None:
+        df = load_table(path, **read_kwargs)
+
+    return df[day_mask(df, days)].reset_index(drop=True)
+
+
+def invalidate_table(path):
+    table_cache.invalidate(path)
+
+
+def save_table(df, path, **to_csv_kwargs):
+    with file_lock(path):
+        storage.write(df, path, **to_csv_kwargs)
+        invalidate_table(path)
+
+
+def delete_rows(path, where):
+    """Delete the rows matching {column: value}; returns the removed rows."""
+    with file_lock(path):
+        removed = storage.delete_rows(path, where)
+        invalidate_table(path)
+    return removed
+
+
+def update_rows(path, where, updates):
+    """Set {column: value} on the rows matching where; returns them updated."""
+    with file_lock(path):
+        _, after = storage.update_rows(path, where, updates)
+        invalidate_table(path)
+    return after
+
+
+# Called as hook(path, old_sig, new_sig) after every append_table(),
+# so derived layers can extend themselves instead of rebuilding.
+TABLE_APPEND_HOOKS = []
+
+
+def append_table(df, path, **to_csv_kwargs):
+    with file_lock(path):
+        old_sig = table_signature(path)
+        storage.append(df, path, **to_csv_kwargs)
+        invalidate_table(path)
+
+        new_sig = table_signature(path)
+        for hook in TABLE_APPEND_HOOKS:
+            hook(path, old_sig, new_sig)
+
+
+# Called as hook(path, old_sig, new_sig, keep) after every filter_table(),
+# keep being the positional mask of the rows that stayed, so derived
+# layers can drop the removed rows instead of rebuilding.
+TABLE_FILTER_HOOKS = []
+
+
+def filter_table(df, keep, path, **to_csv_kwargs):
+    """
+    Write back only the rows of `df` (the table as just read, under
+    the caller's file_lock) where `keep` is True.
+    """
+    keep = pd.Series(keep).to_numpy(dtype=bool)
+
+    with file_lock(path):
+        old_sig = table_signature(path)
+        storage.write(df[keep], path, **to_csv_kwargs)
+        invalidate_table(path)
+
+        new_sig = table_signature(path)
+        for hook in TABLE_FILTER_HOOKS:
+            hook(path, old_sig, new_sig, keep)
+
+
+def keeps_inferred_dtypes(df, keep):
+    """
+    True when re-parsing df[keep] from text gives the same column types
+    as df. Removing the only text value of a column (or the only blank
+    or fractional value of a float column) would change them.
+    """
+    removed = df[~keep]
+    kept = df[keep]
+
+    for c in df.columns:
+        col = df[c]
+        if pd.api.types.is_float_dtype(col):
+            gone = removed[c]
+            if (gone.isna() | (gone % 1 != 0)).any():
+                left = kept[c]
+                if left.notna().all() and (left % 1 == 0).all():
+                    return False
+        elif not pd.api.types.is_numeric_dtype(col):
+            def is_text(s):
+                return s.notna() & pd.to_numeric(s, errors="coerce").isna()
+
+            if is_text(removed[c]).any() and not is_text(kept[c]).any():
+                return False
+
+    return True
+
+
+def read_csv_tail(path, old_sig, like):
+    """
+    Parse only the rows appended since `old_sig`, using the columns
+    and dtypes of `like` (the frame parsed before the append). Returns
+    None when the new rows would change a column's inferred type, in
+    which case the caller must fall back to a full re-read.
+    """
+    tail = storage.read_appended(path, old_sig)
+
+    if not tail.strip():
+        return like.iloc[0:0].copy()
+
+    text_cols = {
+        c: str for c in like.columns
+        if not pd.api.types.is_numeric_dtype(like[c])
+    }
+
+    new_rows = pd.read_csv(
+        io.BytesIO(tail),
+        header=None,
+        names=list(like.columns),
+        dtype=text_cols
+    )
+
+    for c in like.columns:
+        if c not in text_cols and not pd.api.types.is_numeric_dtype(new_rows[c]):
+            return None
+
+    return new_rows
+
+
+# ---------- TYPE NORMALIZERS (cached together with the parse) ----------
+PRODUCTION_NUMERIC_COLS = ["Time_Min", "Qty", "Cast_Rej", "Mach_Rej", "Good_Qty"]
+
+
+def normalize_production(df):
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    for col in PRODUCTION_NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    return df
+
+
+# Ledger edits/deletes are appended as records too (see append_ledger):
+# a VOID row cancels every earlier row with the same Timestamp.
+LEDGER_RECORD_COL = "Record"
+LEDGER_VOID = "VOID"
+
+
+def fold_ledger(df):
+    """Live ledger rows: VOID records and the rows they cancel removed."""
+    if LEDGER_RECORD_COL not in df.columns:
+        return df
+
+    void = (df[LEDGER_RECORD_COL] == LEDGER_VOID).to_numpy()
+    if void.any():
+        ts = df["Timestamp"].astype(str)
+        pos = pd.Series(range(len(df)), index=df.index)
+
+        last_void = pos[void].groupby(ts[void]).max()
+        cancelled = pos < ts.map(last_void)     # NaN (never voided) -> False
+
+        df = df[~void & ~cancelled.to_numpy()].reset_index(drop=True)
+
+    return df.drop(columns=[LEDGER_RECORD_COL])
+
+
+def normalize_ledger(df):
+    df = fold_ledger(df)
+    if "Item" not in df.columns:
+        return df
+    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
+    df["Value"] = pd.to_numeric(df["Value"], errors="coerce").fillna(0)
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df["Item"] = df["Item"].astype(str).str.strip()
+    return df
+
+# =========================================
+# 🗂 MONTHLY PARTITIONS (PRODUCTION + LOSS)
+# =========================================
+# production_main / production_other_machine / production_loss are
+# stored one file per calendar month of their Date column:
+#   data/production_main/2026-10.csv   (rows without a valid Date go
+#   data/production_main/undated.csv    to "undated")
+# The *_FILE constants stay the logical table names. Reports pass the
+# month numbers they filter on and only those partitions are read.
+# Old single-file tables are split on startup (flask partition-production).
+PARTITIONED_TABLES = [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE, PRODUCTION_LOSS_FILE]
+UNDATED_PARTITION = "undated"
+PARTITION_KEY = re.compile(r"\d{4}-\d{2}|" + UNDATED_PARTITION)
+_skipped_partition_names = set()
+
+
+def partition_names(folder, names):
+    """
+    The partition keys among the stored names of a partition folder,
+    sorted. Anything else (old.csv, a backup copy) is skipped and
+    logged once, so month filters never see it.
+    """
+    keys = []
+    for name in names:
+        if PARTITION_KEY.fullmatch(name):
+            keys.append(name)
+        elif (folder, name) not in _skipped_partition_names:
+            _skipped_partition_names.add((folder, name))
+            print(f"⚠ Skipping {name!r} in {folder}: not a YYYY-MM or {UNDATED_PARTITION} partition")
+    return sorted(keys)
+
+
+def partition_dir(path):
+    return os.path.splitext(path)[0]
+
+
+def partition_path(path, key):
+    return os.path.join(partition_dir(path), f"{key}.csv")
+
+
+def partition_keys(dates):
+    """'YYYY-MM' partition key for every value of a Date column."""
+    parsed = pd.to_datetime(pd.Series(dates), errors="coerce")
+    return parsed.dt.strftime("%Y-%m").fillna(UNDATED_PARTITION)
+
+
+def month_numbers(month_filter):
+    """Report month filter ("01".."12" / "all" / "") -> {month} or None (all)."""
+    month_filter = str(month_filter or "").strip()
+    if not month_filter or month_filter == "all":
+        return None
+    return {int(month_filter)}
+
+
+def list_partitions(path, months=None):
+    """Partition files of a table, oldest first, pruned to `months`."""
+    keys = storage.partitions(partition_dir(path))
+
+    if months is not None:
+        keys = [
+            k for k in keys
+            if k != UNDATED_PARTITION and int(k[5:7]) in months
+        ]
+
+    return [partition_path(path, k) for k in keys]
+
+
+def day_partitions(path, first, last):
+    """Partition files holding the days first..last."""
+    wanted = set(partition_keys(pd.date_range(first, last)))
+    return [
+        partition_path(path, k) for k in storage.partitions(partition_dir(path))
+        if k in wanted
+    ]
+
+
+def concat_partitions(frames):
+    """
+    pd.concat that types columns the way one big CSV would have: a
+    column that parsed as text in any partition is text everywhere
+    (numeric-looking values become strings, as read_csv gives them).
+    """
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+
+    filled = [f for f in frames if not f.empty] or frames[:1]
+
+    text_cols = {
+        c for f in filled for c in f.columns
+        if not pd.api.types.is_numeric_dtype(f[c])
+        and not pd.api.types.is_datetime64_any_dtype(f[c])
+    }
+
+    aligned = []
+    for f in filled:
+        fix = [
+            c for c in text_cols
+            if c in f.columns and pd.api.types.is_numeric_dtype(f[c])
+            and f[c].notna().any()
+        ]
+        if fix:
+            f = f.copy()
+            for c in fix:
+                f[c] = f[c].astype(object).where(f[c].isna(), f[c].map(str))
+        aligned.append(f)
+
+    return pd.concat(aligned, ignore_index=True)
+
+
+def load_partitioned(path, months=None, normalize=None, **read_kwargs):
+    """Cached rows of a partitioned table, only the partitions in `months`."""
+    paths = list_partitions(path, months)
+
+    if not paths and months is not None:
+        # no rows in these months: same columns, zero rows
+        latest = list_partitions(path)[-1:]
+        return concat_partitions([
+            load_table(p, normalize=normalize, **read_kwargs).iloc[0:0] for p in latest
+        ])
+
+    return concat_partitions([
+        load_table(p, normalize=normalize, **read_kwargs) for p in paths
+    ])
+
+
+def partitioned_is_blank(path):
+    return all(table_is_blank(p) for p in list_partitions(path))
+
+
+def partition_frames(df, path):
+    """[(partition file, rows)] for the month partitions df's Date falls in."""
+    keys = partition_keys(df["Date"]).to_numpy()
+    return [
+        (partition_path(path, key), df[keys == key]) for key in sorted(set(keys))
+    ]
+
+
+def append_partitioned(df, path, **to_csv_kwargs):
+    """Append rows to the month partition(s) their Date falls in."""
+    for target, rows in partition_frames(df, path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        append_table(rows, target, **to_csv_kwargs)
+
+
+def drop_partitions(path):
+    for p in list_partitions(path):
+        with file_lock(p):
+            storage.remove(p)
+            invalidate_table(p)
+            columnar.discard(p)
+
+
+def partition_table(path):
+    """
+    Split a single-file table into its month partitions (rows are
+    appended to partitions that already exist). The old file is kept
+    as <name>.csv.migrated. Returns the number of rows moved.
+    """
+    with file_lock(path):
+        if table_is_blank(path):
+            return 0
+
+        # read as text so every row is written back unchanged
+        df = storage.read(path, dtype=str, keep_default_na=False)
+        if "Date" in df.columns:
+            append_partitioned(df, path)
+
+        storage.remove(path)
+        invalidate_table(path)
+        columnar.discard(path)
+        if os.path.exists(path):
+            os.replace(path, path + ".migrated")
+
+        return len(df)
+
+
+def partition_legacy_tables():
+    for path in PARTITIONED_TABLES:
+        if not table_is_blank(path):
+            moved = partition_table(path)
+            print(f"🗂 {os.path.basename(path)}: {moved} rows split into monthly partitions")
+
+
+partition_legacy_tables()
+
+
+@app.cli.command("partition-production")
+def partition_production_command():
+    """Split production/loss CSVs into data/<table>/<YYYY-MM>.csv."""
+    for path in PARTITIONED_TABLES:
+        if table_is_blank(path):
+            print(f"⚪ {os.path.basename(path)}: nothing to split")
+            continue
+        moved = partition_table(path)
+        print(f"🟢 {os.path.basename(path)}: {moved} rows -> {partition_dir(path)}/")
+
+# =========================================
+# 🔑 KEY DICTIONARIES (OPERATOR / MACHINE / PART / OPERATION)
+# =========================================
+# In memory the production facts and rollups hold their key columns as
+# categoricals: one dictionary per dimension (the master's keys plus
+# every value production used, as stripped text, sorted) and a small
+# integer code per row. Filters, groupbys and the part-master join
+# compare codes instead of strings. Dictionaries only grow; frames
+# coded against an older version are re-coded by align(). Sorted
+# categories keep groupby / sort order the same as plain text.
+# Stored tables (CSV / SQLite / Arrow snapshots) stay text.
+KEY_DIMENSIONS = {
+    "Operator": (OPERATOR_MASTER_FILE, "Operator Name"),
+    "Machine": (MACHINE_MASTER_FILE, "Machine No"),
+    "Part": (PART_MASTER_FILE, "Part Number"),
+    "Operation": (PART_MASTER_FILE, "Operation No")
+}
+
+# production column -> dimension
+KEY_COLUMNS = {dim: dim for dim in KEY_DIMENSIONS}
+
+
+def whole_number_text(value):
+    """10.0 -> "10"; anything else unchanged."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return value
+
+
+def key_text(s):
+    """
+    Key values as stripped text (1234 -> "1234"); missing stays missing.
+    One blank cell parses a whole-number key column as float, so whole
+    floats are written as integers (10.0 -> "10") to match the master.
+    """
+    if pd.api.types.is_float_dtype(s) or s.dtype == object:
+        s = s.map(whole_number_text, na_action="ignore")
+    return s.astype(str).str.strip().where(s.notna())
+
+
+class KeyDictionaries:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dtypes = {
+            dim: pd.CategoricalDtype(pd.Index([], dtype=str))
+            for dim in KEY_DIMENSIONS
+        }
+        self._master_sigs = {}      # dimension -> master signature merged in
+        self.version = 0
+        self.grows = 0
+        self.encodes = 0
+        self.realigns = 0
+
+    def _add(self, dim, values):
+        known = self._dtypes[dim].categories
+        new = pd.Index(values.dropna().unique()).difference(known)
+        if len(new):
+            self._dtypes[dim] = pd.CategoricalDtype(known.append(new).sort_values())
+            self.version += 1
+            self.grows += 1
+
+    def _sync_masters(self):
+        for dim, (path, col) in KEY_DIMENSIONS.items():
+            sig = table_signature(path)
+            if self._master_sigs.get(dim, False) != sig:
+                master = load_table(path)
+                if col in master.columns:
+                    self._add(dim, key_text(master[col]))
+                self._master_sigs[dim] = sig
+
+    def encode(self, df, columns=KEY_COLUMNS):
+        """
+        Replace the key columns of df (column -> dimension) by categoricals
+        over the current dictionaries, adding unseen values first.
+        """
+        with self._lock:
+            self._sync_masters()
+
+            texts = {}
+            for col, dim in columns.items():
+                if col in df.columns:
+                    texts[col] = key_text(df[col])
+                    self._add(dim, texts[col])
+
+            for col, text in texts.items():
+                df[col] = text.astype(self._dtypes[columns[col]])
+            self.encodes += 1
+
+        return df
+
+    def align(self, df, columns=KEY_COLUMNS):
+        """df with its key columns re-coded to the current dictionaries."""
+        with self._lock:
+            stale = {
+                col: self._dtypes[dim] for col, dim in columns.items()
+                if col in df.columns
+                and isinstance(df[col].dtype, pd.CategoricalDtype)
+                and df[col].dtype != self._dtypes[dim]
+            }
+            if not stale:
+                return df
+
+            self.realigns += 1
+            return df.assign(**{
+                col: df[col].astype(dtype) for col, dtype in stale.items()
+            })
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "sizes": {
+                    dim: len(dtype.categories) for dim, dtype in self._dtypes.items()
+                },
+                "grows": self.grows,
+                "encodes": self.encodes,
+                "realigns": self.realigns
+            }
+
+
+key_dictionaries = KeyDictionaries()
+
+
+@app.cli.command("verify-key-text")
+def verify_key_text_command():
+    """Blank one key cell per production partition; the other rows' keys must not change."""
+    failed = 0
+    for source, path in PRODUCTION_SOURCES:
+        parts = [p for p in list_partitions(path) if not table_is_blank(p)]
+        if not parts:
+            print(f"⚪ {source}: no rows")
+            continue
+
+        text = storage.read(parts[-1], **TEXT_READ)
+        if text.empty:
+            print(f"⚪ {source}: no rows")
+            continue
+
+        cols = [c for c in KEY_COLUMNS if c in text.columns]
+        blanked = text.copy()
+        blanked.loc[0, cols] = ""
+
+        # typed the way load_table parses the partition CSV
+        before, after = (
+            pd.read_csv(io.StringIO(f.to_csv(index=False)))
+            for f in (text, blanked)
+        )
+        changed = []
+        for c in cols:
+            old, new = key_text(before[c]), key_text(after[c])
+            if pd.notna(new.iloc[0]) or not old.iloc[1:].equals(new.iloc[1:]):
+                changed.append(c)
+        name = os.path.basename(parts[-1])
+        if changed:
+            failed += 1
+            print(f"❌ {source} {name}: keys changed in {', '.join(changed)}")
+        else:
+            print(f"✅ {source} {name}: {', '.join(cols)} keys unchanged by a blank row")
+
+    if failed:
+        raise SystemExit(1)
+
+# =========================================
+# 🏭 PRODUCTION FACTS (SHARED BY ALL PRODUCTION REPORTS)
+# =========================================
+# production_main + production_other_machine, typed, tagged with
+# _source and joined once to part_master (cycle time + Expected_Qty).
+# Built per month partition, once per data change; appends from
+# Production Entry extend the partition's facts instead of rebuilding,
+# deletes from the Daily Report drop the removed rows.
+#
+# Each partition also keeps a DAILY ROLLUP: the facts summed per
+#   Date x Machine x Operator x Part x Operation x Shift x _source x _valid
+# (_valid: Time_Min > 0 and a cycle time > 0, the rows OEE / operator
+# reports count). The KPI pages group these few rows instead of the
+# raw entries; appends add to it, deletes subtract from it.
+#
+# Operator / Machine / Part / Operation are dictionary-coded in both
+# (see KEY DICTIONARIES): compare them with plain strings, no
+# astype(str) / strip needed.
+PART_MASTER_COLS = [
+    "Part Number", "Operation No", "Cycle Time (min)",
+    "Machine Type", "Target Per Hour"
+]
+
+PRODUCTION_SOURCES = [
+    ("main", PRODUCTION_MAIN_FILE),
+    ("other", PRODUCTION_OTHER_FILE)
+]
+
+# part-master join keys -> dimension
+PART_KEY_COLUMNS = {"_part_key": "Part", "_op_key": "Operation"}
+
+ROLLUP_DIMS = [
+    "Date", "Machine", "Operator", "Part", "Operation", "Shift",
+    "_source", "_valid"
+]
+ROLLUP_SUMS = [
+    "Time_Min", "Qty", "Good_Qty", "Mach_Rej", "Cast_Rej", "Expected_Qty",
+    "OT_Yes", "Rows"
+]
+
+
+def build_rollup(facts):
+    """
+    Sum production facts per ROLLUP_DIMS tuple. Tuples keep the order
+    their first row had, so value order within a day matches the facts.
+    OT_Yes counts rows with OT "yes", Rows counts all rows.
+    """
+    cube = pd.DataFrame(index=facts.index)
+
+    for col in ROLLUP_DIMS[:-1]:
+        cube[col] = facts[col] if col in facts.columns else None
+
+    for col in ROLLUP_SUMS[:-2]:
+        cube[col] = facts[col] if col in facts.columns else 0
+
+    cycle = facts.get("Cycle Time (min)", pd.Series(0, index=facts.index))
+    cube["_valid"] = (cube["Time_Min"] > 0) & (cycle > 0)
+
+    ot = facts.get("OT", pd.Series(None, index=facts.index, dtype=object))
+    cube["OT_Yes"] = (ot.astype(str).str.lower() == "yes").astype(int)
+    cube["Rows"] = 1
+
+    return (
+        cube.groupby(
+            ROLLUP_DIMS, dropna=False, sort=False, observed=True, as_index=False
+        )[ROLLUP_SUMS].sum()
+    )
+
+
+def merge_rollups(cubes):
+    """Add rollups together (negated ones subtract); empty tuples drop out."""
+    cube = concat_partitions(cubes)
+    if cube.empty:
+        return cube
+
+    cube = (
+        cube.groupby(
+            ROLLUP_DIMS, dropna=False, sort=False, observed=True, as_index=False
+        )[ROLLUP_SUMS].sum()
+    )
+    return cube[cube["Rows"] != 0].reset_index(drop=True)
+
+
+class ProductionFacts:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}          # (source, partition) -> (signature, raw_df, facts_df, rollup_df)
+        self._parts_sig = False
+        self._parts = None
+        self._combined = {}         # (FACTS / ROLLUP, months key) -> df
+        self._distinct = {}         # (source, partition, column) -> values
+        self._joined_cols = []
+        self._keys_version = None
+        self.rebuilds = 0
+        self.extends = 0
+        self.shrinks = 0
+
+    # ---------- PART MASTER LOOKUP ----------
+    def _load_parts(self):
+        parts = load_table(PART_MASTER_FILE)
+        for col in PART_MASTER_COLS:
+            if col not in parts.columns:
+                parts[col] = pd.NA
+
+        parts["_part_key"] = parts["Part Number"]
+        parts["_op_key"] = parts["Operation No"]
+        key_dictionaries.encode(parts, PART_KEY_COLUMNS)
+
+        # one cycle time per (part, operation) so the join never duplicates rows
+        return parts.drop_duplicates(["_part_key", "_op_key"])
+
+    def _build(self, raw, source):
+        df = key_dictionaries.encode(normalize_production(raw.copy()))
+        if df.empty:
+            return df
+
+        df["_source"] = source
+
+        # both sides coded over the same dictionaries: the join compares codes
+        self._parts = key_dictionaries.align(self._parts, PART_KEY_COLUMNS)
+        df = df.merge(
+            self._parts,
+            left_on=["Part", "Operation"], right_on=["_part_key", "_op_key"],
+            how="left"
+        )
+        df = df.drop(columns=["_part_key", "_op_key"])
+
+        df["Cycle Time (min)"] = pd.to_numeric(
+            df["Cycle Time (min)"], errors="coerce"
+        ).fillna(0)
+
+        cycle = df["Cycle Time (min)"]
+        df["Expected_Qty"] = (df["Time_Min"] / cycle.where(cycle > 0)).fillna(0)
+
+        return df
+
+    def _changed(self):
+        self._combined.clear()
+        self._distinct.clear()
+
+    def _refresh_parts(self):
+        parts_sig = table_signature(PART_MASTER_FILE)
+        if parts_sig != self._parts_sig:
+            self._parts = self._load_parts()
+            self._parts_sig = parts_sig
+            self._sources.clear()
+            self._changed()
+            self._joined_cols = [
+                c for c in self._parts.columns
+                if c not in ("_part_key", "_op_key")
+            ] + ["Expected_Qty"]
+
+    def _refresh(self, months):
+        self._refresh_parts()
+
+        wanted = []
+        existing = []
+        for source, path in PRODUCTION_SOURCES:
+            existing += [(source, p) for p in list_partitions(path)]
+            wanted += [(source, p) for p in list_partitions(path, months)]
+
+        for key in [k for k in self._sources if k not in existing]:
+            del self._sources[key]       # partition removed (reset, restore)
+            self._changed()
+
+        for key in wanted:
+            self._ensure(key)
+
+        if key_dictionaries.version != self._keys_version:
+            self._realign()
+
+        return wanted, existing
+
+    def _realign(self):
+        """Re-code every partition after a key dictionary grew."""
+        self._keys_version = key_dictionaries.version
+        for key, (sig, raw, facts, cube) in list(self._sources.items()):
+            self._sources[key] = (
+                sig, raw, key_dictionaries.align(facts), key_dictionaries.align(cube)
+            )
+        self._changed()
+
+    def _ensure(self, key):
+        source, part_path = key
+        sig = table_signature(part_path)
+        entry = self._sources.get(key)
+
+        if entry is None or entry[0] != sig:
+            raw = load_table(part_path)
+            facts = self._build(raw, source)
+            self._sources[key] = (sig, raw, facts, build_rollup(facts))
+            self._changed()
+            self.rebuilds += 1
+
+    FACTS = 2
+    ROLLUP = 3
+
+    def _collect(self, kind, months):
+        wanted, existing = self._refresh(months)
+
+        cache_key = (kind, None if months is None else frozenset(months))
+        df = self._combined.get(cache_key)
+        if df is None:
+            if wanted or not existing:
+                df = concat_partitions([self._sources[k][kind] for k in wanted])
+            else:
+                # no rows in these months: same columns, zero rows
+                self._ensure(existing[-1])
+                df = self._sources[existing[-1]][kind].iloc[0:0]
+            self._combined[cache_key] = df
+
+        return df
+
+    def _collect_days(self, first, last):
+        """
+        Facts dated first..last. Partitions already built are sliced;
+        the others are read for those days only (load_days) and built
+        without being kept, so a one-day report does not load its month.
+        """
+        self._refresh_parts()
+
+        start = pd.Timestamp(first)
+        end = pd.Timestamp(last) + pd.Timedelta(days=1)
+
+        found = []      # in partition order: a cached key or a built frame
+        for source, path in PRODUCTION_SOURCES:
+            for p in day_partitions(path, first, last):
+                key = (source, p)
+                entry = self._sources.get(key)
+                if entry is not None and entry[0] == table_signature(p):
+                    found.append(key)
+                else:
+                    raw = load_days(p, first, last)
+                    if not raw.empty:
+                        found.append(self._build(raw, source))
+
+        if key_dictionaries.version != self._keys_version:
+            self._realign()
+
+        frames = []
+        for item in found:
+            if isinstance(item, tuple):
+                facts = self._sources[item][self.FACTS]
+                if not facts.empty:
+                    frames.append(facts[(facts["Date"] >= start) & (facts["Date"] < end)])
+            else:
+                frames.append(key_dictionaries.align(item))
+
+        df = concat_partitions(frames)
+        if df.empty:
+            # no rows on those days: same columns, zero rows
+            df = self._collect(self.FACTS, {start.month}).iloc[0:0]
+        return df
+
+    def get(self, joined=True, source=True, months=None, days=None):
+        with self._lock:
+            if days is not None:
+                df = self._collect_days(*days)
+            else:
+                df = self._collect(self.FACTS, months)
+
+            drop = [] if joined else list(self._joined_cols)
+            if not source:
+                drop.append("_source")
+
+            return df.drop(columns=[c for c in drop if c in df.columns])
+
+    def rollup(self, months=None):
+        with self._lock:
+            return self._collect(self.ROLLUP, months).copy()
+
+    def values(self, column):
+        """Distinct non-null values of a column over all partitions."""
+        with self._lock:
+            wanted, _ = self._refresh(None)
+
+            parts = []
+            for key in wanted:
+                dkey = key + (column,)
+                if dkey not in self._distinct:
+                    facts = self._sources[key][2]
+                    self._distinct[dkey] = (
+                        facts[column].dropna().drop_duplicates()
+                        if column in facts.columns else pd.Series(dtype=object)
+                    )
+                parts.append(self._distinct[dkey].to_frame(column))
+
+            merged = concat_partitions(parts)
+            if merged.empty:
+                return pd.Series(dtype=object, name=column)
+            return merged[column].drop_duplicates().reset_index(drop=True)
+
+    # ---------- INCREMENTAL APPEND / DELETE ----------
+    def _key(self, path):
+        source = next(
+            (s for s, p in PRODUCTION_SOURCES
+             if os.path.dirname(path) == partition_dir(p)),
+            None
+        )
+        return None if source is None else (source, path)
+
+    def on_append(self, path, old_sig, new_sig):
+        key = self._key(path)
+        if key is None:
+            return
+        source = key[0]
+
+        with self._lock:
+            entry = self._sources.get(key)
+
+            if (
+                entry is None or old_sig is None or entry[0] != old_sig
+                or entry[1].empty
+                or table_signature(PART_MASTER_FILE) != self._parts_sig
+            ):
+                return   # next get() does a full rebuild
+
+            _, raw, facts, cube = entry
+
+            new_raw = read_csv_tail(path, old_sig, raw)
+            if new_raw is None:
+                self._sources.pop(key, None)
+                self._changed()
+                return
+
+            new_facts = self._build(new_raw, source)
+            facts = key_dictionaries.align(facts)
+            cube = key_dictionaries.align(cube)
+            raw = pd.concat([raw, new_raw], ignore_index=True)
+            facts = pd.concat([facts, new_facts], ignore_index=True)
+            cube = merge_rollups([cube, build_rollup(new_facts)])
+
+            self._sources[key] = (new_sig, raw, facts, cube)
+            self._changed()
+            self.extends += 1
+
+    def on_filter(self, path, old_sig, new_sig, keep):
+        key = self._key(path)
+        if key is None:
+            return
+
+        with self._lock:
+            entry = self._sources.get(key)
+
+            if (
+                entry is None or old_sig is None or entry[0] != old_sig
+                or len(entry[1]) != len(keep) or len(entry[2]) != len(keep)
+                or not keep.any()
+                or table_signature(PART_MASTER_FILE) != self._parts_sig
+                or not keeps_inferred_dtypes(entry[1], keep)
+            ):
+                return   # next get() does a full rebuild
+
+            _, raw, facts, cube = entry
+
+            removed = build_rollup(facts[~keep])
+            removed[ROLLUP_SUMS] = -removed[ROLLUP_SUMS]
+
+            self._sources[key] = (
+                new_sig,
+                raw[keep].reset_index(drop=True),
+                facts[keep].reset_index(drop=True),
+                merge_rollups([cube, removed])
+            )
+            self._changed()
+            self.shrinks += 1
+
+
+production_facts = ProductionFacts()
+TABLE_APPEND_HOOKS.append(production_facts.on_append)
+TABLE_FILTER_HOOKS.append(production_facts.on_filter)
+
+
+def get_production_facts(joined=True, source=True, months=None, days=None):
+    """
+    Normalized production rows (main + other machine).
+    joined=False drops the part-master columns and Expected_Qty,
+    source=False drops the _source tag, months={10} reads only the
+    October partitions (of every year), days=(first, last) only the
+    rows dated first..last (instead of months).
+    """
+    return production_facts.get(
+        joined=joined, source=source, months=months, days=days
+    )
+
+
+def get_production_rollup(months=None):
+    """
+    Daily rollup of the production facts (see build_rollup): one row
+    per ROLLUP_DIMS tuple with the ROLLUP_SUMS totals. Any sum the raw
+    facts give per a subset of those columns, it gives too.
+    """
+    return production_facts.rollup(months=months)
+
+
+def production_values(column):
+    """Distinct values of a production column over all months (dropdowns)."""
+    return production_facts.values(column)
+
+
+def production_data_signature(tables=PARTITIONED_TABLES):
+    """Signatures of every partition of `tables` plus the part master."""
+    return tuple(
+        (p, table_signature(p))
+        for path in tables
+        for p in list_partitions(path)
+    ) + (table_signature(PART_MASTER_FILE),)
+
+
+def table_signatures(*tables):
+    """[(file, signature)] of `tables`, every partition of partitioned ones."""
+    sigs = []
+    for path in tables:
+        if path in PARTITIONED_TABLES:
+            sigs += [(p, table_signature(p)) for p in list_partitions(path)]
+        else:
+            sigs.append((path, table_signature(path)))
+    return sigs
+
+
+def data_version(*tables):
+    """Short hash of the current signatures of `tables` (partitioned or not)."""
+    return hashlib.sha1(repr(table_signatures(*tables)).encode()).hexdigest()[:16]
+
+
+def production_date_range():
+    dates = production_values("Date")
+    if dates.empty:
+        return None, None
+    return dates.min(), dates.max()
+
+# =========================================
+# 📦 STOCK ENGINE (RUNNING BALANCES PER ITEM)
+# =========================================
+# Qty per Item x Inward_Type, the derived RM/WIP/FG/Reject position and
+# the last movement date. Built from the ledger in one groupby, then kept
+# up to date by the ledger write helpers (append_ledger, delete_ledger_rows,
+# update_ledger_rows, compact_ledger) with the rows each write added/removed, and
+# persisted to store_balances.csv together with the ledger signature it
+# reflects. A ledger change that did not go through them (restore,
+# manual edit, other worker) no longer matches and triggers a rebuild.
+#   flask --app app rebuild-balances [--verify]
+STORE_LEDGER_FILE = os.path.join(DATA_FOLDER, "store_ledger.csv")
+STORE_BALANCE_FILE = os.path.join(DATA_FOLDER, "store_balances.csv")
+STORE_BALANCE_META_FILE = os.path.join(DATA_FOLDER, "store_balances.json")
+
+STOCK_TXN_TYPES = [
+    "OPENING", "INWARD", "ISSUE", "RETURN",
+    "RETURN_RM", "RETURN_FG", "RETURN_REJECT",
+    "OUTWARD_RM", "OUTWARD_FG", "OUTWARD_REJECT", "OUTWARD_WIP",
+    "ADJ_RM", "ADJ_WIP", "ADJ_FG", "ADJ_REJECT"
+]
+
+STOCK_BUCKETS = ["RM", "WIP", "FG", "Reject"]
+
+
+def add_stock_buckets(totals):
+    """Live-inventory formulas on the per-type totals (clamped at 0)."""
+    q = totals
+
+    totals["RM"] = (
+        q["INWARD"] - q["ISSUE"] + q["RETURN_RM"] - q["OUTWARD_RM"]
+        + q["ADJ_RM"] + q["OPENING"]
+    ).clip(lower=0)
+    totals["WIP"] = (
+        q["ISSUE"] - q["RETURN_FG"] - q["RETURN_REJECT"] - q["OUTWARD_WIP"]
+        + q["ADJ_WIP"]
+    ).clip(lower=0)
+    totals["FG"] = (q["RETURN_FG"] - q["OUTWARD_FG"] + q["ADJ_FG"]).clip(lower=0)
+    totals["Reject"] = (
+        q["RETURN_REJECT"] - q["OUTWARD_REJECT"] + q["ADJ_REJECT"]
+    ).clip(lower=0)
+
+    return totals
+
+
+def empty_stock_totals():
+    totals = pd.DataFrame(
+        0.0, index=pd.Index([], name="Item", dtype=str),
+        columns=STOCK_TXN_TYPES + STOCK_BUCKETS
+    )
+    totals["Last_Date"] = pd.Series(dtype="datetime64[us]")
+    return totals
+
+
+def build_stock_totals(ledger_df):
+    """
+    Item-indexed frame: one Qty column per STOCK_TXN_TYPES, the
+    RM/WIP/FG/Reject position and Last_Date.
+    Expects a ledger normalized by normalize_ledger().
+    """
+    if ledger_df.empty or "Item" not in ledger_df.columns:
+        return empty_stock_totals()
+
+    totals = (
+        ledger_df.groupby(["Item", "Inward_Type"])["Qty"]
+        .sum()
+        .unstack(fill_value=0)
+        .reindex(columns=STOCK_TXN_TYPES, fill_value=0)
+    )
+    totals.columns.name = None
+
+    last_date = ledger_df.groupby("Item")["Date"].max()
+    totals = totals.reindex(totals.index.union(last_date.index), fill_value=0)
+    totals = add_stock_buckets(totals)
+    totals["Last_Date"] = last_date
+
+    return totals
+
+
+class StockEngine:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sig = False
+        self._totals = None
+        self.builds = 0
+        self.deltas = 0
+
+    # ---------- PERSISTED SNAPSHOT ----------
+    def _read_snapshot(self, sig):
+        import json
+
+        try:
+            with open(STORE_BALANCE_META_FILE) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if sig is None or meta.get("ledger_signature") != list(sig):
+            return None
+
+        try:
+            totals = pd.read_csv(STORE_BALANCE_FILE, dtype={"Item": str})
+        except Exception:
+            return None
+
+        totals["Last_Date"] = pd.to_datetime(totals["Last_Date"], errors="coerce")
+        return totals.set_index("Item")
+
+    def _write_snapshot(self, totals, sig):
+        import json
+
+        if sig is None:
+            return
+
+        snapshot = totals.rename_axis("Item").reset_index()
+        atomic_write(STORE_BALANCE_FILE, lambda f: snapshot.to_csv(f, index=False))
+        atomic_write(STORE_BALANCE_META_FILE, lambda f: json.dump(
+            {"ledger_signature": list(sig), "items": len(totals)}, f
+        ))
+
+    def _at(self, sig):
+        """Totals for ledger state `sig` from memory or disk, else None."""
+        if self._totals is not None and self._sig == sig:
+            return self._totals
+
+        totals = self._read_snapshot(sig)
+        if totals is not None:
+            self._totals, self._sig = totals, sig
+
+        return totals
+
+    # ---------- READ ----------
+    def rebuild(self):
+        with self._lock:
+            sig = table_signature(STORE_LEDGER_FILE)
+            totals = build_stock_totals(
+                load_ledger(normalize=normalize_ledger)
+            )
+            self._write_snapshot(totals, sig)
+            self._totals, self._sig = totals, sig
+            self.builds += 1
+            return totals
+
+    def totals(self):
+        with self._lock:
+            totals = self._at(table_signature(STORE_LEDGER_FILE))
+        if totals is not None:
+            return totals
+        return self.rebuild()
+
+    def item_totals(self, item_code):
+        """Per-type Qty + RM/WIP/FG/Reject for one item (zeros if it never moved)."""
+        totals = self.totals()
+        code = str(item_code).strip()
+
+        if code in totals.index:
+            return totals.loc[code]
+
+        return pd.Series(0, index=STOCK_TXN_TYPES + STOCK_BUCKETS)
+
+    def rebase(self, old_sig, new_sig):
+        """The ledger was rewritten without changing its live rows."""
+        with self._lock:
+            totals = self._at(old_sig)
+            if totals is None:
+                self._totals, self._sig = None, False
+                return
+
+            self._write_snapshot(totals, new_sig)
+            self._totals, self._sig = totals, new_sig
+
+    # ---------- INCREMENTAL UPDATE ----------
+    def apply(self, old_sig, new_sig, added=None, removed=None):
+        """
+        Fold the rows a ledger write added/removed into the balances.
+        Only the touched items are recomputed; if the balances were not
+        at old_sig the next read rebuilds instead.
+        """
+        with self._lock:
+            totals = self._at(old_sig)
+
+            if totals is None or (added is None and removed is None):
+                self._totals, self._sig = None, False
+                return
+
+            parts = []
+            for frame, sign in ((added, 1), (removed, -1)):
+                if frame is not None and not frame.empty:
+                    frame = normalize_ledger(frame.copy())
+                    parts.append(frame.assign(Qty=frame["Qty"] * sign))
+
+            num_cols = STOCK_TXN_TYPES + STOCK_BUCKETS
+            was_int = pd.api.types.is_integer_dtype(totals["INWARD"])
+            totals = totals.astype({c: float for c in num_cols})
+
+            if parts:
+                delta = pd.concat(parts, ignore_index=True)
+                delta = delta[delta["Inward_Type"].isin(STOCK_TXN_TYPES)]
+
+                touched = delta["Item"].dropna().unique().tolist()
+                new_items = [i for i in touched if i not in totals.index]
+                if new_items:
+                    totals = pd.concat([totals, empty_stock_totals().reindex(new_items)])
+                    totals.index.name = "Item"
+                    totals.loc[new_items, num_cols] = 0.0
+
+                by_type = (
+                    delta.groupby(["Item", "Inward_Type"])["Qty"].sum()
+                    .unstack(fill_value=0)
+                    .reindex(columns=STOCK_TXN_TYPES, fill_value=0)
+                )
+                totals.loc[by_type.index, STOCK_TXN_TYPES] += by_type.values
+                totals.loc[by_type.index] = add_stock_buckets(
+                    totals.loc[by_type.index].copy()
+                )
+
+                # last movement: a newer date only moves it forward; removing
+                # the row that carried it needs that item's remaining rows
+                ledger_items = None
+                for frame, sign in ((added, 1), (removed, -1)):
+                    if frame is None or frame.empty:
+                        continue
+                    frame = normalize_ledger(frame.copy())
+                    for item, d in frame.groupby("Item")["Date"].max().items():
+                        if item not in totals.index:
+                            continue
+                        last = totals.at[item, "Last_Date"]
+                        if sign > 0:
+                            if pd.isna(last) or d > last:
+                                totals.at[item, "Last_Date"] = d
+                        elif pd.isna(last) or pd.isna(d) or d >= last:
+                            if ledger_items is None:
+                                ledger_items = load_ledger(normalize=normalize_ledger)
+                            totals.at[item, "Last_Date"] = ledger_items.loc[
+                                ledger_items["Item"] == item, "Date"
+                            ].max()
+
+            # an all-integer ledger stays int until a fractional Qty arrives
+            if was_int and (
+                added is None or added.empty
+                or pd.api.types.is_integer_dtype(added["Qty"])
+            ):
+                totals = totals.astype({c: "int64" for c in num_cols})
+
+            self._write_snapshot(totals, new_sig)
+            self._totals, self._sig = totals, new_sig
+            self.deltas += 1
+
+
+stock_engine = StockEngine()
+
+
+LEDGER_COMPACT_MIN_VOIDS = 50     # background compaction threshold
+
+
+def load_ledger(normalize=None):
+    """Live ledger rows (VOID records folded away), cached."""
+    return load_table(STORE_LEDGER_FILE, normalize=normalize or fold_ledger)
+
+
+def append_ledger(rows):
+    """Append new ledger rows (a DataFrame) and fold them into the balances."""
+    with file_lock(STORE_LEDGER_FILE):
+        old_sig = table_signature(STORE_LEDGER_FILE)
+        storage.append(rows, STORE_LEDGER_FILE)
+        invalidate_table(STORE_LEDGER_FILE)
+        stock_engine.apply(old_sig, table_signature(STORE_LEDGER_FILE), added=rows)
+
+
+def delete_ledger_rows(timestamp):
+    """
+    Delete the ledger rows carrying `timestamp` by appending one VOID
+    record (the file is never rewritten). Returns the removed rows.
+    """
+    with file_lock(STORE_LEDGER_FILE):
+        ledger = load_ledger()
+        removed = ledger[ledger["Timestamp"].astype(str) == str(timestamp)]
+        if removed.empty:
+            return removed
+
+        old_sig = table_signature(STORE_LEDGER_FILE)
+        storage.append(
+            removed.tail(1).assign(**{LEDGER_RECORD_COL: LEDGER_VOID}),
+            STORE_LEDGER_FILE
+        )
+        invalidate_table(STORE_LEDGER_FILE)
+        stock_engine.apply(old_sig, table_signature(STORE_LEDGER_FILE), removed=removed)
+        return removed
+
+
+def update_ledger_rows(timestamp, updates):
+    """
+    Set {column: value} on the ledger rows carrying `timestamp`: a VOID
+    record followed by the corrected rows, appended in one write.
+    Returns the corrected rows.
+    """
+    with file_lock(STORE_LEDGER_FILE):
+        ledger = load_ledger()
+        before = ledger[ledger["Timestamp"].astype(str) == str(timestamp)]
+        if before.empty:
+            return before
+
+        after = before.copy()
+        for col, value in updates.items():
+            try:
+                after.loc[:, col] = value
+            except (TypeError, ValueError):
+                after[col] = value
+
+        old_sig = table_signature(STORE_LEDGER_FILE)
+        storage.append(
+            pd.concat([
+                before.tail(1).assign(**{LEDGER_RECORD_COL: LEDGER_VOID}),
+                after
+            ], ignore_index=True),
+            STORE_LEDGER_FILE
+        )
+        invalidate_table(STORE_LEDGER_FILE)
+        stock_engine.apply(
+            old_sig, table_signature(STORE_LEDGER_FILE), added=after, removed=before
+        )
+        return after
+
+
+def compact_ledger(min_voids=LEDGER_COMPACT_MIN_VOIDS):
+    """
+    Rewrite the ledger with its VOID records folded away once at least
+    `min_voids` have piled up. Runs from the backup worker, off the
+    request path. Returns the number of VOID records removed.
+    """
+    with file_lock(STORE_LEDGER_FILE):
+        old_sig = table_signature(STORE_LEDGER_FILE)
+        if storage.blank(old_sig):
+            return 0
+
+        # read as text so every surviving row is written back unchanged
+        raw = storage.read(STORE_LEDGER_FILE, dtype=str, keep_default_na=False)
+        if LEDGER_RECORD_COL not in raw.columns:
+            return 0
+
+        voids = int((raw[LEDGER_RECORD_COL] == LEDGER_VOID).sum())
+        if voids < max(min_voids, 1):
+            return 0
+
+        storage.write(fold_ledger(raw), STORE_LEDGER_FILE)
+        invalidate_table(STORE_LEDGER_FILE)
+        stock_engine.rebase(old_sig, table_signature(STORE_LEDGER_FILE))
+
+    print(f"🧹 Ledger compacted ({voids} void records folded)")
+    return voids
+
+
+BACKUP_PRE_HOOKS.append(compact_ledger)
+
+
+@app.cli.command("compact-ledger")
+def compact_ledger_command():
+    """Fold VOID records out of store_ledger.csv now."""
+    voids = compact_ledger(min_voids=1)
+    print(f"✅ Ledger compacted ({voids} void records folded)")
+
+
+@app.cli.command("rebuild-balances")
+@click.option("--verify", is_flag=True,
+              help="Compare the persisted balances with a fresh rebuild.")
+def rebuild_balances_command(verify):
+    """Rebuild store_balances.csv from store_ledger.csv."""
+    if verify:
+        saved = stock_engine.totals()
+        fresh = build_stock_totals(
+            load_ledger(normalize=normalize_ledger)
+        )
+
+        cols = STOCK_TXN_TYPES + STOCK_BUCKETS
+        items = saved.index.union(fresh.index)
+        a = saved.reindex(items)[cols].fillna(0)
+        b = fresh.reindex(items)[cols].fillna(0)
+
+        bad = ((a - b).abs() > 1e-6).any(axis=1)
+        bad |= (
+            saved.reindex(items)["Last_Date"].fillna(pd.Timestamp(0))
+            != fresh.reindex(items)["Last_Date"].fillna(pd.Timestamp(0))
+        )
+
+        if bad.any():
+            print(f"❌ Balances differ from ledger for {int(bad.sum())} item(s):")
+            for item in items[bad.values]:
+                print(f"   {item}")
+            stock_engine.rebuild()
+            print("🔁 Balances rebuilt from ledger")
+            raise SystemExit(1)
+
+        print(f"✅ Balances match ledger ({len(items)} items)")
+        return
+
+    totals = stock_engine.rebuild()
+    print(f"✅ Balances rebuilt from ledger ({len(totals)} items)")
+
+
+def stock_positions(items_df, totals=None):
+    """
+    RM / WIP / FG / Reject stock and value for every item in items_df
+    (same formulas as the live inventory), one row per item master row.
+    """
+    if totals is None:
+        totals = stock_engine.totals()
+
+    def num_col(name, default):
+        if name not in items_df.columns:
+            return pd.Series(default, index=items_df.index, dtype=float)
+        return pd.to_numeric(items_df[name], errors="coerce").astype(float)
+
+    df = pd.DataFrame(index=items_df.index)
+    df["Item Code"] = items_df["Item Code"].map(str).str.strip()
+    df["Category"] = (
+        items_df["Category"].map(str) if "Category" in items_df.columns else ""
+    )
+
+    rm_rate = num_col("RM Rate", 0)
+    fg_rate = num_col("FG Rate", 0)
+    fg_rate = fg_rate.where(fg_rate != 0, rm_rate)   # blank/0 FG rate -> RM rate
+
+    t = totals.reindex(df["Item Code"])
+    t.index = df.index
+    q = t[STOCK_BUCKETS].fillna(0)
+
+    rm, wip, fg, rej = q["RM"], q["WIP"], q["FG"], q["Reject"]
+
+    df["RM Stock"] = rm
+    df["WIP Stock"] = wip
+    df["FG Stock"] = fg
+    df["Reject Stock"] = rej
+    df["Total Stock"] = rm + wip + fg + rej
+
+    df["RM Value"] = rm * rm_rate
+    df["WIP Value"] = wip * (fg_rate * 0.75)
+    df["FG Value"] = fg * fg_rate
+    df["Reject Value"] = rej * rm_rate
+    df["Total Value"] = (
+        df["RM Value"] + df["WIP Value"] + df["FG Value"] + df["Reject Value"]
+    )
+
+    df["Min"] = num_col("Min Stock", 0)
+    df["Last"] = t["Last_Date"]
+
+    return df
+
+# =========================================
+# MANAGEMENT DASHBOARD – KPI HELPERS
+# =========================================
+
+from datetime import datetime, timedelta
+import pandas as pd
+import os
+import copy
+
+
+# The dashboard is assembled from one record per working day (top-part
+# output, KPI cards, loss pie, shop performance). Records are kept in
+# memory and stamped with a fingerprint of that day's rollup and loss
+# rows: after a save or delete only the days whose rows changed are
+# recomputed, and while no production table changes at all the last
+# payload is returned as is.
+DASHBOARD_KPI_DAYS = 3       # KPI cards, top parts, loss pies
+DASHBOARD_PERF_DAYS = 10     # shop performance
+
+
+def empty_dashboard():
+    return {
+        "last_days": [],
+        "production_cards": {
+            "date": "No Data",
+            "total_good_qty": 0,
+            "total_defects": 0
+        },
+        "top_parts": [],
+        "loss_pies": [],
+        "performance": []
+    }
+
+
+def daily_fingerprints(df):
+    """date -> order-independent hash of that day's rows."""
+    if df.empty:
+        return {}
+    hashed = pd.util.hash_pandas_object(df, index=False)
+    return hashed.groupby(df["Date"].dt.date).sum().to_dict()
+
+
+def dashboard_day_record(day, prod_day, loss_day, has_loss):
+    """Every dashboard figure that depends on one working day only."""
+
+    # ---------- TOP PARTS: GOOD QTY OF EACH PART'S FINAL OPERATION ----------
+    ops = prod_day.copy()
+    ops["Op_No"] = ops["Operation"].astype(str).str.extract(r"(\d+)", expand=False)
+    ops = ops[ops["Op_No"].notna()]
+    ops["Op_No"] = ops["Op_No"].astype(int)
+
+    part_qty = {}
+    if not ops.empty:
+        final_ops = (
+            ops.groupby("Part")["Op_No"]
+            .max()
+            .reset_index()
+            .rename(columns={"Op_No": "FinalOp"})
+        )
+        ops = ops.merge(final_ops, on="Part", how="left")
+        part_qty = (
+            ops[ops["Op_No"] == ops["FinalOp"]]
+            .groupby("Part")["Good_Qty"]
+            .sum()
+            .to_dict()
+        )
+
+    # ---------- LOSS PIE ----------
+    pie = []
+    if has_loss and not loss_day.empty:
+        reasons = loss_day.groupby("Loss_Reason", as_index=False).agg(
+            Time_Min=("Time_Min", "sum")
+        )
+        pie = [
+            {"label": r["Loss_Reason"], "value": int(r["Time_Min"])}
+            for _, r in reasons.iterrows()
+            if r["Time_Min"] > 0
+        ]
+
+    # ---------- SHOP PERFORMANCE ----------
+    available_time = prod_day["Machine"].nunique() * 960
+    loss_time = loss_day["Time_Min"].sum() if has_loss else 0
+
+    good = prod_day["Good_Qty"].sum()
+    reject = prod_day["Mach_Rej"].sum()
+    used_time = prod_day["Time_Min"].sum()
+
+    availability = ((available_time - loss_time) / available_time * 100) if available_time else 0
+    performance_pct = (used_time / available_time * 100) if available_time else 0
+    quality = (good / (good + reject) * 100) if (good + reject) else 0
+    oee = (availability * performance_pct * quality) / 10000
+
+    return {
+        "label": day.strftime("%d-%m-%Y"),
+        "part_qty": part_qty,
+        "good_qty": int(good),
+        "defects": int(reject),
+        "loss_pie": pie,
+        "performance": {
+            "date": day.strftime("%d-%m-%Y"),
+            "availability": round(max(min(availability, 100), 0), 2),
+            "performance": round(max(min(performance_pct, 100), 0), 2),
+            "quality": round(max(min(quality, 100), 0), 2),
+            "oee": round(max(min(oee, 100), 0), 2)
+        }
+    }
+
+
+class DashboardKpis:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loss = {}             # loss partition -> (signature, daily loss per reason)
+        self._days = {}             # date -> (fingerprint, day record)
+        self._sig = None
+        self._payload = None
+        self.day_builds = 0
+
+    def _daily_loss(self):
+        """Loss minutes per Date x Loss_Reason, kept per partition."""
+        paths = list_partitions(PRODUCTION_LOSS_FILE)
+        self._loss = {p: e for p, e in self._loss.items() if p in paths}
+
+        frames = []
+        for p in paths:
+            sig = table_signature(p)
+            entry = self._loss.get(p)
+            if entry is None or entry[0] != sig:
+                loss = load_table(p, normalize=normalize_production)
+                if loss.empty or "Date" not in loss.columns:
+                    daily = loss
+                else:
+                    daily = (
+                        loss.groupby(["Date", "Loss_Reason"], dropna=False, as_index=False)
+                        .agg(Time_Min=("Time_Min", "sum"))
+                    )
+                entry = self._loss[p] = (sig, daily)
+            frames.append(entry[1])
+
+        return concat_partitions(frames)
+
+    def _build(self):
+        prod_df = get_production_rollup()
+        if prod_df.empty:
+            return empty_dashboard()
+
+        loss_df = self._daily_loss()
+        has_loss = not loss_df.empty
+
+        # ---------------- LAST WORKING DAYS ----------------
+        available_days = sorted(
+            d for d in prod_df["Date"].dt.date.dropna().unique()
+            if d.weekday() != 3  # skip Thursday
+        )
+
+        if len(available_days) == 0:
+            return empty_dashboard()
+
+        last_3_days = available_days[-DASHBOARD_KPI_DAYS:]
+        last_10_days = available_days[-DASHBOARD_PERF_DAYS:]
+
+        # ---------------- DAY RECORDS (ONLY CHANGED DAYS ARE REBUILT) ----------------
+        prod_fp = daily_fingerprints(prod_df)
+        loss_fp = daily_fingerprints(loss_df) if has_loss else {}
+
+        wanted = sorted(set(last_3_days) | set(last_10_days))
+        stale = [
+            d for d in wanted
+            if self._days.get(d, (None,))[0] != (prod_fp.get(d), loss_fp.get(d), has_loss)
+        ]
+
+        if stale:
+            prod_dates = prod_df["Date"].dt.date
+            loss_dates = loss_df["Date"].dt.date if has_loss else None
+
+            for d in stale:
+                self._days[d] = (
+                    (prod_fp.get(d), loss_fp.get(d), has_loss),
+                    dashboard_day_record(
+                        d,
+                        prod_df[prod_dates == d],
+                        loss_df[loss_dates == d] if has_loss else None,
+                        has_loss
+                    )
+                )
+                self.day_builds += 1
+
+        self._days = {d: self._days[d] for d in wanted}
+        days = {d: self._days[d][1] for d in wanted}
+
+        # ==================================================
+        # 🔷 TOP 5 PARTS – LAST OP OUTPUT (LAST 3 WORKING DAYS)
+        # ==================================================
+        top_parts_daily = {days[d]["label"]: days[d]["part_qty"] for d in last_3_days}
+
+        all_parts = set()
+        for d in top_parts_daily.values():
+            all_parts.update(d.keys())
+
+        ranking = []
+        for part in all_parts:
+            if not part or str(part).strip().lower() in ["nan", "none"]:
+                continue   # 🔥 skip invalid parts
+
+            total = sum(
+                top_parts_daily[day].get(part, 0)
+                for day in top_parts_daily
+            )
+            ranking.append((part, total))
+
+        top_5_parts = sorted(ranking, key=lambda x: x[1], reverse=True)[:5]
+
+        top_parts_table = []
+        for part, _ in top_5_parts:
+            row = {"Part": part}
+            for day in top_parts_daily:
+                row[day] = int(top_parts_daily[day].get(part, 0))
+            top_parts_table.append(row)
+
+        # ==================================================
+        # ✅ FINAL PAYLOAD
+        # ==================================================
+        prev_day = days[last_3_days[-1]]
+
+        return {
+            "last_days": [days[d]["label"] for d in last_3_days],
+            "production_cards": {
+                "date": prev_day["label"],
+                "total_good_qty": prev_day["good_qty"],
+                "total_defects": prev_day["defects"]
+            },
+            "top_parts": top_parts_table,
+            "loss_pies": [
+                {"date": days[d]["label"], "data": days[d]["loss_pie"]}
+                for d in last_3_days
+            ] if has_loss else [],
+            "performance": [days[d]["performance"] for d in last_10_days]
+        }
+
+    def get(self):
+        with self._lock:
+            sig = production_data_signature()
+            if sig != self._sig or self._payload is None:
+                self._payload = self._build()
+                self._sig = sig
+            return copy.deepcopy(self._payload)
+
+
+dashboard_kpis = DashboardKpis()
+
+
+def get_dashboard_kpis():
+    """Management dashboard payload (last working days), see DashboardKpis."""
+    return dashboard_kpis.get()
+
+# =====================================================
+# MASTER PROFESSIONAL EXCEL FORMAT ENGINE (GLOBAL)
+# =====================================================
+# Workbooks are written in xlsxwriter constant_memory mode to a temp
+# file: each row is flushed to disk once the next row starts, so sheets
+# must be filled top to bottom, one write_row per row (never through
+# DataFrame.to_excel, which writes column by column). Finished files
+# are kept in data/_exports (see EXPORT JOBS) and streamed from there.
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_FOLDER = os.path.join(DATA_FOLDER, "_exports")
+
+
+def export_temp_path():
+    # builds in progress live in _exports/tmp, finished ones are moved up
+    folder = os.path.join(EXPORT_FOLDER, "tmp")
+    os.makedirs(folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx", dir=folder)
+    os.close(fd)
+    return path
+
+
+def excel_writer(path):
+    return pd.ExcelWriter(
+        path,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"constant_memory": True}}
+    )
+
+
+def send_export(path, fname):
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=fname,
+        mimetype=XLSX_MIMETYPE
+    )
+
+
+def frame_rows(df):
+    """Cell values of df, one object array per sheet row; NaN/NaT -> blank."""
+    values = df.to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    return values
+
+
+def column_widths(df, pad=4):
+    """Longest text per column (the header counts too) plus padding."""
+    lengths = df.astype(str).apply(lambda col: col.str.len().max())
+    headers = pd.Series([len(str(c)) for c in df.columns], index=df.columns)
+    return (lengths.where(lengths > headers, headers) + pad).astype(int).tolist()
+
+
+def write_raw_sheet(writer, sheet_name, df):
+    """DataFrame.to_excel(index=False) layout, written row by row."""
+    workbook = writer.book
+    worksheet = workbook.add_worksheet(sheet_name)
+    writer.sheets[sheet_name] = worksheet
+
+    header_fmt = workbook.add_format({
+        "bold": True, "border": 1, "align": "center", "valign": "top"
+    })
+    datetime_fmt = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+
+    date_cols = [
+        i for i, c in enumerate(df.columns)
+        if pd.api.types.is_datetime64_any_dtype(df[c])
+    ]
+
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+
+    for r, row in enumerate(frame_rows(df), start=1):
+        worksheet.write_row(r, 0, row)
+        for c in date_cols:
+            if row[c] is not None:
+                worksheet.write_datetime(r, c, row[c], datetime_fmt)
+
+    return worksheet
+
+
+def create_professional_excel(
+    writer,
+    sheet_name,
+    report_title,
+    filters_text,
+    df,
+    start_row=5
+):
+    """
+    Universal corporate Excel formatter for all reports
+    """
+
+    workbook  = writer.book
+    worksheet = workbook.add_worksheet(sheet_name)
+    writer.sheets[sheet_name] = worksheet
+
+    # ================= FORMATS =================
+    company_fmt = workbook.add_format({
+        "bold": True,
+        "font_size": 16,
+        "align": "center",
+        "font_name": "Calibri"
+    })
+
+    system_fmt = workbook.add_format({
+        "bold": True,
+        "font_size": 12,
+        "align": "center",
+        "font_name": "Calibri"
+    })
+
+    report_fmt = workbook.add_format({
+        "bold": True,
+        "font_size": 12,
+        "align": "center",
+        "font_name": "Calibri"
+    })
+
+    filter_fmt = workbook.add_format({
+        "italic": True,
+        "font_size": 10,
+        "align": "center",
+        "font_name": "Calibri"
+    })
+
+    header_fmt = workbook.add_format({
+        "bold": True,
+        "border": 1,
+        "align": "center",
+        "valign": "vcenter",
+        "bg_color": "#D9E1F2",   # visible corporate header color
+        "font_name": "Calibri"
+    })
+
+    cell_fmt = workbook.add_format({
+        "border": 1,
+        "align": "center",
+        "font_name": "Calibri"
+    })
+
+    # ================= CORPORATE HEADER =================
+    last_col = len(df.columns) - 1
+
+    worksheet.merge_range(0, 0, 0, last_col,
+        "CATI Manufacturing Pvt. Ltd.", company_fmt)
+
+    worksheet.merge_range(1, 0, 1, last_col,
+        "Production Monitoring System", system_fmt)
+
+    worksheet.merge_range(2, 0, 2, last_col,
+        report_title, report_fmt)
+
+    worksheet.merge_range(3, 0, 3, last_col,
+        f"Applied Filters: {filters_text}", filter_fmt)
+
+    # ================= TABLE HEADER =================
+    worksheet.write_row(start_row, 0, list(df.columns), header_fmt)
+
+    # ================= TABLE DATA (ONE write_row PER ROW, TOP TO BOTTOM) =================
+    data_start = start_row + 1
+
+    for r, row in enumerate(frame_rows(df), start=data_start):
+        worksheet.write_row(r, 0, row, cell_fmt)
+
+    # ================= AUTO COLUMN WIDTH =================
+    for i, width in enumerate(column_widths(df)):
+        worksheet.set_column(i, i, width)
+
+    # ================= FREEZE =================
+    worksheet.freeze_panes(data_start, 0)
+
+    return worksheet
+
+# =========================================
+# HOME
+# =========================================
+
+@app.route("/")
+def home():
+    return render_template("home.html")
+
+# =========================================
+# PRODUCTION MODULE HOME
+# =========================================
+@app.route("/production")
+def production_home():
+    return render_template("production_home.html")
+
+# =========================================
+# 📤 MASTER EXCEL UPLOAD (BULK UPSERT)
+# =========================================
+# Part / operator / machine master uploads are merged in one pass:
+# the whole sheet is validated first (any invalid row and nothing is
+# written), a key repeated in the sheet keeps its last row, and the
+# master is joined on its key columns: known keys are updated in
+# place, new keys appended, and the table is written once.
+# Every sheet row gets a line in a diff report (insert / update /
+# unchanged / superseded / invalid), kept as data/_uploads/<id>.json,
+# shown on the master page and served at /master_uploads/<id>.
+MASTER_UPLOAD_FOLDER = os.path.join(DATA_FOLDER, "_uploads")
+MASTER_UPLOAD_REPORTS_KEPT = 50
+
+
+def target_per_hour(df):
+    return (60 // df["Cycle Time (min)"]).astype(int)
+
+
+# master -> (file, key columns, {column: "text" | "number"},
+#            [(column, valid(values), message)], {derived column: fn(df)})
+MASTER_UPLOADS = {
+    "part": (
+        PART_MASTER_FILE,
+        ["Part Number", "Operation No"],
+        {"Cycle Time (min)": "number", "Machine Type": "text"},
+        [("Cycle Time (min)", lambda s: s > 0, "must be more than 0")],
+        {"Target Per Hour": target_per_hour}
+    ),
+    "operator": (
+        OPERATOR_MASTER_FILE,
+        ["Operator ID"],
+        {"Operator Name": "text", "Skill Level": "text", "Is Active": "text"},
+        [],
+        {}
+    ),
+    "machine": (
+        MACHINE_MASTER_FILE,
+        ["Machine No"],
+        {"Machine Type": "text", "Normal Working Hours": "number", "OT Working Hours": "number"},
+        [],
+        {}
+    )
+}
+
+
+def upload_text(s):
+    return s.fillna("").astype(str).str.strip()
+
+
+def master_keys(df, keys):
+    """One string per row joining the (stripped) key columns."""
+    key = upload_text(df[keys[0]])
+    for col in keys[1:]:
+        key = key + "\x1f" + upload_text(df[col])
+    return key
+
+
+def upload_changes(old, new, kind):
+    """Per row: True where the uploaded value differs from the master."""
+    if kind == "number":
+        old = pd.to_numeric(old, errors="coerce")
+        return ~((old == new) | (old.isna() & new.isna()))
+    return upload_text(old) != new
+
+
+def upsert_master(master, df, upload_df):
+    """
+    Merge an uploaded master sheet into the master `df`.
+    Returns (merged df, or None when the sheet is rejected; report df
+    with Row / Key / Action / Changes per sheet row).
+    """
+    _, keys, fields, checks, derived = MASTER_UPLOADS[master]
+    values = list(fields) + list(derived)
+    columns = keys + values
+
+    missing = [c for c in keys + list(fields) if c not in upload_df.columns]
+    if missing:
+        return None, pd.DataFrame([{
+            "Row": 1, "Key": "", "Action": "invalid",
+            "Changes": "missing columns: " + ", ".join(missing)
+        }])
+
+    # ---------- PARSE + VALIDATE THE WHOLE SHEET ----------
+    up = pd.DataFrame(index=upload_df.index)
+    problems = pd.Series("", index=upload_df.index)
+
+    for col in keys:
+        up[col] = upload_text(upload_df[col])
+        problems += (up[col] == "").map({True: f"blank {col}; ", False: ""})
+
+    not_numbers = {}
+    for col, kind in fields.items():
+        if kind == "number":
+            up[col] = pd.to_numeric(upload_df[col], errors="coerce").astype(float)
+            not_numbers[col] = upload_df[col].notna() & up[col].isna()
+            problems += not_numbers[col].map({True: f"{col} is not a number; ", False: ""})
+        else:
+            up[col] = upload_text(upload_df[col])
+
+    for col, valid, message in checks:
+        fails = ~valid(up[col]) & ~not_numbers.get(col, False)
+        problems += fails.map({True: f"{col} {message}; ", False: ""})
+
+    invalid = problems != ""
+    up["_key"] = master_keys(up, keys)
+
+    report = pd.DataFrame({
+        "Row": upload_df.index + 2,         # Excel row (header is row 1)
+        "Key": up["_key"].str.replace("\x1f", " / "),
+        "Action": "",
+        "Changes": ""
+    }, index=upload_df.index)
+
+    if invalid.any():
+        report = report[invalid]
+        report["Action"] = "invalid"
+        report["Changes"] = problems[invalid].str.rstrip("; ")
+        return None, report.reset_index(drop=True)
+
+    for col, fn in derived.items():
+        up[col] = fn(up)
+
+    # ---------- LAST ROW PER KEY WINS ----------
+    superseded = up["_key"].duplicated(keep="last")
+    report.loc[superseded, "Action"] = "superseded"
+    report.loc[superseded, "Changes"] = "a later row has the same key"
+    last = up[~superseded]
+
+    # ---------- JOIN AGAINST THE MASTER ----------
+    df = df.reindex(columns=list(df.columns) + [c for c in columns if c not in df.columns])
+    df_key = master_keys(df, keys)
+
+    current = df.assign(_key=df_key).drop_duplicates("_key").set_index("_key")
+    known = last["_key"].isin(current.index)
+
+    # diff report for known keys
+    upd = last[known]
+    changes = pd.Series("", index=upd.index)
+    for col in values:
+        kind = fields.get(col, "number")
+        old = upd["_key"].map(current[col])
+        diff = upload_changes(old, upd[col], kind)
+        text = col + ": " + old.astype(str) + " → " + upd[col].astype(str) + "; "
+        changes += text.where(diff, "")
+
+    report.loc[upd.index, "Action"] = (changes != "").map({True: "update", False: "unchanged"})
+    report.loc[upd.index, "Changes"] = changes.str.rstrip("; ")
+    report.loc[last.index[~known], "Action"] = "insert"
+
+    # update every master row of a known key (in place, keeps row order)
+    new_values = last.set_index("_key")
+    hit = df_key.isin(new_values.index)
+    for col in values:
+        df[col] = df[col].where(~hit, df_key.map(new_values[col]))
+
+    # append new keys in the order the sheet first lists them
+    inserts = (
+        up.drop_duplicates("_key")[["_key"]]
+        .merge(last[~known], on="_key")[columns]
+    )
+    if not inserts.empty:
+        df = pd.concat([df, inserts], ignore_index=True)
+
+    return df, report.reset_index(drop=True)
+
+
+def upload_master(master, file):
+    """
+    Upsert an uploaded Excel sheet into a master table (the caller holds
+    its lock), save the diff report and return the report id.
+    """
+    path = MASTER_UPLOADS[master][0]
+
+    merged, report = upsert_master(master, load_table(path), pd.read_excel(file))
+
+    if merged is not None and (report["Action"].isin(["insert", "update"])).any():
+        save_table(merged, path)
+
+    counts = report["Action"].value_counts()
+    upload = {
+        "id": uuid.uuid4().hex,
+        "master": master,
+        "file": file.filename,
+        "applied": merged is not None,
+        "counts": {k: int(v) for k, v in counts.items()},
+        "rows": report.to_dict(orient="records"),
+        "created": time.time()
+    }
+
+    os.makedirs(MASTER_UPLOAD_FOLDER, exist_ok=True)
+    atomic_write(
+        os.path.join(MASTER_UPLOAD_FOLDER, upload["id"] + ".json"),
+        lambda f: json.dump(upload, f, default=str)
+    )
+
+    # keep only the newest reports
+    reports = sorted(
+        (os.path.join(MASTER_UPLOAD_FOLDER, f) for f in os.listdir(MASTER_UPLOAD_FOLDER)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for old in reports[MASTER_UPLOAD_REPORTS_KEPT:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+    return upload["id"]
+
+
+def master_upload_report(upload_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+        return None
+    try:
+        with open(os.path.join(MASTER_UPLOAD_FOLDER, upload_id + ".json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@app.route("/master_uploads/<upload_id>")
+def master_upload(upload_id):
+    upload = master_upload_report(upload_id)
+    if upload is None:
+        return jsonify({"error": "NOT_FOUND"}), 404
+    return jsonify(upload)
+
+# =========================================
+# PART MASTER (MASTER–DETAIL VIEW)
+# =========================================
+
+@app.route("/part_master", methods=["GET", "POST"])
+@write_locked(PART_MASTER_FILE)
+def part_master():
+
+    df = load_table(PART_MASTER_FILE)
+
+    # ==============================
+    # HANDLE POST
+    # ==============================
+    if request.method == "POST":
+
+        # -------- MANUAL ADD --------
+        if "part_number" in request.form:
+            part_no = request.form["part_number"].strip()
+            op_no = request.form["operation_no"].strip()
+            cycle_time = float(request.form["cycle_time"])
+            machine_type = request.form["machine_type"].strip()
+
+            target_per_hour = int(60 // cycle_time)
+
+            duplicate = df[
+                (df["Part Number"] == part_no) &
+                (df["Operation No"] == op_no)
+            ]
+
+            if len(duplicate) == 0:
+                new_row = {
+                    "Part Number": part_no,
+                    "Operation No": op_no,
+                    "Cycle Time (min)": cycle_time,
+                    "Machine Type": machine_type,
+                    "Target Per Hour": target_per_hour
+                }
+                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+                save_table(df, PART_MASTER_FILE)
+
+        # -------- EXCEL UPLOAD (BULK UPSERT) --------
+        if "excel_file" in request.files:
+            file = request.files["excel_file"]
+            if file and file.filename != "":
+                upload_id = upload_master("part", file)
+                request_backup()
+                return redirect(url_for("part_master", upload=upload_id))
+
+        request_backup()
+        return redirect(url_for("part_master"))
+
+    # ==============================
+    # GET DATA FOR UI
+    # ==============================
+
+    parts = sorted(df["Part Number"].unique().tolist())
+
+    selected_part = request.args.get("part")
+    operations = []
+
+    if selected_part:
+        operations = df[df["Part Number"] == selected_part].to_dict(orient="records")
+    
+    return render_template(
+        "part_master.html",
+        upload_report=master_upload_report(request.args.get("upload")),
+        parts=parts,
+        selected_part=selected_part,
+        operations=operations
+    )
+
+# =========================================
+# DELETE OPERATION (SAFE: BY KEY)
+# =========================================
+
+@app.route("/delete_part_op")
+def delete_part_op():
+    part = request.args.get("part")
+    op = request.args.get("op")
+
+    delete_rows(PART_MASTER_FILE, {"Part Number": part, "Operation No": op})
+
+    request_backup()
+    return redirect(url_for("part_master", part=part))
+
+# =========================================
+# EDIT OPERATION (SAVE)
+# =========================================
+
+@app.route("/edit_part_op", methods=["POST"])
+def edit_part_op():
+    part = request.form["part_number"]
+    old_op = request.form["old_operation_no"]
 
     new_op = request.form["operation_no"]
     cycle_time = float(request.form["cycle_time"])
@@ -851,19 +4044,15 @@ def edit_part_op():
     # Recalculate target (ROUNDED DOWN)
     target_per_hour = int(60 // cycle_time)
 
-    df = pd.read_csv(PART_MASTER_FILE)
-
     # Find and update the row
-    mask = (df["Part Number"] == part) & (df["Operation No"] == old_op)
-
-    df.loc[mask, "Operation No"] = new_op
-    df.loc[mask, "Cycle Time (min)"] = cycle_time
-    df.loc[mask, "Machine Type"] = machine_type
-    df.loc[mask, "Target Per Hour"] = target_per_hour
-
-    df.to_csv(PART_MASTER_FILE, index=False)
+    update_rows(PART_MASTER_FILE, {"Part Number": part, "Operation No": old_op}, {
+        "Operation No": new_op,
+        "Cycle Time (min)": cycle_time,
+        "Machine Type": machine_type,
+        "Target Per Hour": target_per_hour
+    })
     
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("part_master", part=part))
 
 # =========================================
@@ -871,9 +4060,10 @@ def edit_part_op():
 # =========================================
 
 @app.route("/operator_master", methods=["GET", "POST"])
+@write_locked(OPERATOR_MASTER_FILE)
 def operator_master():
 
-    df = pd.read_csv(OPERATOR_MASTER_FILE)
+    df = load_table(OPERATOR_MASTER_FILE)
 
     # ==============================
     # HANDLE POST
@@ -897,42 +4087,17 @@ def operator_master():
                     "Is Active": active
                 }
                 df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                df.to_csv(OPERATOR_MASTER_FILE, index=False)
+                save_table(df, OPERATOR_MASTER_FILE)
 
-        # -------- EXCEL UPLOAD --------
+        # -------- EXCEL UPLOAD (BULK UPSERT) --------
         if "excel_file" in request.files:
             file = request.files["excel_file"]
             if file and file.filename != "":
+                upload_id = upload_master("operator", file)
+                request_backup()
+                return redirect(url_for("operator_master", upload=upload_id))
 
-                upload_df = pd.read_excel(file)
-
-                for _, row in upload_df.iterrows():
-                    op_id = str(row["Operator ID"]).strip()
-                    name = str(row["Operator Name"]).strip()
-                    skill = str(row["Skill Level"]).strip()
-                    active = str(row["Is Active"]).strip()
-
-                    duplicate = df[df["Operator ID"] == op_id]
-
-                    if len(duplicate) == 0:
-                        # INSERT
-                        new_row = {
-                            "Operator ID": op_id,
-                            "Operator Name": name,
-                            "Skill Level": skill,
-                            "Is Active": active
-                        }
-                        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                    else:
-                        # UPDATE
-                        df.loc[
-                            df["Operator ID"] == op_id,
-                            ["Operator Name", "Skill Level", "Is Active"]
-                        ] = [name, skill, active]
-
-                df.to_csv(OPERATOR_MASTER_FILE, index=False)
-
-        backup_to_drive()
+        request_backup()
         return redirect(url_for("operator_master"))
 
     # ==============================
@@ -949,6 +4114,7 @@ def operator_master():
 
     return render_template(
         "operator_master.html",
+        upload_report=master_upload_report(request.args.get("upload")),
         records=records,
         edit_id=edit_id,
         search=search
@@ -962,11 +4128,9 @@ def operator_master():
 def delete_operator():
     op_id = request.args.get("id")
 
-    df = pd.read_csv(OPERATOR_MASTER_FILE)
-    df = df[df["Operator ID"] != op_id]
-    df.to_csv(OPERATOR_MASTER_FILE, index=False)
+    delete_rows(OPERATOR_MASTER_FILE, {"Operator ID": op_id})
 
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("operator_master"))
 
 # =========================================
@@ -982,18 +4146,14 @@ def edit_operator():
     skill = request.form["skill_level"]
     active = request.form["is_active"]
 
-    df = pd.read_csv(OPERATOR_MASTER_FILE)
-
-    mask = df["Operator ID"] == old_id
-
-    df.loc[mask, "Operator ID"] = new_id
-    df.loc[mask, "Operator Name"] = name
-    df.loc[mask, "Skill Level"] = skill
-    df.loc[mask, "Is Active"] = active
-
-    df.to_csv(OPERATOR_MASTER_FILE, index=False)
+    update_rows(OPERATOR_MASTER_FILE, {"Operator ID": old_id}, {
+        "Operator ID": new_id,
+        "Operator Name": name,
+        "Skill Level": skill,
+        "Is Active": active
+    })
 
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("operator_master"))
 
 # =========================================
@@ -1001,9 +4161,10 @@ def edit_operator():
 # =========================================
 
 @app.route("/machine_master", methods=["GET", "POST"])
+@write_locked(MACHINE_MASTER_FILE)
 def machine_master():
 
-    df = pd.read_csv(MACHINE_MASTER_FILE)
+    df = load_table(MACHINE_MASTER_FILE)
 
     # ==============================
     # HANDLE POST
@@ -1027,42 +4188,17 @@ def machine_master():
                     "OT Working Hours": ot_hours
                 }
                 df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                df.to_csv(MACHINE_MASTER_FILE, index=False)
+                save_table(df, MACHINE_MASTER_FILE)
 
-        # -------- EXCEL UPLOAD --------
+        # -------- EXCEL UPLOAD (BULK UPSERT) --------
         if "excel_file" in request.files:
             file = request.files["excel_file"]
             if file and file.filename != "":
-                
-                upload_df = pd.read_excel(file)
-
-                for _, row in upload_df.iterrows():
-                    machine_no = str(row["Machine No"]).strip()
-                    machine_type = str(row["Machine Type"]).strip()
-                    normal_hours = float(row["Normal Working Hours"])
-                    ot_hours = float(row["OT Working Hours"])
-
-                    duplicate = df[df["Machine No"] == machine_no]
-
-                    if len(duplicate) == 0:
-                        # INSERT
-                        new_row = {
-                            "Machine No": machine_no,
-                            "Machine Type": machine_type,
-                            "Normal Working Hours": normal_hours,
-                            "OT Working Hours": ot_hours
-                        }
-                        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                    else:
-                        # UPDATE
-                        df.loc[
-                            df["Machine No"] == machine_no,
-                            ["Machine Type", "Normal Working Hours", "OT Working Hours"]
-                        ] = [machine_type, normal_hours, ot_hours]
-
-                df.to_csv(MACHINE_MASTER_FILE, index=False)
+                upload_id = upload_master("machine", file)
+                request_backup()
+                return redirect(url_for("machine_master", upload=upload_id))
 
-        backup_to_drive()
+        request_backup()
         return redirect(url_for("machine_master"))
 
     # ==============================
@@ -1083,6 +4219,7 @@ def machine_master():
     
     return render_template(
         "machine_master.html",
+        upload_report=master_upload_report(request.args.get("upload")),
         records=records,
         edit_id=edit_id,
         search=search
@@ -1096,11 +4233,9 @@ def machine_master():
 def delete_machine():
     machine_no = request.args.get("no")
 
-    df = pd.read_csv(MACHINE_MASTER_FILE)
-    df = df[df["Machine No"] != machine_no]
-    df.to_csv(MACHINE_MASTER_FILE, index=False)
+    delete_rows(MACHINE_MASTER_FILE, {"Machine No": machine_no})
 
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("machine_master"))
 
 # =========================================
@@ -1116,18 +4251,14 @@ def edit_machine():
     normal_hours = float(request.form["normal_hours"])
     ot_hours = float(request.form["ot_hours"])
 
-    df = pd.read_csv(MACHINE_MASTER_FILE)
-
-    mask = df["Machine No"] == old_no
-
-    df.loc[mask, "Machine No"] = new_no
-    df.loc[mask, "Machine Type"] = machine_type
-    df.loc[mask, "Normal Working Hours"] = normal_hours
-    df.loc[mask, "OT Working Hours"] = ot_hours
-
-    df.to_csv(MACHINE_MASTER_FILE, index=False)
+    update_rows(MACHINE_MASTER_FILE, {"Machine No": old_no}, {
+        "Machine No": new_no,
+        "Machine Type": machine_type,
+        "Normal Working Hours": normal_hours,
+        "OT Working Hours": ot_hours
+    })
 
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("machine_master"))
 
 # =========================================
@@ -1136,42 +4267,103 @@ def edit_machine():
 
 # DAILY PRODUCTION REPORT ENTRY
 
-@app.route("/production_entry")
-def production_entry():
+# ---------- MASTER PAYLOAD (CACHED, VERSIONED) ----------
+# The entry page is a small shell; its dropdown data (parts with their
+# operations and machine types, machines, operators) is served as one
+# JSON document built once per master change. The shell asks for it by
+# version (?v=...), so browsers keep it until a master changes; the
+# strong ETag turns any other request into a 304.
+PRODUCTION_ENTRY_MASTERS = [PART_MASTER_FILE, OPERATOR_MASTER_FILE, MACHINE_MASTER_FILE]
+
 
-    # Load masters
-    parts_df = pd.read_csv(PART_MASTER_FILE)
-    operators_df = pd.read_csv(OPERATOR_MASTER_FILE)
-    machines_df = pd.read_csv(MACHINE_MASTER_FILE)
+def json_values(s):
+    """Column values as JSON-safe Python objects (NaN -> null)."""
+    return s.astype(object).where(s.notna(), None).tolist()
 
-    # Build Part -> Operations -> Machine Type mapping
+
+def build_production_entry_masters():
+    parts_df = load_table(PART_MASTER_FILE)
+    operators_df = load_table(OPERATOR_MASTER_FILE)
+    machines_df = load_table(MACHINE_MASTER_FILE)
+
+    # Part -> [{op, machine_type}], master order within a part
     part_ops = {}
-    for _, row in parts_df.iterrows():
-        part = row["Part Number"]
-        op = row["Operation No"]
-        mtype = row["Machine Type"]
+    for part, ops in zip(
+        json_values(parts_df["Part Number"]),
+        zip(json_values(parts_df["Operation No"]), json_values(parts_df["Machine Type"]))
+    ):
+        part_ops.setdefault(part, []).append({"op": ops[0], "machine_type": ops[1]})
 
-        if part not in part_ops:
-            part_ops[part] = []
+    # Machine No -> Machine Type (last row wins, as before)
+    machine_types = dict(zip(
+        json_values(machines_df["Machine No"]), json_values(machines_df["Machine Type"])
+    ))
 
-        part_ops[part].append({
-            "op": op,
-            "machine_type": mtype
-        })
+    return {
+        "parts": sorted(part_ops),
+        "part_ops": part_ops,
+        "machine_types": machine_types,
+        "operators": json_values(operators_df["Operator Name"]),
+        "machines": json_values(machines_df["Machine No"])
+    }
 
-    # Build Machine No -> Machine Type mapping
-    machine_types = {}
-    for _, row in machines_df.iterrows():
-        machine_types[row["Machine No"]] = row["Machine Type"]
 
-    return render_template(
-        "production_entry.html",
-        parts=sorted(part_ops.keys()),
-        part_ops=part_ops,
-        machine_types=machine_types,
-        operators=operators_df.to_dict(orient="records"),
-        machines=machines_df.to_dict(orient="records"),
-    )
+class ProductionEntryMasters:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._body = None
+        self.builds = 0
+        self.hits = 0
+
+    def get(self):
+        """(version, JSON body); rebuilt only when a master changed."""
+        version = data_version(*PRODUCTION_ENTRY_MASTERS)
+
+        with self._lock:
+            if version != self._version:
+                self._body = json.dumps(build_production_entry_masters())
+                self._version = version
+                self.builds += 1
+            else:
+                self.hits += 1
+            return self._version, self._body
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "bytes": len(self._body or ""),
+                "builds": self.builds,
+                "hits": self.hits
+            }
+
+
+production_entry_masters = ProductionEntryMasters()
+
+
+@app.route("/production_entry")
+def production_entry():
+    version, _ = production_entry_masters.get()
+    return render_template("production_entry.html", masters_version=version)
+
+
+@app.route("/production_entry/masters")
+def production_entry_masters_json():
+    version, body = production_entry_masters.get()
+
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(version)
+    if request.args.get("v") == version:
+        # versioned URL: the content behind it never changes
+        response.cache_control.private = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
 
 # PRODUCTION REPORT SAVE
 
@@ -1268,9 +4460,7 @@ def save_production_entry():
             for r in main_data
         ])
 
-        path = "data/production_main.csv"
-        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
-        df_main.to_csv(path, mode="a", index=False, header=write_header)
+        append_partitioned(df_main, PRODUCTION_MAIN_FILE)
 
     # =====================================================
     # OTHER MACHINE PRODUCTION
@@ -1294,9 +4484,7 @@ def save_production_entry():
             for r in other_data
         ])
 
-        path = "data/production_other_machine.csv"
-        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
-        df_other.to_csv(path, mode="a", index=False, header=write_header)
+        append_partitioned(df_other, PRODUCTION_OTHER_FILE)
 
     # =====================================================
     # LOSS / DOWNTIME
@@ -1316,46 +4504,314 @@ def save_production_entry():
             for r in loss_data
         ])
 
-        path = "data/production_loss.csv"
-        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
-
         import csv
 
-        df_loss.to_csv(
-            path,
-            mode="a",
-            index=False,
-            header=write_header,
-            quoting=csv.QUOTE_ALL
-        )
+        append_partitioned(df_loss, PRODUCTION_LOSS_FILE, quoting=csv.QUOTE_ALL)
 
     # -----------------------------
     # BACK TO ENTRY PAGE
     # -----------------------------
-    backup_to_drive()
+    request_backup()
     return redirect(url_for("production_entry"))
 
+# BULK PRODUCTION ENTRY (MANY OPERATOR SHEETS PER POST)
+# =====================================================
+# End-of-shift ingest of many operator / shift blocks in one request:
+#   JSON  {"entries": [{"date", "operator", "shift", "ot", "main_machine",
+#                       "main": [...], "other": [...], "loss": [...]}]}
+#         (rows use the Production Entry form keys, see *_ROW_KEYS)
+#   Excel file=<shift sheet>: sheet "Production" (one row per line, a
+#         Machine other than the Main Machine makes it an other-machine
+#         row) and optional sheet "Loss", see *_SHEET_COLUMNS
+# All rows are checked in one column-wise pass: the form's rules plus
+# the masters (operator, machine, part + operation). Any error and
+# nothing is written; the response lists the errors per row. Otherwise
+# every partition touched gets one append. dry_run=1 only validates.
+PRODUCTION_COLUMNS = [
+    "Date", "Operator", "Shift", "OT", "Machine", "Part", "Operation",
+    "Time_Min", "Qty", "Cast_Rej", "Mach_Rej", "Good_Qty"
+]
+LOSS_COLUMNS = [
+    "Date", "Operator", "Shift", "OT", "Machine", "Loss_Reason",
+    "Time_Min", "Remarks"
+]
+
+ENTRY_HEADER_KEYS = {
+    "date": "Date", "operator": "Operator", "shift": "Shift", "ot": "OT",
+    "main_machine": "Machine"
+}
+MAIN_ROW_KEYS = {
+    "part": "Part", "operation": "Operation", "time": "Time_Min", "qty": "Qty",
+    "cast": "Cast_Rej", "mach": "Mach_Rej", "good": "Good_Qty"
+}
+OTHER_ROW_KEYS = {"machine": "Machine", **MAIN_ROW_KEYS}
+LOSS_ROW_KEYS = {"reason": "Loss_Reason", "time": "Time_Min", "remarks": "Remarks"}
+
+PRODUCTION_SHEET_COLUMNS = {
+    "Main Machine": "_main", "Time (min)": "Time_Min", "Cast Rej": "Cast_Rej",
+    "Mach Rej": "Mach_Rej", "Good Qty": "Good_Qty"
+}
+LOSS_SHEET_COLUMNS = {
+    "Main Machine": "Machine", "Loss Reason": "Loss_Reason", "Time (min)": "Time_Min"
+}
+
+BULK_ROW_COLUMNS = ["_table", "_entry", "_row"]
+
+
+BULK_ERROR_COLUMNS = ["Table", "Entry", "Row", "Error"]
+
+
+def bulk_entry_frames(entries, today):
+    """
+    JSON entry blocks -> (production rows, loss rows, shape errors), block
+    order. Entries / rows that are not JSON objects (and row blocks that
+    are not lists) are skipped and reported as Table / Entry / Row / Error.
+    """
+    prod, loss, problems = [], [], []
+
+    for e, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            problems.append([None, e, None, "Entry is not an object"])
+            continue
+
+        head = {col: entry.get(key) for key, col in ENTRY_HEADER_KEYS.items()}
+        head["Date"] = head["Date"] or today
+
+        for table, keys, out in (
+            ("main", MAIN_ROW_KEYS, prod),
+            ("other", OTHER_ROW_KEYS, prod),
+            ("loss", LOSS_ROW_KEYS, loss)
+        ):
+            block = entry.get(table) or []
+            if not isinstance(block, list):
+                problems.append([table, e, None, "Expected a list of rows"])
+                continue
+
+            for i, r in enumerate(block, start=1):
+                if not isinstance(r, dict):
+                    problems.append([table, e, i, "Row is not an object"])
+                    continue
+                row = dict(head, _table=table, _entry=e, _row=i)
+                row.update((col, r.get(key)) for key, col in keys.items())
+                out.append(row)
+
+    return (
+        pd.DataFrame(prod, columns=BULK_ROW_COLUMNS + PRODUCTION_COLUMNS),
+        pd.DataFrame(loss, columns=BULK_ROW_COLUMNS + LOSS_COLUMNS),
+        pd.DataFrame(problems, columns=BULK_ERROR_COLUMNS, dtype=object)
+    )
+
+
+def bulk_sheet_frames(book, today):
+    """Shift sheet workbook -> (production rows, loss rows), sheet order."""
+
+    def rows(name, renames, columns):
+        sheet = book.get(name, pd.DataFrame()).dropna(how="all")
+        df = sheet.rename(columns=renames).reindex(columns=columns)
+        df["Date"] = df["Date"].where(upload_text(df["Date"]) != "", today)
+        df["_entry"] = None
+        df["_row"] = sheet.index + 2            # Excel row (header is row 1)
+        return df
+
+    prod = rows("Production", PRODUCTION_SHEET_COLUMNS, PRODUCTION_COLUMNS + ["_main"])
+    main = upload_text(prod["_main"])
+    machine = upload_text(prod["Machine"])
+    other = (machine != "") & (main != "") & (machine != main)
+
+    prod["Machine"] = machine.where(machine != "", main)
+    prod["_table"] = other.map({True: "other", False: "main"})
+
+    loss = rows("Loss", LOSS_SHEET_COLUMNS, LOSS_COLUMNS)
+    loss["_table"] = "loss"
+
+    return (
+        prod[BULK_ROW_COLUMNS + PRODUCTION_COLUMNS],
+        loss[BULK_ROW_COLUMNS + LOSS_COLUMNS]
+    )
+
+
+def bulk_entry_errors(df, masters):
+    """
+    Row-level problems of production or loss rows (same rules as the
+    Production Entry form, plus the masters), one column-wise pass.
+    Returns Table / Entry / Row / Error for the invalid rows.
+    """
+    operators, machines, part_ops = masters
+    problems = pd.Series("", index=df.index)
+
+    def check(mask, message):
+        nonlocal problems
+        problems += mask.map({True: message + "; ", False: ""})
+
+    def blank(col):
+        text = upload_text(df[col])
+        return (text == "") | (text.str.lower() == "nan")
+
+    def positive(col):
+        return pd.to_numeric(df[col], errors="coerce").fillna(0) > 0
+
+    main_machine = df["_table"] != "other"
+
+    check(pd.to_datetime(df["Date"], errors="coerce").isna(), "Invalid Date")
+    check(blank("Operator"), "Select Operator")
+    check(~blank("Operator") & ~upload_text(df["Operator"]).isin(operators), "Unknown operator")
+    check(blank("Shift"), "Select Shift")
+    check(blank("Machine") & main_machine, "Select Main Machine")
+    check(blank("Machine") & ~main_machine, "Select Machine")
+    check(~blank("Machine") & ~upload_text(df["Machine"]).isin(machines), "Unknown machine")
+
+    if "Part" in df.columns:
+        check(blank("Part"), "Select Part")
+        check(blank("Operation"), "Select Operation")
+        check(
+            ~blank("Part") & ~blank("Operation")
+            & ~master_keys(df, ["Part", "Operation"]).isin(part_ops),
+            "Part / operation not in part master"
+        )
+        check(~positive("Qty"), "Enter Produced Qty")
+
+        for col in ["Cast_Rej", "Mach_Rej", "Good_Qty"]:
+            check(
+                ~blank(col) & pd.to_numeric(df[col], errors="coerce").isna(),
+                f"{col} is not a number"
+            )
+    else:
+        check(blank("Loss_Reason"), "Select Loss Reason")
+
+    check(~positive("Time_Min"), "Enter Time")
+
+    invalid = problems != ""
+    return pd.DataFrame({
+        "Table": df["_table"][invalid],
+        "Entry": df["_entry"][invalid].astype(object),
+        "Row": df["_row"][invalid],
+        "Error": problems[invalid].str.rstrip("; ")
+    })
+
+
+def bulk_entry_rows(df, columns):
+    """Validated rows as the form stores them: stripped text, ISO dates."""
+    rows = df[columns].apply(upload_text)
+    rows["Date"] = pd.to_datetime(rows["Date"]).dt.strftime("%Y-%m-%d")
+
+    if "Remarks" in rows.columns:
+        rows["Remarks"] = rows["Remarks"].str.replace(",", " | ")
+
+    return rows
+
+
+@app.route("/production_entry/bulk", methods=["POST"])
+def bulk_production_entry():
+    import csv
+    from datetime import datetime
+
+    today = datetime.today().strftime("%Y-%m-%d")
+    file = request.files.get("file")
+
+    if file:
+        dry_run = request.form.get("dry_run") == "1"
+        prod, loss = bulk_sheet_frames(
+            pd.read_excel(file, sheet_name=None, dtype=str), today
+        )
+        shape_errors = pd.DataFrame(columns=BULK_ERROR_COLUMNS)
+    else:
+        payload = request.get_json(silent=True)
+        entries = payload.get("entries") if isinstance(payload, dict) else None
+        if not isinstance(entries, list):
+            return jsonify({"error": "EXPECTED_ENTRIES"}), 400
+        dry_run = bool(payload.get("dry_run")) or request.args.get("dry_run") == "1"
+        prod, loss, shape_errors = bulk_entry_frames(entries, today)
+
+    # ---------- VALIDATE (ONE PASS PER TABLE) ----------
+    operators_df = load_table(OPERATOR_MASTER_FILE)
+    machines_df = load_table(MACHINE_MASTER_FILE)
+    parts_df = load_table(PART_MASTER_FILE)
+
+    masters = (
+        set(upload_text(operators_df.get("Operator Name", pd.Series(dtype=str)))),
+        set(upload_text(machines_df.get("Machine No", pd.Series(dtype=str)))),
+        set(master_keys(parts_df, ["Part Number", "Operation No"]))
+        if {"Part Number", "Operation No"} <= set(parts_df.columns) else set()
+    )
+
+    errors = pd.concat(
+        [
+            shape_errors,
+            bulk_entry_errors(prod, masters),
+            bulk_entry_errors(loss, masters)
+        ],
+        ignore_index=True
+    )
+
+    counts = {
+        table: int((df["_table"] == table).sum())
+        for table, df in (("main", prod), ("other", prod), ("loss", loss))
+    }
+    result = {
+        "dry_run": dry_run,
+        "rows": counts,
+        "error_count": len(errors),
+        "errors": errors.to_dict(orient="records")
+    }
+
+    if not errors.empty:
+        return jsonify({"saved": False, **result}), 400
+
+    if dry_run:
+        return jsonify({"saved": False, **result})
+
+    # ---------- ONE GROUPED WRITE (ONE APPEND PER PARTITION) ----------
+    # Every frame is built first, then the locks of all the partitions
+    # the batch touches are taken (files_locked order, as the Daily
+    # Report delete takes them) before the first append: a busy table
+    # (LockTimeout -> 503) saves nothing. The appends are still one per
+    # file, not a transaction: an I/O error part way through keeps the
+    # partitions already appended and answers 500.
+    staged = []
+    for table, path in PRODUCTION_SOURCES:
+        rows = prod[prod["_table"] == table]
+        if not rows.empty:
+            staged += [
+                (target, part, {}) for target, part in
+                partition_frames(bulk_entry_rows(rows, PRODUCTION_COLUMNS), path)
+            ]
+
+    if not loss.empty:
+        staged += [
+            (target, part, {"quoting": csv.QUOTE_ALL}) for target, part in
+            partition_frames(bulk_entry_rows(loss, LOSS_COLUMNS), PRODUCTION_LOSS_FILE)
+        ]
+
+    with files_locked([target for target, _, _ in staged]):
+        for target, part, to_csv_kwargs in staged:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            append_table(part, target, **to_csv_kwargs)
+
+    request_backup()
+    return jsonify({"saved": True, **result})
+
 # OPERATOR ABSENTEEISM ENTRY
 
 @app.route("/operator_absenteeism", methods=["GET", "POST"])
+@write_locked(ABSENTEEISM_FILE)
 def operator_absenteeism():
     import pandas as pd
     import calendar
     from datetime import datetime
     import os
 
-    ABSENT_FILE = "data/operator_absenteeism.csv"
-    OPERATOR_FILE = "data/operator_master.csv"
+    ABSENT_FILE = ABSENTEEISM_FILE
+    OPERATOR_FILE = OPERATOR_MASTER_FILE
 
     # ---------- LOAD OPERATORS ----------
-    operators_df = pd.read_csv(OPERATOR_FILE)
+    operators_df = load_table(OPERATOR_FILE)
     operators = sorted(operators_df["Operator Name"].dropna().unique().tolist())
 
     # ---------- ENSURE ABSENT FILE ----------
-    if not os.path.exists(ABSENT_FILE):
-        pd.DataFrame(columns=["Date", "Operator"]).to_csv(ABSENT_FILE, index=False)
+    if not table_exists(ABSENT_FILE):
+        save_table(pd.DataFrame(columns=["Date", "Operator"]), ABSENT_FILE)
 
-    absent_df = pd.read_csv(ABSENT_FILE)
+    absent_df = load_table(ABSENT_FILE)
 
     # ---------- ABSENTEEISM SUMMARY (ALL TIME) ----------
     if absent_df.empty:
@@ -1383,9 +4839,9 @@ def operator_absenteeism():
                 "Operator": operator,
                 "Date": date
             }
-            absent_df.to_csv(ABSENT_FILE, index=False)
+            save_table(absent_df, ABSENT_FILE)
 
-        backup_to_drive()
+        request_backup()
 
         return redirect(url_for("operator_absenteeism"))
 
@@ -1452,50 +4908,488 @@ def operator_absenteeism():
         absent_summary=absent_summary   # ✅ NEW
     )
 
-DELETE_ABSENCE_CODE = "cati123"
+DELETE_ABSENCE_CODE = "cati123"
+
+@app.route("/transactions/absenteeism/delete", methods=["POST"])
+@write_locked(ABSENTEEISM_FILE)
+def delete_absence():
+    import pandas as pd
+    import os
+
+    code = request.form.get("code", "")
+    if code != DELETE_ABSENCE_CODE:
+        return "INVALID_CODE", 403
+
+    date = request.form.get("date")
+    operator = request.form.get("operator")
+
+    path = ABSENTEEISM_FILE
+
+    if not table_exists(path):
+        return "FILE_NOT_FOUND", 404
+
+    df = load_table(path)
+
+    before = len(df)
+
+    df = df[~(
+        (df["Date"] == date) &
+        (df["Operator"] == operator)
+    )]
+
+    after = len(df)
+
+    if before == after:
+        return "NOT_FOUND", 404
+
+    save_table(df, path)
+    request_backup()
+    return "OK", 200
+
+# =========================================
+# 🧮 REPORT RESULT CACHE
+# =========================================
+# Report computations (OEE per machine, utilization per machine-day,
+# operator productivity, ...) are memoized per process, keyed by
+# (report, normalized filters) and stamped with the data version of
+# the tables they read: the same report on unchanged data is served
+# without recomputing, and any write to those tables makes the next
+# request recompute it. The HTML reports and their Excel exports call
+# the same memoized functions, so they share one computed summary.
+import sys
+
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PRODUCTION_REPORT_TABLES = [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE, PART_MASTER_FILE]
+
+
+def result_nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(result_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def copy_result(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, pd.Index):
+        return value            # immutable
+    if isinstance(value, tuple):
+        return tuple(copy_result(v) for v in value)
+    return copy.deepcopy(value)
+
+
+class ReportCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (report, filters) -> (version, result, nbytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, report, filters, tables, compute):
+        key = (report, tuple(sorted(filters.items())))
+        version = data_version(*tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy_result(entry[1])
+            self.misses += 1
+
+        # ---------- COMPUTE OUTSIDE THE LOCK ----------
+        result = compute()
+        nbytes = result_nbytes(result)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (version, result, nbytes)
+                self.bytes += nbytes
+
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+        return copy_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+report_cache = ReportCache(REPORT_CACHE_MAX_BYTES)
+
+
+def memoized_report(report, tables):
+    """
+    Memoize a report computation called with keyword filters only.
+    Callers get their own copy of the result and may modify it.
+    """
+    def wrap(fn):
+        @wraps(fn)
+        def cached(**filters):
+            return report_cache.get(report, filters, tables, lambda: fn(**filters))
+        return cached
+    return wrap
+
+# =========================================
+# 🏷 CONDITIONAL GET (ETAG / LAST-MODIFIED)
+# =========================================
+# Read-only pages declare the tables they are computed from. Their ETag
+# hashes the path, the query args, today's date (pages default to the
+# current month), the app build and the data version of those tables,
+# so a browser revalidating an unchanged page gets a 304 before any
+# table is read. Last-Modified is the newest of those table changes,
+# midnight and the app build (CSV backend only: SQLite signatures carry
+# no time). Validators are taken before the page is computed, so a
+# write racing with it only costs the next request a full response.
+from datetime import date, timezone
+
+
+def app_build_mtime():
+    """Newest mtime of app.py and the templates (changes with a deploy)."""
+    folder = os.path.join(app.root_path, app.template_folder)
+    files = [os.path.abspath(__file__)] + [
+        os.path.join(folder, f) for f in os.listdir(folder)
+    ]
+    return max(os.path.getmtime(f) for f in files)
+
+
+APP_BUILD_MTIME = app_build_mtime()
+
+
+def response_validators(tables):
+    """(etag, last_modified or None) of the current request's page."""
+    sigs = table_signatures(*tables)
+    today = date.today()
+
+    key = (
+        request.path, sorted(request.args.items(multi=True)),
+        today.isoformat(), APP_BUILD_MTIME, sigs
+    )
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+    if not isinstance(storage, CsvStorage):
+        return etag, None
+
+    stamps = [sig[0] / 1e9 for _, sig in sigs if sig is not None]
+    stamps += [
+        APP_BUILD_MTIME,
+        datetime.combine(today, datetime.min.time()).timestamp()
+    ]
+    return etag, datetime.fromtimestamp(int(max(stamps)), timezone.utc)
+
+
+class ConditionalResponses:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.full = 0
+
+    def count(self, unchanged):
+        with self._lock:
+            if unchanged:
+                self.not_modified += 1
+            else:
+                self.full += 1
+
+    def stats(self):
+        with self._lock:
+            return {"not_modified": self.not_modified, "full": self.full}
+
+
+conditional_responses = ConditionalResponses()
+
+
+def conditional_get(*tables):
+    """
+    Route decorator: answer If-None-Match / If-Modified-Since with 304
+    while none of `tables` changed; tag full 200 responses.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = response_validators(tables)
+
+            if request.if_none_match:
+                unchanged = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                unchanged = (
+                    last_modified is not None and since is not None
+                    and last_modified <= since
+                )
+            conditional_responses.count(unchanged)
+
+            if unchanged:
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+# =========================================
+# 📄 SERVER-SIDE PAGING (LARGE LISTINGS)
+# =========================================
+# The daily production report and the stores registers render one page
+# of rows. The sort order of the whole result is a pre-sorted index of
+# row positions, memoized with the result's data version (see REPORT
+# RESULT CACHE); a page slices that index and only the visible rows are
+# turned into records. Totals are column sums over the whole result.
+#   ?page=N&page_size=100&sort=<key>   numbered pages
+#   ?cursor=<row>                      the page after that row, stable
+#                                      while new rows arrive
+# Sort keys come from a per-listing registry:
+#   key -> (label, columns, ascending)
+PAGE_SIZES = [50, 100, 250, 500]
+PAGE_SIZE_DEFAULT = 100
+
+# query args owned by the pager (everything else is kept in its links)
+PAGER_ARGS = ["page", "page_size", "sort", "cursor", "edit_ts"]
+
+
+def sort_positions(df, columns, ascending):
+    """Row positions of df in sort order (stable: ties keep table order)."""
+    return (
+        df.reset_index(drop=True)
+        .sort_values(columns, ascending=ascending, kind="stable")
+        .index
+    )
+
+
+def column_total(s):
+    """Sum of a numeric column for a totals row (whole numbers as int)."""
+    total = round(float(pd.to_numeric(s, errors="coerce").sum()), 2)
+    return int(total) if total.is_integer() else total
+
+
+def page_sort(args, sorts):
+    sort = args.get("sort", "")
+    return sort if sort in sorts else next(iter(sorts))
+
+
+def paginate(order, sorts, args, row=None):
+    """
+    Positions of the requested page (a slice of `order`) and the pager
+    template variables. row: show the page holding that row position
+    (an edit link) unless a page / cursor is asked for.
+    """
+    total = len(order)
+
+    page_size = args.get("page_size", PAGE_SIZE_DEFAULT, type=int)
+    if page_size not in PAGE_SIZES:
+        page_size = PAGE_SIZE_DEFAULT
+    pages = max((total + page_size - 1) // page_size, 1)
+
+    cursor = args.get("cursor", type=int)
+    page = args.get("page", type=int)
+    anchor = cursor if cursor is not None else (row if page is None else None)
+
+    loc = order.get_indexer([anchor])[0] if anchor is not None else -1
+    if loc >= 0 and cursor is not None:
+        start = loc + 1
+    elif loc >= 0:
+        start = loc - loc % page_size
+    else:
+        start = (min(max(page or 1, 1), pages) - 1) * page_size
+
+    stop = min(start + page_size, total)
+
+    def url(**changes):
+        kept = {k: v for k, v in args.items() if k not in PAGER_ARGS}
+        kept.update(sort=page_sort(args, sorts), page_size=page_size)
+        kept.update({k: v for k, v in changes.items() if v is not None})
+        return url_for(request.endpoint, **kept)
+
+    return order[start:stop], {
+        "total": total,
+        "first_row": start + 1 if stop > start else 0,
+        "last_row": stop,
+        "page": start // page_size + 1,
+        "pages": pages,
+        "page_size": page_size,
+        "page_sizes": PAGE_SIZES,
+        "sort": page_sort(args, sorts),
+        "sorts": [(key, spec[0]) for key, spec in sorts.items()],
+        "keep_args": [
+            (k, v) for k, v in args.items(multi=True) if k not in PAGER_ARGS
+        ],
+        "prev_url": url(page=max((start - 1) // page_size + 1, 1)) if start > 0 else None,
+        "next_url": url(cursor=int(order[stop - 1])) if stop < total else None,
+        "totals": []
+    }
+
+# =========================================
+# 🌊 STREAMED TABLE PAGES
+# =========================================
+# Pages whose table can run to tens of thousands of rows (the loss
+# detail table for "all" months) are rendered as a stream: the template
+# is fed a generator (frame_records) that turns the DataFrame into
+# records a chunk at a time, and the response is sent while it renders
+# (stream_page). The browser paints the header and filters at once and
+# the worker never holds the whole page or the whole list of records.
+# The daily report streams its page the same way. Headers (ETag, no-cache) go
+# out before the body, so an error halfway through only truncates the
+# page; validation happens before stream_page is called.
+STREAM_CHUNK_ROWS = 500
+
+# template output is flushed every this many rendered pieces
+STREAM_BUFFER = 256
+
+
+def frame_records(df, prepare=None, chunk=STREAM_CHUNK_ROWS):
+    """
+    Records of df, generated chunk by chunk. prepare(chunk_df) -> df
+    formats each chunk (display dates, renames) just before it is used.
+    """
+    for start in range(0, len(df), chunk):
+        part = df.iloc[start:start + chunk]
+        if prepare is not None:
+            part = prepare(part.copy())
+        yield from part.to_dict(orient="records")
+
+
+def stream_page(template_name, **context):
+    """render_template as a streamed response (see frame_records)."""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/html",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+# =========================================
+# REPORTS PAGE
+# =========================================
+
+# DAILY PRODUCTION REPORT
+
+@memoized_report("daily", PRODUCTION_REPORT_TABLES)
+def daily_rows(month, date, operator, part, operation):
+    """
+    Production rows of the daily report (page and export) with their
+    share of the operator's available time, filtered, unsorted.
+    None when the selected months have no production at all.
+    """
+    months = month_numbers(month)
+
+    df = None
+    if date and (months is None or pd.Timestamp(date).month in months):
+        # one day (available time is per operator-day): only its rows are read
+        df = get_production_facts(joined=False, days=(date, date))
+
+    if df is None or df.empty:
+        df = get_production_facts(joined=False, months=months)
+
+        if df.empty:
+            return None
+
+    # ---------------- AVAILABLE TIME (OPERATOR-DAY) ----------------
+    df["Operator_Available_Time"] = df["OT"].apply(
+        lambda x: 570 if str(x).strip().lower() == "yes" else 480
+    )
+
+    # ---------------- TOTAL OPERATOR TIME (PER DAY) ----------------
+    df["Operator_Total_Time"] = (
+        df.groupby(["Date", "Operator"])["Time_Min"]
+        .transform("sum")
+    )
+
+    # ---------------- PROPORTIONAL ALLOCATION ----------------
+    df["Available_Time"] = (
+        df["Time_Min"] / df["Operator_Total_Time"]
+    ) * df["Operator_Available_Time"]
+
+    df["Available_Time"] = df["Available_Time"].round(2)
 
-@app.route("/transactions/absenteeism/delete", methods=["POST"])
-def delete_absence():
-    import pandas as pd
-    import os
+    # Explicit, visible column for table
+    df["Time_Spent"] = df["Time_Min"].round(2)
 
-    code = request.form.get("code", "")
-    if code != DELETE_ABSENCE_CODE:
-        return "INVALID_CODE", 403
+    # ---------------- APPLY FILTERS ----------------
+    if month and month != "all":
+        df = df[df["Date"].dt.month == int(month)]
 
-    date = request.form.get("date")
-    operator = request.form.get("operator")
+    if date:
+        df = df[df["Date"] == pd.to_datetime(date)]
 
-    path = "data/operator_absenteeism.csv"
+    if operator:
+        df = df[df["Operator"] == operator]
 
-    if not os.path.exists(path):
-        return "FILE_NOT_FOUND", 404
+    if part:
+        df = df[df["Part"] == part]
 
-    df = pd.read_csv(path)
+    if operation:
+        df = df[df["Operation"] == operation]
 
-    before = len(df)
+    return df
 
-    df = df[~(
-        (df["Date"] == date) &
-        (df["Operator"] == operator)
-    )]
 
-    after = len(df)
+DAILY_SORTS = {
+    "date_desc": ("Newest first", ["Date", "Operator"], [False, True]),
+    "date_asc": ("Oldest first", ["Date", "Operator"], [True, True]),
+    "operator": ("Operator", ["Operator", "Date"], [True, False]),
+    "machine": ("Machine", ["Machine", "Date"], [True, False]),
+    "part": ("Part / operation", ["Part", "Operation", "Date"], [True, True, False]),
+    "good_qty": ("Good qty (highest first)", ["Good_Qty", "Date"], [False, False])
+}
 
-    if before == after:
-        return "NOT_FOUND", 404
+DAILY_TOTAL_COLUMNS = [
+    "Qty", "Cast_Rej", "Mach_Rej", "Good_Qty", "Available_Time", "Time_Spent"
+]
 
-    df.to_csv(path, index=False)
-    backup_to_drive()
-    return "OK", 200
 
-# =========================================
-# REPORTS PAGE
-# =========================================
+@memoized_report("daily_index", PRODUCTION_REPORT_TABLES)
+def daily_index(month, date, operator, part, operation, sort):
+    """
+    Pre-sorted index of daily_rows (row positions in `sort` order) and
+    the column totals of all its rows: (order, totals), or (None, None).
+    """
+    df = daily_rows(
+        month=month, date=date, operator=operator, part=part, operation=operation
+    )
+    if df is None:
+        return None, None
+
+    _, columns, ascending = DAILY_SORTS[sort]
+    totals = {col: column_total(df[col]) for col in DAILY_TOTAL_COLUMNS}
+
+    return sort_positions(df, columns, ascending), totals
 
-# DAILY PRODUCTION REPORT
 
 @app.route("/reports/daily", methods=["GET"])
+@conditional_get(*PRODUCTION_REPORT_TABLES)
 def reports_daily():
     import pandas as pd
     import os
@@ -1511,28 +5405,29 @@ def reports_daily():
     part_filter = request.args.get("part", "").strip()
     operation_filter = request.args.get("operation", "").strip()
 
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    # ---------------- LOAD DATA ----------------
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-
-    main_df["_source"] = "main"
-    other_df["_source"] = "other"
+    # ---------------- LOAD DATA (FILTERED, MEMOIZED) ----------------
+    # (only the selected month's partitions are read)
+    filtered_df = daily_rows(
+        month=selected_month,
+        date=selected_date,
+        operator=operator_filter,
+        part=part_filter,
+        operation=operation_filter
+    )
 
-    df = pd.concat([main_df, other_df], ignore_index=True)
+    # ---------------- FILTER DROPDOWNS (ALL MONTHS) ----------------
+    operators = sorted(production_values("Operator").tolist())
+    parts = sorted(production_values("Part").tolist())
+    operations = sorted(production_values("Operation").tolist())
 
-    if df.empty:
+    if filtered_df is None:
         return render_template(
             "reports_daily.html",
             active_report="daily",
             records=[],
-            operators=[],
-            parts=[],
-            operations=[],
+            operators=operators,
+            parts=parts,
+            operations=operations,
             months=[{"value": "all", "label": "All"}] + [
                 {"value": "01", "label": "January"},
                 {"value": "02", "label": "February"},
@@ -1554,77 +5449,36 @@ def reports_daily():
             operation_filter=operation_filter
         )
 
-    # ---------------- NORMALIZE TYPES ----------------
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Cast_Rej"] = pd.to_numeric(df["Cast_Rej"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Good_Qty"] = pd.to_numeric(df["Good_Qty"], errors="coerce").fillna(0)
-
-    # ---------------- AVAILABLE TIME (OPERATOR-DAY) ----------------
-    df["Operator_Available_Time"] = df["OT"].apply(
-        lambda x: 570 if str(x).strip().lower() == "yes" else 480
-    )
-
-    # ---------------- TOTAL OPERATOR TIME (PER DAY) ----------------
-    df["Operator_Total_Time"] = (
-        df.groupby(["Date", "Operator"])["Time_Min"]
-        .transform("sum")
-    )
-
-    # ---------------- PROPORTIONAL ALLOCATION ----------------
-    df["Available_Time"] = (
-        df["Time_Min"] / df["Operator_Total_Time"]
-    ) * df["Operator_Available_Time"]
-
-    df["Available_Time"] = df["Available_Time"].round(2)
-
-    # Explicit, visible column for table
-    df["Time_Spent"] = df["Time_Min"].round(2)
-
-    # ---------------- APPLY FILTERS ----------------
-    filtered_df = df.copy()
-
-    if selected_month != "all":
-        filtered_df = filtered_df[
-            filtered_df["Date"].dt.month == int(selected_month)
-        ]
-
-    if selected_date:
-        filtered_df = filtered_df[
-            filtered_df["Date"] == pd.to_datetime(selected_date)
-        ]
-
-    if operator_filter:
-        filtered_df = filtered_df[filtered_df["Operator"] == operator_filter]
-
-    if part_filter:
-        filtered_df = filtered_df[filtered_df["Part"] == part_filter]
-
-    if operation_filter:
-        filtered_df = filtered_df[filtered_df["Operation"] == operation_filter]
-
-    # ---------------- SORTING ----------------
-    filtered_df = filtered_df.sort_values(
-        by=["Date", "Operator"],
-        ascending=[False, True]
+    # ---------------- SORT + PAGE (PRE-SORTED INDEX, MEMOIZED) ----------------
+    sort = page_sort(request.args, DAILY_SORTS)
+    order, totals = daily_index(
+        month=selected_month,
+        date=selected_date,
+        operator=operator_filter,
+        part=part_filter,
+        operation=operation_filter,
+        sort=sort
     )
-
-    # ---------------- FORMAT DATE ----------------
-    # Logic date (used for delete, filters)
-    filtered_df["Date"] = filtered_df["Date"].dt.strftime("%Y-%m-%d")
-
-    # Display date (used only in UI)
-    filtered_df["Date_Display"] = pd.to_datetime(
-        filtered_df["Date"],
-        errors="coerce"
-    ).dt.strftime("%d-%m-%Y")
-
-    # ---------------- FILTER DROPDOWNS ----------------
-    operators = sorted(df["Operator"].dropna().unique().tolist())
-    parts = sorted(df["Part"].dropna().unique().tolist())
-    operations = sorted(df["Operation"].dropna().unique().tolist())
+    if order is None or len(order) != len(filtered_df):
+        # data changed between the two lookups: sort this copy directly
+        _, columns, ascending = DAILY_SORTS[sort]
+        order = sort_positions(filtered_df, columns, ascending)
+        totals = {col: column_total(filtered_df[col]) for col in DAILY_TOTAL_COLUMNS}
+
+    rows, pager = paginate(order, DAILY_SORTS, request.args)
+    filtered_df = filtered_df.iloc[rows]
+
+    # ---------------- FORMAT DATE (VISIBLE ROWS, PER CHUNK) ----------------
+    def display_rows(chunk):
+        # Logic date (used for delete, filters)
+        chunk["Date"] = chunk["Date"].dt.strftime("%Y-%m-%d")
+
+        # Display date (used only in UI)
+        chunk["Date_Display"] = pd.to_datetime(
+            chunk["Date"],
+            errors="coerce"
+        ).dt.strftime("%d-%m-%Y")
+        return chunk
 
     months = [{"value": "all", "label": "All"}] + [
         {"value": "01", "label": "January"},
@@ -1641,10 +5495,12 @@ def reports_daily():
         {"value": "12", "label": "December"},
     ]
 
-    return render_template(
+    return stream_page(
         "reports_daily.html",
         active_report="daily",
-        records=filtered_df.to_dict(orient="records"),
+        records=frame_records(filtered_df, prepare=display_rows),
+        pager=pager,
+        totals=totals,
         operators=operators,
         parts=parts,
         operations=operations,
@@ -1678,85 +5534,87 @@ def delete_daily_entry():
     req_time = float(request.form.get("Time_Min", 0))
     source = request.form.get("source")  # main / other
 
-    # ---------- DETERMINE SOURCE FILE ----------
-    prod_path = (
-        "data/production_main.csv"
+    # ---------- DETERMINE SOURCE FILE (MONTH PARTITION) ----------
+    month_key = partition_keys([req_date]).iloc[0]
+
+    prod_path = partition_path(
+        PRODUCTION_MAIN_FILE
         if source == "main"
-        else "data/production_other_machine.csv"
+        else PRODUCTION_OTHER_FILE,
+        month_key
     )
+    loss_path = partition_path(PRODUCTION_LOSS_FILE, month_key)
 
-    if not os.path.exists(prod_path):
+    if not table_exists(prod_path):
         return "FILE_NOT_FOUND", 404
 
-    prod_df = pd.read_csv(prod_path)
-
-    # ---------- NORMALIZE ----------
-    prod_df["Date"] = pd.to_datetime(
-        prod_df["Date"], errors="coerce"
-    ).dt.strftime("%Y-%m-%d")
-
-    prod_df["Time_Min"] = pd.to_numeric(
-        prod_df["Time_Min"], errors="coerce"
-    )
+    # read-modify-write of both partitions under their table locks
+    with files_locked([prod_path, loss_path]):
 
-    # ---------- MATCH PRODUCTION ENTRY SAFELY ----------
+        # Keys are matched as text, the values the report page posts back
+        # (same rule as delete_rows / update_rows). Before partitioning a
+        # typed read of the whole file decided it: a file whose Part (or
+        # Operator, Machine, ...) values were all numeric parsed them as
+        # int, nothing matched and the delete answered NOT_FOUND. Such
+        # entries are now deleted like any other.
+        prod_df = load_table(prod_path, dtype=str)
 
-    # Normalize request values
-    req_part = None if req_part in ["", "nan", None] else req_part
-    req_operation = None if req_operation in ["", "nan", None] else req_operation
+        # ---------- NORMALIZE (MATCH KEYS ONLY, ROWS ARE KEPT AS READ) ----------
+        prod_dates = pd.to_datetime(
+            prod_df["Date"], errors="coerce"
+        ).dt.strftime("%Y-%m-%d")
 
-    mask = (
-        (prod_df["Date"] == req_date) &
-        (prod_df["Operator"] == req_operator) &
-        (prod_df["Shift"] == req_shift) &
-        (prod_df["Machine"] == req_machine) &
-        (
-            (prod_df["Part"] == req_part) |
-            (prod_df["Part"].isna() & (req_part is None))
-        ) &
-        (
-            (prod_df["Operation"] == req_operation) |
-            (prod_df["Operation"].isna() & (req_operation is None))
+        # ---------- MATCH PRODUCTION ENTRY SAFELY ----------
+
+        # Normalize request values
+        req_part = None if req_part in ["", "nan", None] else req_part
+        req_operation = None if req_operation in ["", "nan", None] else req_operation
+
+        mask = (
+            (prod_dates == req_date) &
+            (prod_df["Operator"] == req_operator) &
+            (prod_df["Shift"] == req_shift) &
+            (prod_df["Machine"] == req_machine) &
+            (
+                (prod_df["Part"] == req_part) |
+                (prod_df["Part"].isna() & (req_part is None))
+            ) &
+            (
+                (prod_df["Operation"] == req_operation) |
+                (prod_df["Operation"].isna() & (req_operation is None))
+            )
         )
-    )
-
-    before = len(prod_df)
-    prod_df = prod_df[~mask]
-    after = len(prod_df)
 
-    if before == after:
-        return "NOT_FOUND", 404
-
-    # ---------- SAVE PRODUCTION FILE ----------
-    prod_df.to_csv(prod_path, index=False)
-
-    # =====================================================
-    # 🔥 ALSO DELETE RELATED LOSS ENTRIES (CRITICAL FIX)
-    # =====================================================
-    LOSS_FILE = "data/production_loss.csv"
+        if not mask.any():
+            return "NOT_FOUND", 404
 
-    if os.path.exists(LOSS_FILE) and os.path.getsize(LOSS_FILE) > 0:
-        loss_df = pd.read_csv(LOSS_FILE)
+        # ---------- SAVE PRODUCTION FILE ----------
+        # (facts + daily rollup drop just these rows, see filter_table)
+        filter_table(prod_df, ~mask, prod_path)
 
-        loss_df["Date"] = pd.to_datetime(
-            loss_df["Date"], errors="coerce"
-        ).dt.strftime("%Y-%m-%d")
+        # =====================================================
+        # 🔥 ALSO DELETE RELATED LOSS ENTRIES (CRITICAL FIX)
+        # =====================================================
+        LOSS_FILE = loss_path
 
-        before_loss = len(loss_df)
+        if not table_is_blank(LOSS_FILE):
+            loss_df = load_table(LOSS_FILE, dtype=str)
 
-        loss_df = loss_df[~(
-            (loss_df["Date"] == req_date) &
-            (loss_df["Operator"] == req_operator) &
-            (loss_df["Shift"] == req_shift) &
-            (loss_df["Machine"] == req_machine)
-        )]
+            loss_dates = pd.to_datetime(
+                loss_df["Date"], errors="coerce"
+            ).dt.strftime("%Y-%m-%d")
 
-        after_loss = len(loss_df)
+            loss_mask = (
+                (loss_dates == req_date) &
+                (loss_df["Operator"] == req_operator) &
+                (loss_df["Shift"] == req_shift) &
+                (loss_df["Machine"] == req_machine)
+            )
 
-        if before_loss != after_loss:
-            loss_df.to_csv(LOSS_FILE, index=False)
+            if loss_mask.any():
+                filter_table(loss_df, ~loss_mask, LOSS_FILE)
 
-    return "OK", 200
+        return "OK", 200
 
 # =====================================================
 # EXPORT DAILY PRODUCTION REPORT TO EXCEL (PROFESSIONAL)
@@ -1764,81 +5622,33 @@ def delete_daily_entry():
 
 @app.route("/reports/daily/export", methods=["GET"])
 def export_daily_excel():
+    return send_report_export("daily", request.args)
+
+
+def build_daily_export(filters):
 
     import pandas as pd
     import os
     import io
-    from flask import send_file, request
 
     # ================= FILTERS =================
-    selected_month = request.args.get("month", "").strip()
-    selected_date = request.args.get("date", "").strip()
-    operator_filter = request.args.get("operator", "").strip()
-    part_filter = request.args.get("part", "").strip()
-    operation_filter = request.args.get("operation", "").strip()
-
-    # ================= LOAD FILES =================
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-
-    main_df["_source"] = "main"
-    other_df["_source"] = "other"
-
-    df = pd.concat([main_df, other_df], ignore_index=True)
-
-    if df.empty:
-        return "No data available"
-
-    # ================= NORMALIZE =================
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Cast_Rej"] = pd.to_numeric(df["Cast_Rej"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Good_Qty"] = pd.to_numeric(df["Good_Qty"], errors="coerce").fillna(0)
-
-    # ================= AVAILABLE TIME =================
-    df["Operator_Available_Time"] = df["OT"].apply(
-        lambda x: 570 if str(x).strip().lower() == "yes" else 480
-    )
-
-    df["Operator_Total_Time"] = (
-        df.groupby(["Date", "Operator"])["Time_Min"].transform("sum")
+    selected_month = filters["month"].strip()
+    selected_date = filters["date"].strip()
+    operator_filter = filters["operator"].strip()
+    part_filter = filters["part"].strip()
+    operation_filter = filters["operation"].strip()
+
+    # ================= LOAD + FILTER (SHARED WITH THE PAGE) =================
+    filtered_df = daily_rows(
+        month=selected_month,
+        date=selected_date,
+        operator=operator_filter,
+        part=part_filter,
+        operation=operation_filter
     )
 
-    df["Available_Time"] = (
-        df["Time_Min"] / df["Operator_Total_Time"]
-    ) * df["Operator_Available_Time"]
-
-    df["Available_Time"] = df["Available_Time"].round(2)
-    df["Time_Spent"] = df["Time_Min"].round(2)
-
-    # ================= APPLY FILTERS =================
-    filtered_df = df.copy()
-
-    if selected_month and selected_month != "all":
-        filtered_df = filtered_df[
-            filtered_df["Date"].dt.month == int(selected_month)
-        ]
-
-    if selected_date:
-        filtered_df = filtered_df[
-            filtered_df["Date"] == pd.to_datetime(selected_date)
-        ]
-
-    if operator_filter:
-        filtered_df = filtered_df[filtered_df["Operator"] == operator_filter]
-
-    if part_filter:
-        filtered_df = filtered_df[filtered_df["Part"] == part_filter]
-
-    if operation_filter:
-        filtered_df = filtered_df[filtered_df["Operation"] == operation_filter]
+    if filtered_df is None:
+        return "No data available"
 
     if filtered_df.empty:
         return "No data after filters"
@@ -1885,10 +5695,10 @@ def export_daily_excel():
 
     fname += ".xlsx"
 
-    # ================= CREATE EXCEL IN MEMORY =================
-    output = io.BytesIO()
+    # ================= CREATE EXCEL (CONSTANT MEMORY, STREAMED) =================
+    path = export_temp_path()
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with excel_writer(path) as writer:
 
         # MAIN REPORT SHEET
         create_professional_excel(
@@ -1901,135 +5711,56 @@ def export_daily_excel():
 
         # RAW DATA SHEET
         raw_df = filtered_df.copy()
-        raw_df.to_excel(writer, sheet_name="Raw Data", index=False)
-
-    output.seek(0)
+        write_raw_sheet(writer, "Raw Data", raw_df)
 
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    return path, fname
 
 # OPERATOR PERFORMANCE REPORT
 
-@app.route("/reports/operator", methods=["GET"])
-def reports_operator():
-    import pandas as pd
-    import os
-
-    # ---------- LOAD FILES ----------
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-    part_df = load("data/part_master.csv")
-    absent_df = load("data/operator_absenteeism.csv")
-
-    # ---------- MASTER DATE RANGE (IMPORTANT) ----------
-    all_prod_df = pd.concat([main_df, other_df], ignore_index=True)
-
-    if not all_prod_df.empty:
-        all_prod_df["Date"] = pd.to_datetime(all_prod_df["Date"], errors="coerce")
-        global_start = all_prod_df["Date"].min()
-        global_end = all_prod_df["Date"].max()
-    else:
-        global_start = None
-        global_end = None
-
-    operator_filter = request.args.get("operator", "").strip()
-    
-    from datetime import datetime
-
-    month_filter = request.args.get("month", "").strip()
-
-    # ✅ Default to current month if nothing selected
-    if not month_filter:
-        month_filter = datetime.today().strftime("%m")
+@memoized_report("operator", PRODUCTION_REPORT_TABLES + [ABSENTEEISM_FILE])
+def operator_summary(month, operator, year=None):
+    """
+    Per-operator quantity, quality and productivity (page and export).
+    Productivity is averaged over a date grid: the whole month of
+    `year` when one is given (the page), else the days the filtered
+    production spans (the export). Absent days count as 0 %.
+
+    Returns (message, summary, operators): message says why there is
+    nothing to show (None otherwise), operators are the ones present
+    after filtering (for the dropdown).
+    """
+    # (daily rollup of the typed facts, see get_production_rollup;
+    #  only the selected month's partitions are read)
+    prod_df = get_production_rollup(months=month_numbers(month))
+    absent_df = load_table(ABSENTEEISM_FILE)
 
-    prod_df = pd.concat([main_df, other_df], ignore_index=True)
+    if prod_df.empty:
+        return "No data to export", None, None
 
     # ---------- NORMALIZE DATE ----------
-    prod_df["Date"] = pd.to_datetime(prod_df["Date"], errors="coerce")
-
     if not absent_df.empty:
         absent_df["Date"] = pd.to_datetime(absent_df["Date"], errors="coerce")
 
     # ---------- MONTH FILTER ----------
-    if month_filter != "all":
-        prod_df = prod_df[prod_df["Date"].dt.month == int(month_filter)]
+    if month != "all":
+        prod_df = prod_df[prod_df["Date"].dt.month == int(month)]
         if not absent_df.empty:
-            absent_df = absent_df[absent_df["Date"].dt.month == int(month_filter)]
+            absent_df = absent_df[absent_df["Date"].dt.month == int(month)]
 
     # ---------- OPERATOR FILTER ----------
-    if operator_filter:
-        prod_df = prod_df[prod_df["Operator"] == operator_filter]
+    if operator:
+        prod_df = prod_df[prod_df["Operator"] == operator]
 
-    # 🔴 HARD EXIT: NO DATA FOR MONTH
     if prod_df.empty:
-        return render_template(
-            "reports_operator.html",
-            active_report="operator",
-            records=[],
-            operators=sorted(
-                pd.concat([main_df, other_df])["Operator"]
-                .dropna().unique().tolist()
-            ),
-            operator_filter=operator_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": f"{i:02d}", "label": m}
-                for i, m in enumerate(
-                    ["January","February","March","April","May","June",
-                    "July","August","September","October","November","December"], 1
-                )
-            ],
-            no_data_msg="No operator performance data available for the selected month."
-        )
-
-    # ---------- MERGE CYCLE TIME ----------
-    df = prod_df.merge(
-        part_df,
-        left_on=["Part", "Operation"],
-        right_on=["Part Number", "Operation No"],
-        how="left"
-    )
+        return "No data after filters", None, None
 
-    # ---------- SAFE NUMERIC ----------
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Cycle Time (min)"] = pd.to_numeric(
-        df["Cycle Time (min)"], errors="coerce"
-    ).fillna(0)
+    operators = sorted(prod_df["Operator"].dropna().unique().tolist())
 
-    df = df[(df["Time_Min"] > 0) & (df["Cycle Time (min)"] > 0)]
+    # ---------- VALID ROWS (TIME + CYCLE TIME, FLAGGED IN THE ROLLUP) ----------
+    df = prod_df[prod_df["_valid"]]
 
-    # 🔴 HARD EXIT: NOTHING VALID
     if df.empty:
-        return render_template(
-            "reports_operator.html",
-            active_report="operator",
-            records=[],
-            operators=sorted(prod_df["Operator"].dropna().unique().tolist()),
-            operator_filter=operator_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": f"{i:02d}", "label": m}
-                for i, m in enumerate(
-                    ["January","February","March","April","May","June",
-                    "July","August","September","October","November","December"], 1
-                )
-            ],
-            no_data_msg="No operator performance data available for the selected month."
-        )
-
-    # ---------- EXPECTED QTY ----------
-    df["Expected_Qty"] = df["Time_Min"] / df["Cycle Time (min)"]
+        return "No valid rows", None, operators
 
     # ---------- DAILY PRODUCTION ----------
     daily_prod = (
@@ -2046,25 +5777,25 @@ def reports_operator():
         (daily_prod["Actual_Qty"] / daily_prod["Expected_Qty"]) * 100
     ).replace([float("inf"), -float("inf")], 0)
 
-    # ---------- DATE GRID (FINAL CORRECT LOGIC) ----------
-    operators = daily_prod["Operator"].unique()
+    # ---------- DATE GRID ----------
+    operators_done = daily_prod["Operator"].unique()
 
-    if month_filter and month_filter != "all":
-        year = datetime.today().year
-        month = int(month_filter)
+    if year is None:
+        start_date = daily_prod["Date"].min()
+        end_date = daily_prod["Date"].max()
 
-        start_date = pd.Timestamp(year=year, month=month, day=1)
+    elif month != "all":
+        start_date = pd.Timestamp(year=year, month=int(month), day=1)
         end_date = start_date + pd.offsets.MonthEnd(1)
 
     else:
         # full available production range (ALL operators)
-        start_date = global_start
-        end_date = global_end
+        start_date, end_date = production_date_range()
 
     all_dates = pd.date_range(start=start_date, end=end_date, freq="D")
 
     grid = pd.MultiIndex.from_product(
-        [operators, all_dates],
+        [operators_done, all_dates],
         names=["Operator", "Date"]
     ).to_frame(index=False)
 
@@ -2074,7 +5805,7 @@ def reports_operator():
         how="left"
     )
 
-    # ---------- APPLY ABSENT LOGIC (CORRECT) ----------
+    # ---------- APPLY ABSENT LOGIC ----------
     grid["Absent"] = 0
 
     if not absent_df.empty:
@@ -2128,6 +5859,54 @@ def reports_operator():
     # ---------- FINAL MERGE ----------
     summary = quality.merge(productivity, on="Operator", how="left")
 
+    return None, summary, operators
+
+
+@app.route("/reports/operator", methods=["GET"])
+@conditional_get(*PRODUCTION_REPORT_TABLES, ABSENTEEISM_FILE)
+def reports_operator():
+    import pandas as pd
+    import os
+
+    operator_filter = request.args.get("operator", "").strip()
+    
+    from datetime import datetime
+
+    month_filter = request.args.get("month", "").strip()
+
+    # ✅ Default to current month if nothing selected
+    if not month_filter:
+        month_filter = datetime.today().strftime("%m")
+
+    # ---------- SUMMARY (MEMOIZED, SHARED WITH THE EXPORT) ----------
+    message, summary, operators = operator_summary(
+        month=month_filter,
+        operator=operator_filter,
+        year=datetime.today().year
+    )
+
+    # 🔴 HARD EXIT: NO DATA FOR MONTH / NOTHING VALID
+    if message:
+        return render_template(
+            "reports_operator.html",
+            active_report="operator",
+            records=[],
+            operators=(
+                operators if operators is not None
+                else sorted(production_values("Operator").tolist())
+            ),
+            operator_filter=operator_filter,
+            selected_month=month_filter,
+            months=[{"value": "all", "label": "All"}] + [
+                {"value": f"{i:02d}", "label": m}
+                for i, m in enumerate(
+                    ["January","February","March","April","May","June",
+                    "July","August","September","October","November","December"], 1
+                )
+            ],
+            no_data_msg="No operator performance data available for the selected month."
+        )
+
     # ---------- FINAL FORMATTING ----------
     summary["Expected_Qty"] = summary["Expected_Qty"].round(0).astype(int)
     summary["Total_Time_Min"] = summary["Total_Time_Min"].round(2)
@@ -2141,7 +5920,7 @@ def reports_operator():
         "reports_operator.html",
         active_report="operator",
         records=summary.to_dict(orient="records"),
-        operators=sorted(prod_df["Operator"].dropna().unique().tolist()),
+        operators=operators,
         operator_filter=operator_filter,
         selected_month=month_filter,
         months=[{"value": "all", "label": "All"}] + [
@@ -2159,154 +5938,49 @@ def reports_operator():
 
 @app.route("/export/operator", methods=["GET"])
 def export_operator_report():
+    return send_report_export("operator", request.args)
+
+
+def build_operator_export(filters):
 
     import pandas as pd
     import io
     import os
-    from flask import send_file, request
 
     # ================= FILTERS =================
-    operator_filter = request.args.get("operator", "").strip()
+    operator_filter = filters["operator"].strip()
     from datetime import datetime
 
-    month_filter = request.args.get("month", "").strip()
+    month_filter = filters["month"].strip()
 
     # ✅ Default to current month if nothing selected
     if not month_filter:
         month_filter = datetime.today().strftime("%m")
 
-    # ================= LOAD FILES =================
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-    part_df = load("data/part_master.csv")
-    absent_df = load("data/operator_absenteeism.csv")
+    # ================= SUMMARY (SHARED WITH THE PAGE) =================
+    message, summary, _ = operator_summary(month=month_filter, operator=operator_filter)
 
-    prod_df = pd.concat([main_df, other_df], ignore_index=True)
+    if message:
+        return message
 
-    if prod_df.empty:
-        return "No data to export"
-
-    prod_df["Date"] = pd.to_datetime(prod_df["Date"], errors="coerce")
-
-    if not absent_df.empty:
-        absent_df["Date"] = pd.to_datetime(absent_df["Date"], errors="coerce")
+    # ================= RAW ROWS (CYCLE TIME FROM FACTS) =================
+    df = get_production_facts(source=False, months=month_numbers(month_filter))
 
-    # ================= FILTER APPLY =================
     if month_filter and month_filter != "all":
-        prod_df = prod_df[prod_df["Date"].dt.month == int(month_filter)]
-        if not absent_df.empty:
-            absent_df = absent_df[absent_df["Date"].dt.month == int(month_filter)]
+        df = df[df["Date"].dt.month == int(month_filter)]
 
     if operator_filter:
-        prod_df = prod_df[prod_df["Operator"] == operator_filter]
-
-    if prod_df.empty:
-        return "No data after filters"
-
-    # ================= MERGE CYCLE TIME =================
-    df = prod_df.merge(
-        part_df,
-        left_on=["Part", "Operation"],
-        right_on=["Part Number", "Operation No"],
-        how="left"
-    )
-
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Cycle Time (min)"] = pd.to_numeric(df["Cycle Time (min)"], errors="coerce").fillna(0)
+        df = df[df["Operator"] == operator_filter]
 
     df = df[(df["Time_Min"] > 0) & (df["Cycle Time (min)"] > 0)]
-    df["Expected_Qty"] = df["Time_Min"] / df["Cycle Time (min)"]
-
-    # ================= DAILY PROD =================
-    daily_prod = (
-        df.groupby(["Operator", "Date"], as_index=False)
-        .agg(
-            Actual_Qty=("Qty", "sum"),
-            Expected_Qty=("Expected_Qty", "sum"),
-            Mach_Rej=("Mach_Rej", "sum"),
-            Time_Min=("Time_Min", "sum")
-        )
-    )
-
-    daily_prod["Daily_Productivity"] = (
-        (daily_prod["Actual_Qty"] / daily_prod["Expected_Qty"]) * 100
-    ).replace([float("inf"), -float("inf")], 0)
-
-    operators = daily_prod["Operator"].unique()
-    start_date = daily_prod["Date"].min()
-    end_date = daily_prod["Date"].max()
-    all_dates = pd.date_range(start=start_date, end=end_date, freq="D")
-
-    grid = pd.MultiIndex.from_product(
-        [operators, all_dates],
-        names=["Operator", "Date"]
-    ).to_frame(index=False)
-
-    grid = grid.merge(
-        daily_prod[["Operator", "Date", "Daily_Productivity"]],
-        on=["Operator", "Date"],
-        how="left"
-    )
-
-    grid["Absent"] = 0
-
-    if not absent_df.empty:
-        absent_df["Absent"] = 1
-        grid = grid.merge(
-            absent_df[["Operator", "Date", "Absent"]],
-            on=["Operator", "Date"],
-            how="left",
-            suffixes=("", "_y")
-        )
-        grid["Absent"] = grid["Absent_y"].fillna(grid["Absent"])
-        grid.drop(columns=["Absent_y"], inplace=True)
-
-    def final_productivity(row):
-        if row["Absent"] == 1:
-            return 0
-        if pd.isna(row["Daily_Productivity"]):
-            return None
-        return row["Daily_Productivity"]
-
-    grid["Final_Productivity"] = grid.apply(final_productivity, axis=1)
-
-    productivity = (
-        grid.dropna(subset=["Final_Productivity"])
-        .groupby("Operator", as_index=False)
-        .agg({"Final_Productivity": "mean"})
-    )
-
-    productivity.rename(columns={"Final_Productivity": "Productivity (%)"}, inplace=True)
-
-    # ================= QUALITY =================
-    quality = (
-        df.groupby("Operator", as_index=False)
-        .agg(
-            Actual_Qty=("Qty", "sum"),
-            Mach_Rej=("Mach_Rej", "sum"),
-            Total_Time=("Time_Min", "sum"),
-            Expected_Qty=("Expected_Qty", "sum")
-        )
-    )
-
-    quality["Quality (%)"] = (
-        (1 - (quality["Mach_Rej"] / quality["Actual_Qty"])) * 100
-    ).replace([float("inf"), -float("inf")], 0).fillna(0)
-
-    summary = quality.merge(productivity, on="Operator", how="left")
 
     summary.rename(columns={
         "Operator":"Operator Name",
-        "Total_Time":"Total Time (mins.)",
+        "Total_Time_Min":"Total Time (mins.)",
         "Actual_Qty":"Actual Produced Qty.",
-        "Expected_Qty":"Expected Qty."
+        "Expected_Qty":"Expected Qty.",
+        "Quality_%":"Quality (%)",
+        "Productivity_%":"Productivity (%)"
     }, inplace=True)
 
     summary["Productivity (%)"] = summary["Productivity (%)"].round(2)
@@ -2325,9 +5999,9 @@ def export_operator_report():
     fname += ".xlsx"
 
     # ================= BUILD EXCEL =================
-    output = io.BytesIO()
+    path = export_temp_path()
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with excel_writer(path) as writer:
 
         create_professional_excel(
             writer=writer,
@@ -2338,145 +6012,50 @@ def export_operator_report():
         )
 
         # RAW DATA
-        df.to_excel(writer, sheet_name="Raw Data", index=False)
+        write_raw_sheet(writer, "Raw Data", df)
 
-    output.seek(0)
-
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    return path, fname
 
 # MACHINE WISE OEE REPORT
 
-@app.route("/reports/oee", methods=["GET"])
-def reports_oee():
-    import pandas as pd
-    import os
-
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    # ---------- LOAD DATA ----------
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-    part_df = load("data/part_master.csv")
-
-    df = pd.concat([main_df, other_df], ignore_index=True)
-
-    # ---------- FILTER VALUES ----------
-    machine_filter = request.args.get("machine", "").strip()
-    from datetime import datetime
-
-    month_filter = request.args.get("month", "").strip()
-
-    # ✅ Default to current month if nothing selected
-    if not month_filter:
-        month_filter = datetime.today().strftime("%m")
+@memoized_report("oee", PRODUCTION_REPORT_TABLES)
+def oee_summary(month, machine):
+    """
+    Per-machine availability, performance, quality and OEE (page and
+    export). Returns (message, summary): message says why there is
+    nothing to show, None otherwise.
+    """
+    # (daily rollup, only the selected month's partitions are read)
+    df = get_production_rollup(months=month_numbers(month))
+    part_df = load_table(PART_MASTER_FILE)
 
     if df.empty or part_df.empty:
-        return render_template(
-            "reports_oee.html",
-            active_report="oee",
-            records=[],
-            machines=[],
-            machine_filter=machine_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": f"{i:02d}", "label": m}
-                for i, m in enumerate(
-                    ["January","February","March","April","May","June",
-                    "July","August","September","October","November","December"], 1
-                )
-            ]
-        )
-
-    # ---------- NORMALIZE ----------
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Machine"] = df["Machine"].astype(str).str.strip()
+        return "No data", None
 
     # ---------- MONTH FILTER ----------
-    if month_filter != "all":
-        df = df[df["Date"].dt.month == int(month_filter)]
+    if month != "all":
+        df = df[df["Date"].dt.month == int(month)]
 
     # ---------- MACHINE FILTER ----------
-    if machine_filter:
-        df = df[df["Machine"] == machine_filter]
+    if machine:
+        df = df[df["Machine"] == machine]
 
     if df.empty:
-        return render_template(
-            "reports_oee.html",
-            active_report="oee",
-            records=[],
-            machines=sorted(
-                pd.concat([main_df, other_df])["Machine"]
-                .dropna().astype(str).str.strip().unique().tolist()
-            ),
-            machine_filter=machine_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": f"{i:02d}", "label": m}
-                for i, m in enumerate(
-                    ["January","February","March","April","May","June",
-                    "July","August","September","October","November","December"], 1
-                )
-            ]
-        )
-
-    # ---------- MERGE CYCLE TIME ----------
-    df = df.merge(
-        part_df,
-        left_on=["Part", "Operation"],
-        right_on=["Part Number", "Operation No"],
-        how="left"
-    )
+        return "No data after filters", None
 
-    df["Cycle Time (min)"] = pd.to_numeric(
-        df["Cycle Time (min)"], errors="coerce"
-    ).fillna(0)
-
-    # Ignore invalid rows
-    df = df[(df["Time_Min"] > 0) & (df["Cycle Time (min)"] > 0)]
+    # Ignore invalid rows (Time_Min and cycle time > 0, see build_rollup)
+    df = df[df["_valid"]]
 
     if df.empty:
-        return render_template(
-            "reports_oee.html",
-            active_report="oee",
-            records=[],
-            machines=sorted(
-                pd.concat([main_df, other_df])["Machine"]
-                .dropna().astype(str).str.strip().unique().tolist()
-            ),
-            machine_filter=machine_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": f"{i:02d}", "label": m}
-                for i, m in enumerate(
-                    ["January","February","March","April","May","June",
-                    "July","August","September","October","November","December"], 1
-                )
-            ]
-        )
-
-    # ---------- EXPECTED QTY ----------
-    df["Expected_Qty"] = df["Time_Min"] / df["Cycle Time (min)"]
+        return "No valid rows", None
 
     # ---------- AVAILABLE TIME ----------
     machine_day_time = (
         df.groupby(["Date", "Shift", "Machine"], as_index=False)
-        .agg(
-            Available_Time=(
-                "OT",
-                lambda x: 570 if (x.astype(str).str.lower() == "yes").any() else 480
-            )
-        )
+        .agg(OT_Yes=("OT_Yes", "sum"))
+    )
+    machine_day_time["Available_Time"] = (
+        machine_day_time["OT_Yes"].gt(0).map({True: 570, False: 480})
     )
 
     available_time = (
@@ -2521,16 +6100,50 @@ def reports_oee():
     for col in ["Availability_%", "Performance_%", "Quality_%", "OEE_%"]:
         summary[col] = summary[col].round(2)
 
-    summary = summary.sort_values("Machine")
+    return None, summary.sort_values("Machine")
+
+
+@app.route("/reports/oee", methods=["GET"])
+@conditional_get(*PRODUCTION_REPORT_TABLES)
+def reports_oee():
+    import pandas as pd
+    import os
+
+    # ---------- FILTER VALUES ----------
+    machine_filter = request.args.get("machine", "").strip()
+    from datetime import datetime
+
+    month_filter = request.args.get("month", "").strip()
+
+    # ✅ Default to current month if nothing selected
+    if not month_filter:
+        month_filter = datetime.today().strftime("%m")
+
+    # ---------- SUMMARY (MEMOIZED, SHARED WITH THE EXPORT) ----------
+    message, summary = oee_summary(month=month_filter, machine=machine_filter)
+
+    if message:
+        return render_template(
+            "reports_oee.html",
+            active_report="oee",
+            records=[],
+            machines=sorted(production_values("Machine").tolist()),
+            machine_filter=machine_filter,
+            selected_month=month_filter,
+            months=[{"value": "all", "label": "All"}] + [
+                {"value": f"{i:02d}", "label": m}
+                for i, m in enumerate(
+                    ["January","February","March","April","May","June",
+                    "July","August","September","October","November","December"], 1
+                )
+            ]
+        )
 
     return render_template(
         "reports_oee.html",
         active_report="oee",
         records=summary.to_dict(orient="records"),
-        machines=sorted(
-            pd.concat([main_df, other_df])["Machine"]
-            .dropna().astype(str).str.strip().unique().tolist()
-        ),
+        machines=sorted(production_values("Machine").tolist()),
         machine_filter=machine_filter,
         selected_month=month_filter,
         months=[{"value": "all", "label": "All"}] + [
@@ -2548,111 +6161,48 @@ def reports_oee():
 
 @app.route("/export/oee", methods=["GET"])
 def export_oee_report():
+    return send_report_export("oee", request.args)
+
+
+def build_oee_export(filters):
 
     import pandas as pd
     import io
     import os
-    from flask import send_file, request
 
     # ================= FILTERS =================
-    machine_filter = request.args.get("machine", "").strip()
+    machine_filter = filters["machine"].strip()
     from datetime import datetime
 
-    month_filter = request.args.get("month", "").strip()
+    month_filter = filters["month"].strip()
 
     # ✅ Default to current month if nothing selected
     if not month_filter:
         month_filter = datetime.today().strftime("%m")
 
-    # ================= LOAD =================
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-    part_df = load("data/part_master.csv")
-
-    df = pd.concat([main_df, other_df], ignore_index=True)
-
-    if df.empty or part_df.empty:
-        return "No data"
-
-    # ================= NORMALIZE =================
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Qty"] = pd.to_numeric(df["Qty"], errors="coerce").fillna(0)
-    df["Mach_Rej"] = pd.to_numeric(df["Mach_Rej"], errors="coerce").fillna(0)
-    df["Machine"] = df["Machine"].astype(str).str.strip()
-
-    # ================= FILTER =================
-    if month_filter != "all":
-        df = df[df["Date"].dt.month == int(month_filter)]
-
-    if machine_filter:
-        df = df[df["Machine"] == machine_filter]
-
-    if df.empty:
-        return "No data after filters"
-
-    # ================= MERGE CYCLE =================
-    df = df.merge(
-        part_df,
-        left_on=["Part","Operation"],
-        right_on=["Part Number","Operation No"],
-        how="left"
-    )
-
-    df["Cycle Time (min)"] = pd.to_numeric(df["Cycle Time (min)"], errors="coerce").fillna(0)
-    df = df[(df["Time_Min"] > 0) & (df["Cycle Time (min)"] > 0)]
-
-    if df.empty:
-        return "No valid rows"
-
-    df["Expected_Qty"] = df["Time_Min"] / df["Cycle Time (min)"]
-
-    # ================= AVAILABLE =================
-    machine_day_time = (
-        df.groupby(["Date","Shift","Machine"], as_index=False)
-        .agg(
-            Available_Time=(
-                "OT",
-                lambda x: 570 if (x.astype(str).str.lower()=="yes").any() else 480
-            )
-        )
-    )
+    # ================= SUMMARY (SHARED WITH THE PAGE) =================
+    message, summary = oee_summary(month=month_filter, machine=machine_filter)
 
-    available_time = (
-        machine_day_time.groupby("Machine",as_index=False)["Available_Time"].sum()
-    )
+    if message:
+        return message
 
-    # ================= SUMMARY =================
-    summary = (
-        df.groupby("Machine",as_index=False)
-        .agg(
-            Time_Spent=("Time_Min","sum"),
-            Produced_Qty=("Qty","sum"),
-            Expected_Qty=("Expected_Qty","sum"),
-            Mach_Rejection=("Mach_Rej","sum")
-        )
-    )
+    summary.rename(columns={
+        "Availability_%":"Availability (%)",
+        "Performance_%":"Performance (%)",
+        "Quality_%":"Quality (%)",
+        "OEE_%":"OEE (%)"
+    }, inplace=True)
 
-    summary = summary.merge(available_time,on="Machine",how="left")
+    # ================= RAW ROWS (CYCLE FROM FACTS) =================
+    df = get_production_facts(source=False, months=month_numbers(month_filter))
 
-    summary["Availability (%)"] = (summary["Time_Spent"]/summary["Available_Time"])*100
-    summary["Performance (%)"] = (summary["Produced_Qty"]/summary["Expected_Qty"])*100
-    summary["Quality (%)"] = (1-(summary["Mach_Rejection"]/summary["Produced_Qty"]))*100
-    summary["OEE (%)"] = (
-        summary["Availability (%)"]
-        * summary["Performance (%)"]
-        * summary["Quality (%)"] / 10000
-    )
+    if month_filter != "all":
+        df = df[df["Date"].dt.month == int(month_filter)]
 
-    for c in ["Availability (%)","Performance (%)","Quality (%)","OEE (%)"]:
-        summary[c] = summary[c].round(2)
+    if machine_filter:
+        df = df[df["Machine"] == machine_filter]
 
-    summary = summary.sort_values("Machine")
+    df = df[(df["Time_Min"] > 0) & (df["Cycle Time (min)"] > 0)]
 
     # ================= FILTER TEXT =================
     filters=[]
@@ -2667,9 +6217,9 @@ def export_oee_report():
     fname+=".xlsx"
 
     # ================= EXCEL =================
-    output = io.BytesIO()
+    path = export_temp_path()
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with excel_writer(path) as writer:
 
         # MAIN REPORT
         create_professional_excel(
@@ -2685,7 +6235,7 @@ def export_oee_report():
 
         # -------- chart data --------
         chart_sheet.write_row("A1", ["Machine","OEE"])
-        for i,r in summary.iterrows():
+        for i,(_,r) in enumerate(summary.sort_index().iterrows()):
             chart_sheet.write_row(i+1,0,[r["Machine"],r["OEE (%)"]])
 
         chart = workbook.add_chart({"type":"column"})
@@ -2700,35 +6250,59 @@ def export_oee_report():
         chart_sheet.insert_chart("D2", chart, {"x_scale":1.6,"y_scale":1.6})
 
         # RAW DATA
-        df.to_excel(writer, sheet_name="Raw Data", index=False)
+        write_raw_sheet(writer, "Raw Data", df)
 
-    output.seek(0)
+    return path, fname
 
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# MACHINE UTILIZATION REPORT (WITH MACHINE + MONTH FILTER)
+
+@memoized_report("machine", PRODUCTION_REPORT_TABLES)
+def machine_utilization(month, machine):
+    """
+    Time spent and utilization per machine-day, unrounded and unsorted
+    (page and export). Returns (message, summary): message says why
+    there is nothing to show, None otherwise.
+    """
+    # (daily rollup, only the selected month's partitions are read)
+    df = get_production_rollup(months=month_numbers(month))
+
+    if df.empty:
+        return "No data", None
+
+    # ---------- MONTH FILTER ----------
+    if month != "all":
+        df = df[df["Date"].dt.month == int(month)]
+
+    # ---------- MACHINE FILTER ----------
+    if machine:
+        df = df[df["Machine"] == machine]
+
+    if df.empty:
+        return "No data after filters", None
+
+    # ---------- TIME SPENT ----------
+    summary = (
+        df.groupby(["Date", "Machine"], as_index=False)
+        .agg(Time_Spent=("Time_Min", "sum"))
     )
 
-# MACHINE UTILIZATION REPORT (WITH MACHINE + MONTH FILTER)
+    # ---------- AVAILABLE TIME ----------
+    summary["Available_Time"] = 960
+
+    # ---------- UTILIZATION ----------
+    summary["Utilization_%"] = (
+        (summary["Time_Spent"] / summary["Available_Time"]) * 100
+    ).replace([float("inf"), -float("inf")], 0).fillna(0)
+
+    return None, summary
+
 
 @app.route("/reports/machine", methods=["GET"])
+@conditional_get(*PRODUCTION_REPORT_TABLES)
 def reports_machine():
     import pandas as pd
     import os
 
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    # ---------- LOAD DATA ----------
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
-
-    df = pd.concat([main_df, other_df], ignore_index=True)
-
     machine_filter = request.args.get("machine", "").strip()
     from datetime import datetime
 
@@ -2738,50 +6312,16 @@ def reports_machine():
     if not month_filter:
         month_filter = datetime.today().strftime("%m")
 
-    if df.empty:
-        return render_template(
-            "reports_machine.html",
-            active_report="machine",
-            records=[],
-            machines=[],
-            machine_filter=machine_filter,
-            selected_month=month_filter,
-            months=[{"value": "all", "label": "All"}] + [
-                {"value": "01", "label": "January"},
-                {"value": "02", "label": "February"},
-                {"value": "03", "label": "March"},
-                {"value": "04", "label": "April"},
-                {"value": "05", "label": "May"},
-                {"value": "06", "label": "June"},
-                {"value": "07", "label": "July"},
-                {"value": "08", "label": "August"},
-                {"value": "09", "label": "September"},
-                {"value": "10", "label": "October"},
-                {"value": "11", "label": "November"},
-                {"value": "12", "label": "December"},
-            ]
-        )
-
-    # ---------- NORMALIZE ----------
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Machine"] = df["Machine"].astype(str).str.strip()
-
-    # ---------- MONTH FILTER ----------
-    if month_filter != "all":
-        df = df[df["Date"].dt.month == int(month_filter)]
-
-    # ---------- MACHINE FILTER ----------
-    if machine_filter:
-        df = df[df["Machine"] == machine_filter]
+    # ---------- SUMMARY (MEMOIZED, SHARED WITH THE EXPORT) ----------
+    message, summary = machine_utilization(month=month_filter, machine=machine_filter)
 
     # ---------- HARD EXIT ----------
-    if df.empty:
+    if message:
         return render_template(
             "reports_machine.html",
             active_report="machine",
             records=[],
-            machines=sorted(pd.concat([main_df, other_df])["Machine"].dropna().unique().tolist()),
+            machines=sorted(production_values("Machine").tolist()),
             machine_filter=machine_filter,
             selected_month=month_filter,
             months=[{"value": "all", "label": "All"}] + [
@@ -2793,20 +6333,6 @@ def reports_machine():
             ]
         )
 
-    # ---------- TIME SPENT ----------
-    summary = (
-        df.groupby(["Date", "Machine"], as_index=False)
-        .agg(Time_Spent=("Time_Min", "sum"))
-    )
-
-    # ---------- AVAILABLE TIME ----------
-    summary["Available_Time"] = 960
-
-    # ---------- UTILIZATION ----------
-    summary["Utilization_%"] = (
-        (summary["Time_Spent"] / summary["Available_Time"]) * 100
-    ).replace([float("inf"), -float("inf")], 0).fillna(0)
-
     # ---------- FORMAT ----------
     summary["Date"] = summary["Date"].dt.strftime("%Y-%m-%d")
 
@@ -2826,10 +6352,7 @@ def reports_machine():
     )
 
     # ---------- MACHINE LIST ----------
-    all_machines = sorted(
-        pd.concat([main_df, other_df])["Machine"]
-        .dropna().astype(str).str.strip().unique().tolist()
-    )
+    all_machines = sorted(production_values("Machine").tolist())
 
     return render_template(
         "reports_machine.html",
@@ -2853,62 +6376,44 @@ def reports_machine():
 
 @app.route("/export/machine", methods=["GET"])
 def export_machine_report():
+    return send_report_export("machine", request.args)
+
+
+def build_machine_export(filters):
 
     import pandas as pd
     import io
     import os
-    from flask import send_file, request
 
     # ================= FILTERS =================
-    machine_filter = request.args.get("machine", "").strip()
+    machine_filter = filters["machine"].strip()
     from datetime import datetime
 
-    month_filter = request.args.get("month", "").strip()
+    month_filter = filters["month"].strip()
 
     # ✅ Default to current month if nothing selected
     if not month_filter:
         month_filter = datetime.today().strftime("%m")
 
-    # ================= LOAD =================
-    def load(path):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            return pd.DataFrame()
-        return pd.read_csv(path)
-
-    main_df = load("data/production_main.csv")
-    other_df = load("data/production_other_machine.csv")
+    # ================= SUMMARY (SHARED WITH THE PAGE) =================
+    message, summary = machine_utilization(month=month_filter, machine=machine_filter)
 
-    df = pd.concat([main_df, other_df], ignore_index=True)
+    if message:
+        return message
 
-    if df.empty:
-        return "No data"
+    summary.rename(columns={"Utilization_%":"Utilization (%)"}, inplace=True)
 
-    # ================= NORMALIZE =================
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Machine"] = df["Machine"].astype(str).str.strip()
+    # ================= RAW ROWS =================
+    df = get_production_facts(
+        joined=False, source=False, months=month_numbers(month_filter)
+    )
 
-    # ================= FILTER =================
     if month_filter != "all":
         df = df[df["Date"].dt.month == int(month_filter)]
 
     if machine_filter:
         df = df[df["Machine"] == machine_filter]
 
-    if df.empty:
-        return "No data after filters"
-
-    # ================= SUMMARY =================
-    summary = (
-        df.groupby(["Date","Machine"], as_index=False)
-        .agg(Time_Spent=("Time_Min","sum"))
-    )
-
-    summary["Available_Time"] = 960
-    summary["Utilization (%)"] = (
-        (summary["Time_Spent"]/summary["Available_Time"])*100
-    ).replace([float("inf"),-float("inf")],0).fillna(0)
-
     summary["Date"] = summary["Date"].dt.strftime("%d-%m-%Y")
 
     summary["Time_Spent"] = summary["Time_Spent"].round(2)
@@ -2930,9 +6435,9 @@ def export_machine_report():
     fname+=".xlsx"
 
     # ================= EXCEL =================
-    output = io.BytesIO()
+    path = export_temp_path()
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with excel_writer(path) as writer:
 
         # MAIN REPORT
         create_professional_excel(
@@ -2949,7 +6454,7 @@ def export_machine_report():
         # ---------- chart data ----------
         chart_sheet.write_row("A1", ["Date-Machine","Utilization"])
 
-        for i,r in summary.iterrows():
+        for i,(_,r) in enumerate(summary.sort_index().iterrows()):
             chart_sheet.write_row(
                 i+1,
                 0,
@@ -2971,27 +6476,58 @@ def export_machine_report():
         chart_sheet.insert_chart("D2", chart, {"x_scale":1.6,"y_scale":1.6})
 
         # RAW DATA
-        df.to_excel(writer, sheet_name="Raw Data", index=False)
+        write_raw_sheet(writer, "Raw Data", df)
 
-    output.seek(0)
+    return path, fname
 
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# LOSS ANALYSIS REPORT (ONE PIE – LOSS DISTRIBUTION + DETAIL TABLE)
+
+@memoized_report("loss", [PRODUCTION_LOSS_FILE])
+def loss_month(month):
+    """
+    Loss rows of the selected month (Date / Time_Min / Loss_Reason
+    typed) and their minutes per reason (page and export).
+    Returns (df, summary); (None, None) when nothing is logged.
+    """
+    if partitioned_is_blank(PRODUCTION_LOSS_FILE):
+        return None, None
+
+    # (only the selected month's partitions are read)
+    df = load_partitioned(
+        PRODUCTION_LOSS_FILE, months=month_numbers(month), engine="python"
     )
 
-# LOSS ANALYSIS REPORT (ONE PIE – LOSS DISTRIBUTION + DETAIL TABLE)
+    if df.empty:
+        return None, None
+
+    # remove accidental spaces from column names
+    df.columns = df.columns.str.strip()
+
+    # ---------- NORMALIZE ----------
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
+    df["Loss_Reason"] = df["Loss_Reason"].astype(str)
+
+    # ---------- MONTH FILTER ----------
+    if month and month != "all":
+        df = df[df["Date"].dt.month == int(month)]
+
+    # ---------- MINUTES PER REASON ----------
+    summary = (
+        df.groupby("Loss_Reason", as_index=False)
+        .agg(Total_Time=("Time_Min", "sum"))
+    )
+
+    return df, summary
+
 
 @app.route("/reports/loss", methods=["GET"])
+@conditional_get(PRODUCTION_LOSS_FILE)
 def reports_loss():
     import pandas as pd
     import os
     from datetime import datetime
 
-    LOSS_FILE = "data/production_loss.csv"
-
     selected_month = request.args.get("month", "").strip()
     selected_machine = request.args.get("machine", "").strip()
     selected_reason = request.args.get("reason", "").strip()
@@ -3014,8 +6550,10 @@ def reports_loss():
         {"value": "12", "label": "December"},
     ]
 
-    # ---------- LOAD DATA ----------
-    if not os.path.exists(LOSS_FILE) or os.path.getsize(LOSS_FILE) == 0:
+    # ---------- LOAD DATA (MEMOIZED, SHARED WITH THE EXPORT) ----------
+    df, summary = loss_month(month=selected_month)
+
+    if df is None:
         return render_template(
             "reports_loss.html",
             active_report="loss",
@@ -3025,42 +6563,25 @@ def reports_loss():
             selected_month=selected_month,
             months=months,
             loss_table=[],
+            loss_count=0,
             machines=[],
             reasons=[],
             selected_machine=selected_machine,
             selected_reason=selected_reason
         )
 
-    df = pd.read_csv(LOSS_FILE, engine="python")
-
-    # remove accidental spaces from column names
-    df.columns = df.columns.str.strip()
-
     # Ensure Remarks column exists
     if "Remarks" not in df.columns:
         df["Remarks"] = ""
 
-    # ---------- NORMALIZE ----------
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Loss_Reason"] = df["Loss_Reason"].astype(str)
     df["Machine"] = df["Machine"].astype(str)
     df["Remarks"] = df["Remarks"].fillna("")
 
-    # ---------- MONTH FILTER ----------
-    if selected_month != "all":
-        df = df[df["Date"].dt.month == int(selected_month)]
-
     # Machine / reason lists must come BEFORE filtering table
     machines = sorted(df["Machine"].dropna().unique().tolist())
     reasons = sorted(df["Loss_Reason"].dropna().unique().tolist())
 
     # ---------- PIE DATA ----------
-    summary = (
-        df.groupby("Loss_Reason", as_index=False)
-        .agg(Total_Time=("Time_Min", "sum"))
-    )
-
     loss_data = [
         {"label": row["Loss_Reason"], "value": float(row["Total_Time"])}
         for _, row in summary.iterrows()
@@ -3071,7 +6592,7 @@ def reports_loss():
     total_hours = round(total_minutes / 60, 2)
 
     # ---------- TABLE DATA ----------
-    detail_df = df.copy()
+    detail_df = df
 
     if selected_machine:
         detail_df = detail_df[detail_df["Machine"] == selected_machine]
@@ -3079,28 +6600,28 @@ def reports_loss():
     if selected_reason:
         detail_df = detail_df[detail_df["Loss_Reason"] == selected_reason]
 
-    detail_df["Date_Display"] = detail_df["Date"].dt.strftime("%d-%m-%Y")
-
     detail_df = detail_df.sort_values(
         by=["Date", "Machine"],
         ascending=[False, True]
     )
 
     loss_table = detail_df[[
-        "Date_Display",
+        "Date",
         "Machine",
         "Time_Min",
         "Loss_Reason",
         "Remarks"
-    ]].copy()
+    ]]
 
-    loss_table.rename(columns={
-        "Date_Display": "Date",
-        "Time_Min": "Loss_Min",
-        "Loss_Reason": "Reason"
-    }, inplace=True)
+    def display_rows(chunk):
+        chunk["Date"] = chunk["Date"].dt.strftime("%d-%m-%Y")
+        return chunk.rename(columns={
+            "Time_Min": "Loss_Min",
+            "Loss_Reason": "Reason"
+        })
 
-    return render_template(
+    # ---------- STREAMED (THE DETAIL TABLE CAN BE VERY LONG) ----------
+    return stream_page(
         "reports_loss.html",
         active_report="loss",
         loss_data=loss_data,
@@ -3108,7 +6629,8 @@ def reports_loss():
         total_hours=total_hours,
         selected_month=selected_month,
         months=months,
-        loss_table=loss_table.to_dict(orient="records"),
+        loss_table=frame_records(loss_table, prepare=display_rows),
+        loss_count=len(loss_table),
         machines=machines,
         reasons=reasons,
         selected_machine=selected_machine,
@@ -3121,42 +6643,26 @@ def reports_loss():
 
 @app.route("/export/loss", methods=["GET"])
 def export_loss_report():
+    return send_report_export("loss", request.args)
+
+
+def build_loss_export(filters):
 
     import pandas as pd
     import io
     import os
-    from flask import send_file, request
-
-    LOSS_FILE = "data/production_loss.csv"
 
-    month_filter = request.args.get("month","").strip()
+    month_filter = filters["month"].strip()
 
-    if not os.path.exists(LOSS_FILE) or os.path.getsize(LOSS_FILE)==0:
-        return "No data"
-
-    df = pd.read_csv(LOSS_FILE)
+    # ================= LOAD + SUMMARY (SHARED WITH THE PAGE) =================
+    df, summary = loss_month(month=month_filter)
 
-    if df.empty:
+    if df is None:
         return "No data"
 
-    # ================= NORMALIZE =================
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Time_Min"] = pd.to_numeric(df["Time_Min"], errors="coerce").fillna(0)
-    df["Loss_Reason"] = df["Loss_Reason"].astype(str)
-
-    # ================= FILTER =================
-    if month_filter and month_filter != "all":
-        df = df[df["Date"].dt.month == int(month_filter)]
-
     if df.empty:
         return "No data after filters"
 
-    # ================= SUMMARY =================
-    summary = (
-        df.groupby("Loss_Reason",as_index=False)
-        .agg(Total_Time=("Time_Min","sum"))
-    )
-
     summary = summary[summary["Total_Time"]>0]
     summary["Hours"] = (summary["Total_Time"]/60).round(2)
     summary = summary.sort_values("Total_Time",ascending=False)
@@ -3166,64 +6672,349 @@ def export_loss_report():
     if month_filter: filters.append(f"Month={month_filter}")
     filter_text=" | ".join(filters) if filters else "None"
 
-    # ================= FILE NAME =================
-    fname="Loss_Analysis"
-    if month_filter: fname+=f"_M{month_filter}"
-    fname+=".xlsx"
+    # ================= FILE NAME =================
+    fname="Loss_Analysis"
+    if month_filter: fname+=f"_M{month_filter}"
+    fname+=".xlsx"
+
+    # ================= EXCEL =================
+    path = export_temp_path()
+
+    with excel_writer(path) as writer:
+
+        # MAIN REPORT
+        create_professional_excel(
+            writer=writer,
+            sheet_name="Loss Report",
+            report_title="Loss Analysis Report",
+            filters_text=filter_text,
+            df=summary
+        )
+
+        workbook = writer.book
+        chart_sheet = workbook.add_worksheet("Loss Chart")
+
+        # ---------- chart data ----------
+        chart_sheet.write_row("A1", ["Reason","Minutes"])
+
+        for i,(_,r) in enumerate(summary.sort_index().iterrows()):
+            chart_sheet.write_row(i+1,0,[r["Loss_Reason"], r["Total_Time"]])
+
+        chart = workbook.add_chart({"type":"pie"})
+
+        chart.add_series({
+            "name":"Loss Distribution",
+            "categories":["Loss Chart",1,0,len(summary),0],
+            "values":["Loss Chart",1,1,len(summary),1],
+            "data_labels":{"percentage":True}
+        })
+
+        chart.set_title({"name":"Loss Distribution"})
+
+        chart_sheet.insert_chart("D2", chart, {"x_scale":1.6,"y_scale":1.6})
+
+        # RAW DATA
+        write_raw_sheet(writer, "Raw Data", df)
+
+    return path, fname
+
+# =========================================
+# 📥 EXPORT JOBS (BACKGROUND EXCEL BUILDS + ARTIFACT CACHE)
+# =========================================
+# Every Excel export is built on a small worker pool (EXPORT_WORKERS
+# at a time per process) and kept in data/_exports/<key>.xlsx, the key
+# being (report, normalized filters, data version of its input tables).
+# The same export on unchanged data is served from that file. Pages
+# submit a job, poll its status and download the file when it is done:
+#   POST /exports/jobs  report=oee&machine=VMC-1&month=10
+#   GET  /exports/jobs/<id>            -> status (queued/running/done/empty/failed)
+#   GET  /exports/jobs/<id>/download   -> the .xlsx
+# Job records are JSON files, so any gunicorn worker can answer a poll.
+# The old /export/... URLs still work: they run the same job and wait.
+EXPORT_WORKERS = 2
+EXPORT_CACHE_MAX_FILES = 100
+EXPORT_JOB_MAX_AGE_SECONDS = 24 * 3600
+
+
+def current_month():
+    return datetime.today().strftime("%m")
+
+
+# report -> (builder, filter args, filter defaults, input tables)
+EXPORT_REPORTS = {
+    "daily": (
+        build_daily_export,
+        ["month", "date", "operator", "part", "operation"],
+        {},
+        [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE]
+    ),
+    "operator": (
+        build_operator_export,
+        ["operator", "month"],
+        {"month": current_month},
+        [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE, PART_MASTER_FILE, ABSENTEEISM_FILE]
+    ),
+    "oee": (
+        build_oee_export,
+        ["machine", "month"],
+        {"month": current_month},
+        [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE, PART_MASTER_FILE]
+    ),
+    "machine": (
+        build_machine_export,
+        ["machine", "month"],
+        {"month": current_month},
+        [PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE]
+    ),
+    "loss": (
+        build_loss_export,
+        ["month"],
+        {},
+        [PRODUCTION_LOSS_FILE]
+    )
+}
+
+
+def export_filters(report, args):
+    """The filter args a report reads, stripped, with its defaults applied."""
+    _, names, defaults, _ = EXPORT_REPORTS[report]
+    filters = {name: (args.get(name) or "").strip() for name in names}
+    for name, default in defaults.items():
+        if not filters[name]:
+            filters[name] = default()
+    return filters
+
+
+class ExportJobs:
+
+    def __init__(self, folder, workers):
+        self.folder = folder
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._running = {}          # artifact key -> job id
+        self._futures = {}          # job id -> Future (this process only)
+        self.hits = 0
+        self.builds = 0
+        self.failures = 0
+
+    # ---------- FILES ----------
+    def _artifact(self, key):
+        return os.path.join(self.folder, key + ".xlsx")
+
+    def _artifact_name(self, key):
+        return os.path.join(self.folder, key + ".json")
+
+    def _job_file(self, job_id):
+        return os.path.join(self.folder, "jobs", job_id + ".json")
+
+    def _save_job(self, job):
+        path = self._job_file(job["id"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, lambda f: json.dump(job, f))
+
+    def job(self, job_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+            return None
+        try:
+            with open(self._job_file(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _key(self, report, filters):
+        tables = EXPORT_REPORTS[report][3]
+        raw = json.dumps([report, filters, data_version(*tables)], sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()[:24]
+
+    def _executor(self):
+        # created lazily so every gunicorn worker (forked) gets its own
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="export"
+            )
+        return self._pool
+
+    # ---------- SUBMIT / RUN ----------
+    def submit(self, report, filters):
+        key = self._key(report, filters)
+        job = {
+            "id": uuid.uuid4().hex,
+            "report": report,
+            "filters": filters,
+            "key": key,
+            "status": "queued",
+            "fname": None,
+            "message": None,
+            "created": time.time(),
+            "finished": None
+        }
+
+        cached = self.artifact(key)
+        if cached is not None:
+            os.utime(cached[0])             # most recently used
+            job.update(status="done", fname=cached[1], finished=time.time())
+            self._save_job(job)
+            with self._lock:
+                self.hits += 1
+            return job
+
+        with self._lock:
+            running = self.job(self._running.get(key))
+            if running is not None and running["status"] in ("queued", "running"):
+                return running          # same export already being built
+
+            self._running[key] = job["id"]
+            self._save_job(job)
+            self._futures[job["id"]] = self._executor().submit(self._run, job)
+
+        return job
+
+    def wait(self, job):
+        future = self._futures.get(job["id"])
+        if future is not None:
+            future.result()
+        return self.job(job["id"]) or job
+
+    def _run(self, job):
+        builder = EXPORT_REPORTS[job["report"]][0]
+        job["status"] = "running"
+        self._save_job(job)
+
+        try:
+            result = builder(dict(job["filters"]))
+
+            if isinstance(result, str):
+                job.update(status="empty", message=result)
+            else:
+                path, fname = result
+                atomic_write(
+                    self._artifact_name(job["key"]),
+                    lambda f: json.dump({"fname": fname}, f)
+                )
+                os.replace(path, self._artifact(job["key"]))
+                job.update(status="done", fname=fname)
+
+            with self._lock:
+                self.builds += 1
+
+        except Exception as e:
+            print("🔴 EXPORT FAILED:", job["report"], str(e))
+            job.update(status="failed", message=str(e))
+            with self._lock:
+                self.failures += 1
+
+        finally:
+            job["finished"] = time.time()
+            self._save_job(job)
+            with self._lock:
+                if self._running.get(job["key"]) == job["id"]:
+                    del self._running[job["key"]]
+                self._futures.pop(job["id"], None)
+            self._evict()
+
+    def artifact(self, key):
+        """(path, download name) of a finished export, or None."""
+        path = self._artifact(key)
+        try:
+            with open(self._artifact_name(key)) as f:
+                fname = json.load(f)["fname"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return (path, fname) if os.path.exists(path) else None
+
+    # ---------- HOUSEKEEPING ----------
+    def _evict(self):
+        """Keep the newest EXPORT_CACHE_MAX_FILES artifacts and recent jobs."""
+        try:
+            artifacts = sorted(
+                (os.path.join(self.folder, f) for f in os.listdir(self.folder)
+                 if f.endswith(".xlsx")),
+                key=os.path.getmtime,
+                reverse=True
+            )
+            for path in artifacts[EXPORT_CACHE_MAX_FILES:]:
+                os.remove(path)
+                os.remove(os.path.splitext(path)[0] + ".json")
+
+            jobs_dir = os.path.join(self.folder, "jobs")
+            cutoff = time.time() - EXPORT_JOB_MAX_AGE_SECONDS
+            for f in os.listdir(jobs_dir):
+                path = os.path.join(jobs_dir, f)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        except OSError:
+            pass     # a file in use (Windows) or removed by another worker
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "hits": self.hits,
+                "builds": self.builds,
+                "failures": self.failures
+            }
+
+
+export_jobs = ExportJobs(EXPORT_FOLDER, EXPORT_WORKERS)
+
 
-    # ================= EXCEL =================
-    output = io.BytesIO()
+def job_view(job):
+    view = {k: job[k] for k in ("id", "report", "filters", "status", "message")}
+    view["status_url"] = url_for("export_job_status", job_id=job["id"])
+    if job["status"] == "done":
+        view["download_url"] = url_for("download_export_job", job_id=job["id"])
+    return view
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
 
-        # MAIN REPORT
-        create_professional_excel(
-            writer=writer,
-            sheet_name="Loss Report",
-            report_title="Loss Analysis Report",
-            filters_text=filter_text,
-            df=summary
-        )
+def send_report_export(report, args):
+    """Synchronous export (old /export/... URLs): same job + cache, waited on."""
+    job = export_jobs.wait(export_jobs.submit(report, export_filters(report, args)))
 
-        workbook = writer.book
-        chart_sheet = workbook.add_worksheet("Loss Chart")
+    if job["status"] == "empty":
+        return job["message"]
+    if job["status"] != "done":
+        return "EXPORT_FAILED", 500
 
-        # ---------- chart data ----------
-        chart_sheet.write_row("A1", ["Reason","Minutes"])
+    path, fname = export_jobs.artifact(job["key"])
+    return send_export(path, fname)
 
-        for i,r in summary.iterrows():
-            chart_sheet.write_row(i+1,0,[r["Loss_Reason"], r["Total_Time"]])
 
-        chart = workbook.add_chart({"type":"pie"})
+@app.route("/exports/jobs", methods=["POST"])
+def submit_export_job():
+    report = request.values.get("report", "")
+    if report not in EXPORT_REPORTS:
+        return jsonify({"error": "UNKNOWN_REPORT"}), 400
 
-        chart.add_series({
-            "name":"Loss Distribution",
-            "categories":["Loss Chart",1,0,len(summary),0],
-            "values":["Loss Chart",1,1,len(summary),1],
-            "data_labels":{"percentage":True}
-        })
+    job = export_jobs.submit(report, export_filters(report, request.values))
+    return jsonify(job_view(job)), 202
 
-        chart.set_title({"name":"Loss Distribution"})
 
-        chart_sheet.insert_chart("D2", chart, {"x_scale":1.6,"y_scale":1.6})
+@app.route("/exports/jobs/<job_id>")
+def export_job_status(job_id):
+    job = export_jobs.job(job_id)
+    if job is None:
+        return jsonify({"error": "NOT_FOUND"}), 404
+    return jsonify(job_view(job))
 
-        # RAW DATA
-        df.to_excel(writer, sheet_name="Raw Data", index=False)
 
-    output.seek(0)
+@app.route("/exports/jobs/<job_id>/download")
+def download_export_job(job_id):
+    job = export_jobs.job(job_id)
+    found = export_jobs.artifact(job["key"]) if job and job["status"] == "done" else None
 
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=fname,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    if found is None:
+        return "NOT_FOUND", 404
+
+    return send_export(*found)
 
 # ============================================================
 # MANAGEMENT DASHBOARD
 # ============================================================
 
 @app.route("/management_dashboard", methods=["GET"])
+@conditional_get(*PRODUCTION_REPORT_TABLES, PRODUCTION_LOSS_FILE)
 def management_dashboard():
     dashboard = get_dashboard_kpis()
     return render_template(
@@ -3249,7 +7040,7 @@ if not os.path.exists(STORE_ITEM_FILE):
         "RM Rate",
         "FG Rate"
     ])
-    df.to_csv(STORE_ITEM_FILE, index=False)
+    save_table(df, STORE_ITEM_FILE)
 
 # =========================================
 # STORES MODULE HOME
@@ -3262,102 +7053,35 @@ def stores_home():
 # STORES CONTROL TOWER (SYNC WITH LIVE INVENTORY)
 # =====================================================
 @app.route("/stores/dashboard")
+@conditional_get(STORE_ITEM_FILE, STORE_LEDGER_FILE)
 def stores_dashboard():
 
     from datetime import datetime, timedelta
     import pandas as pd
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
+    ledger_df = load_ledger(normalize=normalize_ledger)
 
     if items_df.empty:
         return render_template("stores_dashboard.html", data={})
 
     if ledger_df.empty:
-        ledger_df = pd.DataFrame(columns=["Item","Qty","Inward_Type","Date","Value"])
-
-    ledger_df["Qty"] = pd.to_numeric(ledger_df["Qty"], errors="coerce").fillna(0)
-    ledger_df["Value"] = pd.to_numeric(ledger_df["Value"], errors="coerce").fillna(0)
-    ledger_df["Date"] = pd.to_datetime(ledger_df["Date"], errors="coerce")
-    ledger_df["Item"] = ledger_df["Item"].astype(str).str.strip()
+        ledger_df = normalize_ledger(
+            pd.DataFrame(columns=["Item","Qty","Inward_Type","Date","Value"])
+        )
 
     today = datetime.today()
     month_start = today.replace(day=1)
 
-    summary = []
-
     # =====================================================
-    # SAME LOGIC AS LIVE INVENTORY
+    # SAME LOGIC AS LIVE INVENTORY (SHARED STOCK ENGINE)
     # =====================================================
-    for _, row in items_df.iterrows():
-
-        code = str(row["Item Code"]).strip()
-        category = str(row.get("Category",""))
-
-        rm_rate = float(row.get("RM Rate",0) or 0)
-        fg_rate = float(row.get("FG Rate",rm_rate) or rm_rate)
-        min_stock = float(row.get("Min Stock",0) or 0)
-
-        item_ledger = ledger_df[ledger_df["Item"] == code]
-
-        inward_rm = item_ledger[item_ledger["Inward_Type"]=="INWARD"]["Qty"].sum()
-        issued = item_ledger[item_ledger["Inward_Type"]=="ISSUE"]["Qty"].sum()
-
-        return_rm = item_ledger[item_ledger["Inward_Type"]=="RETURN_RM"]["Qty"].sum()
-        return_fg = item_ledger[item_ledger["Inward_Type"]=="RETURN_FG"]["Qty"].sum()
-        return_reject = item_ledger[item_ledger["Inward_Type"]=="RETURN_REJECT"]["Qty"].sum()
-
-        outward_fg = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_FG"]["Qty"].sum()
-        outward_rm = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_RM"]["Qty"].sum()
-        outward_reject = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_REJECT"]["Qty"].sum()
-        outward_wip = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_WIP"]["Qty"].sum()
-
-        adj_rm = item_ledger[item_ledger["Inward_Type"]=="ADJ_RM"]["Qty"].sum()
-        adj_fg = item_ledger[item_ledger["Inward_Type"]=="ADJ_FG"]["Qty"].sum()
-        adj_wip = item_ledger[item_ledger["Inward_Type"]=="ADJ_WIP"]["Qty"].sum()
-        adj_rej = item_ledger[item_ledger["Inward_Type"]=="ADJ_REJECT"]["Qty"].sum()
-        opening = item_ledger[item_ledger["Inward_Type"]=="OPENING"]["Qty"].sum()
-
-        rm_stock = inward_rm - issued + return_rm - outward_rm + adj_rm + opening
-        wip_stock = issued - return_fg - return_reject - outward_wip + adj_wip
-        fg_stock = return_fg - outward_fg + adj_fg
-        reject_stock = return_reject - outward_reject + adj_rej
-
-        rm_stock = max(rm_stock,0)
-        wip_stock = max(wip_stock,0)
-        fg_stock = max(fg_stock,0)
-        reject_stock = max(reject_stock,0)
-
-        rm_value = rm_stock * rm_rate
-        wip_value = wip_stock * (fg_rate * 0.75)
-        fg_value = fg_stock * fg_rate
-        reject_value = reject_stock * rm_rate
-
-        total_value = rm_value + wip_value + fg_value + reject_value
-
-        summary.append({
-            "Item Code": code,
-            "Category": category,
-
-            # qty
-            "RM Stock": rm_stock,
-            "WIP Stock": wip_stock,
-            "FG Stock": fg_stock,
-            "Reject Stock": reject_stock,
-            "Total Stock": rm_stock + wip_stock + fg_stock + reject_stock,
-
-            # values
-            "RM Value": rm_value,
-            "WIP Value": wip_value,
-            "FG Value": fg_value,
-            "Reject Value": reject_value,
-            "Total Value": total_value,
-
-            "Min": min_stock,
-            "Last": item_ledger["Date"].max()
-        })
-
-    df = pd.DataFrame(summary)
+    df = stock_positions(items_df)[[
+        "Item Code", "Category",
+        "RM Stock", "WIP Stock", "FG Stock", "Reject Stock", "Total Stock",
+        "RM Value", "WIP Value", "FG Value", "Reject Value", "Total Value",
+        "Min", "Last"
+    ]].reset_index(drop=True)
 
     # =====================================================
     # HIGH VALUE INVENTORY (TOP 15)
@@ -3495,9 +7219,10 @@ def stores_dashboard():
 # STORES ITEM MASTER (ERP V2)
 # =========================================
 @app.route("/stores/item_master", methods=["GET", "POST"])
+@write_locked(STORE_ITEM_FILE)
 def stores_item_master():
 
-    df = pd.read_csv(STORE_ITEM_FILE)
+    df = load_table(STORE_ITEM_FILE)
 
     # ==============================
     # HANDLE POST
@@ -3535,7 +7260,7 @@ def stores_item_master():
                 for c in ["Min Stock","RM Rate","FG Rate"]:
                     upload_df[c] = pd.to_numeric(upload_df[c], errors="coerce").fillna(0)
 
-                upload_df.to_csv(STORE_ITEM_FILE, index=False)
+                save_table(upload_df, STORE_ITEM_FILE)
 
         # -------- EDIT SAVE --------
         if "edit_item_code" in request.form:
@@ -3560,14 +7285,14 @@ def stores_item_master():
             df.loc[mask, "RM Rate"] = float(rm_rate) if rm_rate else 0
             df.loc[mask, "FG Rate"] = float(fg_rate) if fg_rate else 0
 
-            df.to_csv(STORE_ITEM_FILE, index=False)
+            save_table(df, STORE_ITEM_FILE)
 
         return redirect("/stores/item_master")
 
     # ==============================
     # GET VIEW
     # ==============================
-    df = pd.read_csv(STORE_ITEM_FILE)
+    df = load_table(STORE_ITEM_FILE)
 
     if not df.empty:
         df = df.sort_values("Item Code")
@@ -3587,9 +7312,7 @@ def delete_store_item():
 
     code = request.args.get("code")
 
-    df = pd.read_csv(STORE_ITEM_FILE)
-    df = df[df["Item Code"] != code]
-    df.to_csv(STORE_ITEM_FILE, index=False)
+    delete_rows(STORE_ITEM_FILE, {"Item Code": code})
 
     return redirect("/stores/item_master")
 
@@ -3611,19 +7334,15 @@ def edit_store_item():
     rm_rate = request.form.get("rm_rate", 0)
     fg_rate = request.form.get("fg_rate", 0)
 
-    df = pd.read_csv(STORE_ITEM_FILE)
-
-    mask = df["Item Code"] == old_code
-
-    df.loc[mask, "Category"] = category
-    df.loc[mask, "Unit"] = unit
-    df.loc[mask, "RM Item Name"] = rm_name
-    df.loc[mask, "FG Item Name"] = fg_name
-    df.loc[mask, "Min Stock"] = float(min_stock) if min_stock else 0
-    df.loc[mask, "RM Rate"] = float(rm_rate) if rm_rate else 0
-    df.loc[mask, "FG Rate"] = float(fg_rate) if fg_rate else 0
-
-    df.to_csv(STORE_ITEM_FILE, index=False)
+    update_rows(STORE_ITEM_FILE, {"Item Code": old_code}, {
+        "Category": category,
+        "Unit": unit,
+        "RM Item Name": rm_name,
+        "FG Item Name": fg_name,
+        "Min Stock": float(min_stock) if min_stock else 0,
+        "RM Rate": float(rm_rate) if rm_rate else 0,
+        "FG Rate": float(fg_rate) if fg_rate else 0
+    })
 
     return redirect("/stores/item_master")
 
@@ -3631,9 +7350,7 @@ def edit_store_item():
 # STORES LEDGER SYSTEM (MAIN ENGINE)
 # =====================================================
 
-STORE_LEDGER_FILE = os.path.join(DATA_FOLDER, "store_ledger.csv")
-
-# Ensure ledger file exists
+# Ensure ledger file exists (STORE_LEDGER_FILE, see STOCK ENGINE)
 if not os.path.exists(STORE_LEDGER_FILE):
     pd.DataFrame(columns=[
         "Date",
@@ -3649,13 +7366,75 @@ if not os.path.exists(STORE_LEDGER_FILE):
         "Timestamp"
     ]).to_csv(STORE_LEDGER_FILE, index=False)
 
+# =====================================================
+# LEDGER REGISTERS (PAGED, SEE SERVER-SIDE PAGING)
+# =====================================================
+LEDGER_SORTS = {
+    "newest": ("Newest first", ["Timestamp"], [False]),
+    "oldest": ("Oldest first", ["Timestamp"], [True]),
+    "date": ("Entry date", ["Date", "Timestamp"], [False, False]),
+    "item": ("Item", ["Item", "Timestamp"], [True, False])
+}
+
+
+def ledger_index(ledger_df, sig, types, sort):
+    """
+    Pre-sorted index of the rows of ledger_df (load_ledger() of the
+    ledger at signature `sig`) whose Inward_Type is in `types`, in
+    `sort` order, and the register totals: (order, totals). Memoized
+    per signature, so the index always belongs to the frame it pages;
+    sig None (ledger changed while loading) indexes ledger_df directly.
+    """
+    def build():
+        df = ledger_df.reset_index(drop=True)
+        df = df[df["Inward_Type"].isin(types)]
+
+        _, columns, ascending = LEDGER_SORTS[sort]
+        order = df.sort_values(columns, ascending=ascending, kind="stable").index
+
+        totals = [("Total Qty", column_total(df["Qty"])), ("Total Value", column_total(df["Value"]))]
+        return order, totals
+
+    if sig is None:
+        return build()
+
+    filters = {"types": tuple(types), "sort": sort, "sig": sig}
+    return report_cache.get("ledger_index", filters, [], build)
+
+
+def ledger_register(types):
+    """
+    Records and pager of one page of a stores register: the ledger rows
+    of `types`, sorted and paged from the request args. An edit_ts link
+    opens on the page holding that entry.
+    """
+    sort = page_sort(request.args, LEDGER_SORTS)
+
+    sig = table_signature(STORE_LEDGER_FILE)
+    ledger_df = load_ledger()
+    if table_signature(STORE_LEDGER_FILE) != sig:
+        sig = None
+
+    order, totals = ledger_index(ledger_df, sig, types, sort)
+
+    edit_ts = request.args.get("edit_ts")
+    edit_row = None
+    if edit_ts:
+        hits = (ledger_df["Timestamp"].astype(str) == edit_ts).to_numpy().nonzero()[0]
+        edit_row = int(hits[0]) if len(hits) else None
+
+    positions, pager = paginate(order, LEDGER_SORTS, request.args, row=edit_row)
+    pager["totals"] = totals
+
+    return ledger_df.iloc[positions].to_dict(orient="records"), pager
+
 # =====================================================
 # STORES INWARD PAGE (ERP v2 - ITEM CODE BASED)
 # =====================================================
 @app.route("/stores/inward", methods=["GET"])
 def stores_inward():
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
 
     # =========================================
     # ALLOWED CATEGORIES FOR INWARD
@@ -3696,18 +7475,15 @@ def stores_inward():
     dropdown = sorted(dropdown, key=lambda x: x["code"])
 
     # =========================================
-    # SHOW ONLY INWARD ENTRIES
+    # SHOW ONLY INWARD ENTRIES (ONE PAGE)
     # =========================================
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-    ledger_df = ledger_df[ledger_df["Inward_Type"] == "INWARD"]
-
-    if not ledger_df.empty:
-        ledger_df = ledger_df.sort_values("Timestamp", ascending=False)
+    records, pager = ledger_register(["INWARD"])
 
     return render_template(
         "stores_inward.html",
         items=dropdown,
-        records=ledger_df.to_dict(orient="records")
+        records=records,
+        pager=pager
     )
 
 # =====================================================
@@ -3734,7 +7510,7 @@ def save_stores_inward():
     # =========================================
     # GET ITEM MASTER DATA
     # =========================================
-    item_df = pd.read_csv(STORE_ITEM_FILE)
+    item_df = load_table(STORE_ITEM_FILE)
 
     row = item_df[item_df["Item Code"] == item_code]
 
@@ -3756,8 +7532,6 @@ def save_stores_inward():
 
     value = qty * rate
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
     new_row = {
         "Date": date,
         "Item": item_code,   # 🔴 STORE ITEM CODE
@@ -3772,14 +7546,9 @@ def save_stores_inward():
         "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    ledger_df = pd.concat(
-        [ledger_df, pd.DataFrame([new_row])],
-        ignore_index=True
-    )
+    append_ledger(pd.DataFrame([new_row]))
 
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
-
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/inward")
 
@@ -3800,19 +7569,12 @@ def delete_inward():
 
     timestamp = request.form.get("timestamp")
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-
-    before = len(df)
-
-    df = df[df["Timestamp"] != timestamp]
-
-    after = len(df)
+    removed = delete_ledger_rows(timestamp)
 
-    if before == after:
+    if removed.empty:
         return "NOT_FOUND", 404
 
-    df.to_csv(STORE_LEDGER_FILE, index=False)
-    backup_to_drive()
+    request_backup()
     return "OK", 200
 
 # =====================================================
@@ -3838,7 +7600,7 @@ def edit_inward():
     # =========================================
     # GET RM RATE FROM ITEM MASTER
     # =========================================
-    item_df = pd.read_csv(STORE_ITEM_FILE)
+    item_df = load_table(STORE_ITEM_FILE)
     row = item_df[item_df["Item Code"] == item_code]
 
     if row.empty:
@@ -3850,22 +7612,18 @@ def edit_inward():
     rate = rm_rate
     value = qty * rate
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-
-    mask = df["Timestamp"] == old_timestamp
-
-    df.loc[mask, "Date"] = date
-    df.loc[mask, "Item"] = item_code   # 🔴 STORE CODE
-    df.loc[mask, "Qty"] = qty
-    df.loc[mask, "Rate"] = rate
-    df.loc[mask, "Value"] = value
-    df.loc[mask, "Supplier"] = vendor
-    df.loc[mask, "Ref_No"] = invoice
-    df.loc[mask, "Remarks"] = f"Received By: {received_by} | {remarks}"
-
-    df.to_csv(STORE_LEDGER_FILE, index=False)
+    update_ledger_rows(old_timestamp, {
+        "Date": date,
+        "Item": item_code,   # 🔴 STORE CODE
+        "Qty": qty,
+        "Rate": rate,
+        "Value": value,
+        "Supplier": vendor,
+        "Ref_No": invoice,
+        "Remarks": f"Received By: {received_by} | {remarks}"
+    })
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/inward")
 
@@ -3875,7 +7633,7 @@ def edit_inward():
 @app.route("/stores/issue", methods=["GET"])
 def stores_issue():
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     error = request.args.get("error", "")
 
     # =========================
@@ -3937,19 +7695,15 @@ def stores_issue():
         "Packing Material"
     ]
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
-    if not ledger_df.empty:
-        ledger_df = ledger_df.sort_values("Timestamp", ascending=False)
-
-    # show only issue entries
-    issue_records = ledger_df[ledger_df["Inward_Type"] == "ISSUE"]
+    # show only issue entries (one page)
+    issue_records, pager = ledger_register(["ISSUE"])
 
     return render_template(
         "stores_issue.html",
         items=issue_items,
         purposes=purposes,
-        records=issue_records.to_dict(orient="records"),
+        records=issue_records,
+        pager=pager,
         error=error
     )
 
@@ -3957,6 +7711,7 @@ def stores_issue():
 # SAVE ISSUE ENTRY (ITEM CODE BASED)
 # =====================================================
 @app.route("/stores/save_issue", methods=["POST"])
+@write_locked(STORE_LEDGER_FILE)
 def save_issue():
 
     from datetime import datetime
@@ -3973,18 +7728,14 @@ def save_issue():
 
     qty = float(qty)
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
     # =========================
     # CURRENT STOCK CALC
     # =========================
-    item_df = ledger_df[ledger_df["Item"] == item_code]
+    # the route holds the ledger lock: no other write lands between
+    # this check and the append below
+    t = stock_engine.item_totals(item_code)
 
-    inward = item_df[item_df["Inward_Type"] == "INWARD"]["Qty"].sum()
-    issued = item_df[item_df["Inward_Type"] == "ISSUE"]["Qty"].sum()
-    returned = item_df[item_df["Inward_Type"] == "RETURN"]["Qty"].sum()
-
-    current_stock = inward - issued + returned
+    current_stock = t["INWARD"] - t["ISSUE"] + t["RETURN"]
 
     if qty > current_stock:
         msg = f"Insufficient stock. Available = {round(current_stock,2)}"
@@ -3993,7 +7744,7 @@ def save_issue():
     # =========================
     # GET RM RATE FROM MASTER
     # =========================
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     row = items_df[items_df["Item Code"] == item_code]
 
     if not row.empty:
@@ -4020,10 +7771,9 @@ def save_issue():
         "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    ledger_df = pd.concat([ledger_df, pd.DataFrame([new_row])], ignore_index=True)
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
+    append_ledger(pd.DataFrame([new_row]))
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/issue")
 
@@ -4039,23 +7789,19 @@ def delete_issue():
 
     timestamp = request.form.get("timestamp")
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-
-    before = len(df)
-    df = df[df["Timestamp"] != timestamp]
-    after = len(df)
+    removed = delete_ledger_rows(timestamp)
 
-    if before == after:
+    if removed.empty:
         return "NOT_FOUND", 404
 
-    df.to_csv(STORE_LEDGER_FILE, index=False)
-    backup_to_drive()
+    request_backup()
     return "OK", 200
 
 # =====================================================
 # EDIT ISSUE ENTRY (ITEM CODE BASED)
 # =====================================================
 @app.route("/stores/edit_issue", methods=["POST"])
+@write_locked(STORE_LEDGER_FILE)
 def edit_issue():
 
     code = request.form.get("code", "")
@@ -4071,39 +7817,31 @@ def edit_issue():
     issued_by = request.form.get("issued_by")
     remarks = request.form.get("remarks")
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
     # ================= STOCK CHECK AGAIN =================
-    item_df = ledger_df[ledger_df["Item"] == item_code]
+    t = stock_engine.item_totals(item_code)
 
-    inward = item_df[item_df["Inward_Type"] == "INWARD"]["Qty"].sum()
-    issued = item_df[item_df["Inward_Type"] == "ISSUE"]["Qty"].sum()
-    returned = item_df[item_df["Inward_Type"] == "RETURN"]["Qty"].sum()
-
-    current_stock = inward - issued + returned
+    current_stock = t["INWARD"] - t["ISSUE"] + t["RETURN"]
 
     if qty > current_stock:
         return redirect("/stores/issue?error=Edit exceeds available stock")
 
     # ================= RATE =================
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     row = items_df[items_df["Item Code"] == item_code]
 
     rm_rate = float(row.iloc[0].get("RM Rate", 0)) if not row.empty else 0
     value = qty * rm_rate
 
-    mask = ledger_df["Timestamp"] == old_timestamp
-
-    ledger_df.loc[mask, "Date"] = date
-    ledger_df.loc[mask, "Item"] = item_code
-    ledger_df.loc[mask, "Qty"] = qty
-    ledger_df.loc[mask, "Rate"] = rm_rate
-    ledger_df.loc[mask, "Value"] = value
-    ledger_df.loc[mask, "Remarks"] = f"{purpose} | Issued By: {issued_by} | {remarks}"
-
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
+    update_ledger_rows(old_timestamp, {
+        "Date": date,
+        "Item": item_code,
+        "Qty": qty,
+        "Rate": rm_rate,
+        "Value": value,
+        "Remarks": f"{purpose} | Issued By: {issued_by} | {remarks}"
+    })
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/issue")
 
@@ -4114,7 +7852,7 @@ def edit_issue():
 def stores_return():
 
     # ---------- LOAD ITEM MASTER ----------
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
 
     # ---------- ALL ITEM CODES ----------
     items_df["Item Code"] = items_df["Item Code"].astype(str).str.strip()
@@ -4149,26 +7887,19 @@ def stores_return():
         "Other Return"
     ]
 
-    # ---------- LOAD LEDGER ----------
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
-    if not ledger_df.empty:
-        ledger_df = ledger_df.sort_values("Timestamp", ascending=False)
-
-    # ---------- ONLY RETURN ENTRIES ----------
-    return_records = ledger_df[
-        ledger_df["Inward_Type"].isin([
-            "RETURN_RM",
-            "RETURN_FG",
-            "RETURN_REJECT"
-        ])
-    ]
+    # ---------- ONLY RETURN ENTRIES (ONE PAGE) ----------
+    return_records, pager = ledger_register([
+        "RETURN_RM",
+        "RETURN_FG",
+        "RETURN_REJECT"
+    ])
 
     return render_template(
         "stores_return.html",
         items=items,
         return_types=return_types,
-        records=return_records.to_dict(orient="records"),
+        records=return_records,
+        pager=pager,
 
         # 🔴 REQUIRED FOR JS DROPDOWNS
         all_items=items,
@@ -4195,7 +7926,7 @@ def save_return():
 
     qty = float(qty)
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     row = items_df[items_df["Item Code"] == item_code]
 
     if row.empty:
@@ -4219,8 +7950,6 @@ def save_return():
 
     value = qty * rate
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
     new_row = {
         "Date": date,
         "Item": item_code,
@@ -4235,14 +7964,9 @@ def save_return():
         "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    ledger_df = pd.concat(
-        [ledger_df, pd.DataFrame([new_row])],
-        ignore_index=True
-    )
-
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
+    append_ledger(pd.DataFrame([new_row]))
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/return")
 
@@ -4258,17 +7982,12 @@ def delete_return():
 
     timestamp = request.form.get("timestamp")
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-
-    before = len(df)
-    df = df[df["Timestamp"] != timestamp]
-    after = len(df)
+    removed = delete_ledger_rows(timestamp)
 
-    if before == after:
+    if removed.empty:
         return "NOT_FOUND", 404
 
-    df.to_csv(STORE_LEDGER_FILE, index=False)
-    backup_to_drive()
+    request_backup()
     return "OK", 200
 
 
@@ -4292,7 +8011,7 @@ def edit_return():
     remarks = request.form.get("remarks", "")
 
     # ---------- LOAD ITEM MASTER ----------
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     row = items_df[items_df["Item Code"] == item_code]
 
     if row.empty:
@@ -4316,21 +8035,17 @@ def edit_return():
 
     value = qty * rate
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-
-    mask = df["Timestamp"] == old_timestamp
-
-    df.loc[mask, "Date"] = date
-    df.loc[mask, "Item"] = item_code
-    df.loc[mask, "Inward_Type"] = inward_type
-    df.loc[mask, "Qty"] = qty
-    df.loc[mask, "Rate"] = rate
-    df.loc[mask, "Value"] = value
-    df.loc[mask, "Remarks"] = f"{rtype} | Received By: {received_by} | {remarks}"
-
-    df.to_csv(STORE_LEDGER_FILE, index=False)
+    update_ledger_rows(old_timestamp, {
+        "Date": date,
+        "Item": item_code,
+        "Inward_Type": inward_type,
+        "Qty": qty,
+        "Rate": rate,
+        "Value": value,
+        "Remarks": f"{rtype} | Received By: {received_by} | {remarks}"
+    })
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/return")
 
@@ -4340,7 +8055,7 @@ def edit_return():
 @app.route("/stores/outward", methods=["GET"])
 def stores_outward():
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
 
     # all item codes
     items_df["Item Code"] = items_df["Item Code"].astype(str).str.strip()
@@ -4361,30 +8076,25 @@ def stores_outward():
         "Scrap Sale"
     ]
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
-    if not ledger_df.empty:
-        ledger_df = ledger_df.sort_values("Timestamp", ascending=False)
-
-    outward_records = ledger_df[
-        ledger_df["Inward_Type"].isin([
-            "OUTWARD_FG",
-            "OUTWARD_RM",
-            "OUTWARD_REJECT"
-        ])
-    ]
+    outward_records, pager = ledger_register([
+        "OUTWARD_FG",
+        "OUTWARD_RM",
+        "OUTWARD_REJECT"
+    ])
 
     return render_template(
         "stores_outward.html",
         items=items,
         outward_types=outward_types,
-        records=outward_records.to_dict(orient="records")
+        records=outward_records,
+        pager=pager
     )
 
 # =====================================================
 # SAVE OUTWARD ENTRY
 # =====================================================
 @app.route("/stores/save_outward", methods=["POST"])
+@write_locked(STORE_LEDGER_FILE)
 def save_outward():
 
     from datetime import datetime
@@ -4403,8 +8113,8 @@ def save_outward():
     qty = float(qty)
 
     # ---------- LOAD DATA ----------
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    ledger_df = load_ledger()
+    items_df = load_table(STORE_ITEM_FILE)
 
     row = items_df[items_df["Item Code"] == item_code]
     if row.empty:
@@ -4414,37 +8124,11 @@ def save_outward():
     fg_rate = float(row["FG Rate"].values[0] or rm_rate)
 
     # ---------- CURRENT STOCK CALCULATION ----------
-    item_ledger = ledger_df[ledger_df["Item"] == item_code]
-
-    rm_in = item_ledger[
-        item_ledger["Inward_Type"].isin(["INWARD","RETURN_RM"])
-    ]["Qty"].sum()
-
-    rm_out = item_ledger[
-        item_ledger["Inward_Type"].isin(["ISSUE","OUTWARD_RM"])
-    ]["Qty"].sum()
-
-    rm_stock = rm_in - rm_out
+    t = stock_engine.item_totals(item_code)
 
-    fg_in = item_ledger[
-        item_ledger["Inward_Type"] == "RETURN_FG"
-    ]["Qty"].sum()
-
-    fg_out = item_ledger[
-        item_ledger["Inward_Type"] == "OUTWARD_FG"
-    ]["Qty"].sum()
-
-    fg_stock = fg_in - fg_out
-
-    rej_in = item_ledger[
-        item_ledger["Inward_Type"] == "RETURN_REJECT"
-    ]["Qty"].sum()
-
-    rej_out = item_ledger[
-        item_ledger["Inward_Type"] == "OUTWARD_REJECT"
-    ]["Qty"].sum()
-
-    rej_stock = rej_in - rej_out
+    rm_stock = (t["INWARD"] + t["RETURN_RM"]) - (t["ISSUE"] + t["OUTWARD_RM"])
+    fg_stock = t["RETURN_FG"] - t["OUTWARD_FG"]
+    rej_stock = t["RETURN_REJECT"] - t["OUTWARD_REJECT"]
 
     # ---------- TYPE LOGIC ----------
     if otype in ["Customer Dispatch","Sample Dispatch"]:
@@ -4507,14 +8191,9 @@ def save_outward():
         "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    ledger_df = pd.concat(
-        [ledger_df, pd.DataFrame([new_row])],
-        ignore_index=True
-    )
-
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
+    append_ledger(pd.DataFrame([new_row]))
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/outward")
 
@@ -4530,11 +8209,9 @@ def delete_outward():
 
     ts = request.form.get("timestamp")
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-    df = df[df["Timestamp"] != ts]
-    df.to_csv(STORE_LEDGER_FILE,index=False)
+    delete_ledger_rows(ts)
 
-    backup_to_drive()
+    request_backup()
 
     return "OK",200
 
@@ -4543,8 +8220,12 @@ def delete_outward():
 # =====================================================
 @app.route("/stores/reconcile", methods=["GET"])
 def stores_reconcile():
+    return render_reconcile()
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+
+def render_reconcile(preview=None):
+
+    items_df = load_table(STORE_ITEM_FILE)
 
     item_codes = sorted(
         items_df["Item Code"]
@@ -4555,7 +8236,7 @@ def stores_reconcile():
         .tolist()
     )
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
+    ledger_df = load_ledger()
 
     recon = ledger_df[
         ledger_df["Ref_No"].astype(str).str.contains("RECON", na=False)
@@ -4567,7 +8248,8 @@ def stores_reconcile():
     return render_template(
         "stores_reconcile.html",
         items=item_codes,
-        records=recon.to_dict(orient="records")
+        records=recon.to_dict(orient="records"),
+        preview=preview
     )
 
 # =====================================================
@@ -4575,24 +8257,19 @@ def stores_reconcile():
 # =====================================================
 def get_current_stock(item_code):
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-    ledger_df["Qty"] = pd.to_numeric(ledger_df["Qty"], errors="coerce").fillna(0)
-
-    item_ledger = ledger_df[
-        ledger_df["Item"].astype(str).str.strip() == str(item_code).strip()
-    ]
+    t = stock_engine.item_totals(item_code)
 
-    inward_rm = item_ledger[item_ledger["Inward_Type"]=="INWARD"]["Qty"].sum()
-    issued = item_ledger[item_ledger["Inward_Type"]=="ISSUE"]["Qty"].sum()
+    inward_rm = t["INWARD"]
+    issued = t["ISSUE"]
 
-    return_rm = item_ledger[item_ledger["Inward_Type"]=="RETURN_RM"]["Qty"].sum()
-    return_fg = item_ledger[item_ledger["Inward_Type"]=="RETURN_FG"]["Qty"].sum()
-    return_reject = item_ledger[item_ledger["Inward_Type"]=="RETURN_REJECT"]["Qty"].sum()
+    return_rm = t["RETURN_RM"]
+    return_fg = t["RETURN_FG"]
+    return_reject = t["RETURN_REJECT"]
 
-    outward_rm = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_RM"]["Qty"].sum()
-    outward_fg = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_FG"]["Qty"].sum()
-    outward_reject = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_REJECT"]["Qty"].sum()
-    outward_wip = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_WIP"]["Qty"].sum()
+    outward_rm = t["OUTWARD_RM"]
+    outward_fg = t["OUTWARD_FG"]
+    outward_reject = t["OUTWARD_REJECT"]
+    outward_wip = t["OUTWARD_WIP"]
 
     rm = inward_rm - issued + return_rm - outward_rm
     wip = issued - return_fg - return_reject - outward_wip
@@ -4610,6 +8287,7 @@ def get_current_stock(item_code):
 # SAVE MANUAL RECONCILIATION
 # =====================================================
 @app.route("/stores/save_reconcile", methods=["POST"])
+@write_locked(STORE_LEDGER_FILE)
 def save_reconcile():
 
     from datetime import datetime
@@ -4623,14 +8301,12 @@ def save_reconcile():
     if not item or not stock_type:
         return redirect("/stores/reconcile")
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
     row = items_df[items_df["Item Code"].astype(str).str.strip()==item]
 
     rm_rate = float(row.iloc[0].get("RM Rate",0) if not row.empty else 0)
     fg_rate = float(row.iloc[0].get("FG Rate",rm_rate) if not row.empty else rm_rate)
 
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
     # ---------- OPENING STOCK ----------
     if stock_type == "OPENING":
 
@@ -4648,9 +8324,8 @@ def save_reconcile():
             "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
 
-        ledger_df = pd.concat([ledger_df, pd.DataFrame([new_row])], ignore_index=True)
-        ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
-        backup_to_drive()
+        append_ledger(pd.DataFrame([new_row]))
+        request_backup()
         return redirect("/stores/reconcile")
 
     # ---------- NORMAL RECON ----------
@@ -4696,14 +8371,116 @@ def save_reconcile():
         "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    ledger_df = pd.concat([ledger_df, pd.DataFrame([new_row])], ignore_index=True)
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
-    backup_to_drive()
+    append_ledger(pd.DataFrame([new_row]))
+    request_backup()
     return redirect("/stores/reconcile")
 
 # =====================================================
-# EXCEL STOCK UPLOAD (DIRECT ADD — FINAL STABLE)
+# EXCEL STOCK UPLOAD (DIRECT ADD — BULK, WITH DRY RUN)
 # =====================================================
+# Every non-zero stock cell of the count sheet becomes one ledger row.
+# The sheet is turned into ledger rows in one melt, checked as a whole
+# (numbers, item codes against the item master) and appended in one
+# write. Any error and nothing is written: the page shows a preview
+# with the row-level errors instead. dry_run=1 only previews.
+
+# sheet column -> (Inward_Type, Ref_No, remarks prefix), in ledger order
+RECONCILE_EXCEL_COLUMNS = {
+    "RM Stock": ("ADJ_RM", "EXCEL_RM", "Excel Upload RM"),
+    "WIP Stock": ("ADJ_WIP", "EXCEL_WIP", "Excel Upload WIP"),
+    "FG Stock": ("ADJ_FG", "EXCEL_FG", "Excel Upload FG"),
+    "Reject Stock": ("ADJ_REJECT", "EXCEL_REJ", "Excel Upload Reject"),
+    "Opening Stock": ("OPENING", "EXCEL_OPEN", "Excel Opening")
+}
+
+LEDGER_COLUMNS = [
+    "Date", "Item", "Inward_Type", "Qty", "Rate", "Value",
+    "Supplier", "Ref_No", "Remarks", "User", "Timestamp"
+]
+
+RECONCILE_PREVIEW_ROWS = 200
+
+
+def reconcile_excel_rows(sheet, item_codes, today, now):
+    """
+    Ledger rows for a stock count sheet, sheet order, RM -> Opening
+    within a sheet row. Rows without an item code are skipped. Every
+    sheet row gets its own Timestamp (delete/edit work per sheet row).
+    Returns (rows, errors): errors has Row / Item Code / Error.
+    """
+    stock_cols = [c for c in RECONCILE_EXCEL_COLUMNS if c in sheet.columns]
+
+    items = (
+        upload_text(sheet["Item Code"]) if "Item Code" in sheet.columns
+        else pd.Series("", index=sheet.index)
+    )
+    keep = (items != "") & (items.str.lower() != "nan")
+
+    sheet, items = sheet[keep], items[keep]
+    problems = pd.Series("", index=sheet.index)
+
+    qty = pd.DataFrame(index=sheet.index)
+    for col in stock_cols:
+        qty[col] = pd.to_numeric(sheet[col], errors="coerce").astype(float)
+        bad = sheet[col].notna() & qty[col].isna()
+        problems += bad.map({True: f"{col} is not a number; ", False: ""})
+        qty[col] = qty[col].fillna(0)
+
+    unknown = ~items.isin(item_codes)
+    problems += unknown.map({True: "unknown item code; ", False: ""})
+
+    invalid = problems != ""
+    errors = pd.DataFrame({
+        "Row": sheet.index[invalid] + 2,        # Excel row (header is row 1)
+        "Item Code": items[invalid],
+        "Error": problems[invalid].str.rstrip("; ")
+    })
+
+    remarks = (
+        sheet["Remarks"].fillna("").astype(str) if "Remarks" in sheet.columns
+        else pd.Series("", index=sheet.index)
+    )
+    stamps = (
+        pd.Timestamp(now)
+        + pd.to_timedelta(range(len(sheet)), unit="us")
+    ).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    # ---------- ONE LEDGER ROW PER NON-ZERO CELL ----------
+    long = (
+        qty.assign(
+            _row=range(len(qty)), Item=items, _remarks=remarks, Timestamp=stamps
+        )
+        .melt(
+            id_vars=["_row", "Item", "_remarks", "Timestamp"],
+            value_vars=stock_cols, var_name="_col", value_name="Qty"
+        )
+    )
+    long = long[long["Qty"] != 0]
+
+    if long.empty:
+        return pd.DataFrame(columns=LEDGER_COLUMNS), errors.reset_index(drop=True)
+
+    long["_order"] = long["_col"].map({c: i for i, c in enumerate(RECONCILE_EXCEL_COLUMNS)})
+    long = long.sort_values(["_row", "_order"], kind="stable")
+
+    spec = long["_col"].map(RECONCILE_EXCEL_COLUMNS)
+    rows = pd.DataFrame({
+        "Date": today,
+        "Item": long["Item"],
+        "Inward_Type": spec.str[0],
+        "Qty": long["Qty"],
+        "Rate": 0,
+        "Value": 0,
+        "Supplier": "",
+        "Ref_No": spec.str[1],
+        "Remarks": spec.str[2] + " | " + long["_remarks"],
+        "User": "system",
+        "Timestamp": long["Timestamp"]
+    }, columns=LEDGER_COLUMNS)
+
+    return rows.reset_index(drop=True), errors.reset_index(drop=True)
+
+
 @app.route("/stores/upload_reconcile_excel", methods=["POST"])
 def upload_reconcile_excel():
 
@@ -4714,70 +8491,36 @@ def upload_reconcile_excel():
     if not file:
         return redirect("/stores/reconcile")
 
-    df = pd.read_excel(file)
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
-
-    today = datetime.today().strftime("%Y-%m-%d")
-
-    for idx, r in df.iterrows():
+    dry_run = request.form.get("dry_run") == "1"
 
-        item = str(r.get("Item Code","")).strip()
-        if item == "" or item.lower() == "nan":
-            continue
-
-        rm = float(r.get("RM Stock",0) or 0)
-        wip = float(r.get("WIP Stock",0) or 0)
-        fg = float(r.get("FG Stock",0) or 0)
-        reject = float(r.get("Reject Stock",0) or 0)
-        opening = float(r.get("Opening Stock",0) or 0)
-        remarks = str(r.get("Remarks",""))
-
-        # unique timestamp per row
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-
-        # ---------- RM ----------
-        if rm != 0:
-            ledger_df.loc[len(ledger_df)] = [
-                today,item,"ADJ_RM",rm,0,0,"","EXCEL_RM",
-                f"Excel Upload RM | {remarks}",
-                "system",ts
-            ]
-
-        # ---------- WIP ----------
-        if wip != 0:
-            ledger_df.loc[len(ledger_df)] = [
-                today,item,"ADJ_WIP",wip,0,0,"","EXCEL_WIP",
-                f"Excel Upload WIP | {remarks}",
-                "system",ts
-            ]
-
-        # ---------- FG ----------
-        if fg != 0:
-            ledger_df.loc[len(ledger_df)] = [
-                today,item,"ADJ_FG",fg,0,0,"","EXCEL_FG",
-                f"Excel Upload FG | {remarks}",
-                "system",ts
-            ]
+    sheet = pd.read_excel(file, dtype={"Item Code": str})
+    items_df = load_table(STORE_ITEM_FILE)
+    item_codes = (
+        upload_text(items_df["Item Code"]) if "Item Code" in items_df.columns
+        else pd.Series(dtype=str)
+    )
 
-        # ---------- REJECT ----------
-        if reject != 0:
-            ledger_df.loc[len(ledger_df)] = [
-                today,item,"ADJ_REJECT",reject,0,0,"","EXCEL_REJ",
-                f"Excel Upload Reject | {remarks}",
-                "system",ts
-            ]
+    rows, errors = reconcile_excel_rows(
+        sheet, set(item_codes), datetime.today().strftime("%Y-%m-%d"), datetime.now()
+    )
 
-        # ---------- OPENING ----------
-        if opening != 0:
-            ledger_df.loc[len(ledger_df)] = [
-                today,item,"OPENING",opening,0,0,"","EXCEL_OPEN",
-                f"Excel Opening | {remarks}",
-                "system",ts
-            ]
+    if dry_run or not errors.empty:
+        return render_reconcile(preview={
+            "file": file.filename,
+            "dry_run": dry_run,
+            "sheet_rows": len(sheet),
+            "ledger_rows": len(rows),
+            "by_type": rows["Inward_Type"].value_counts().to_dict(),
+            "rows": rows.head(RECONCILE_PREVIEW_ROWS).to_dict(orient="records"),
+            "errors": errors.head(RECONCILE_PREVIEW_ROWS).to_dict(orient="records"),
+            "error_count": len(errors),
+            "limit": RECONCILE_PREVIEW_ROWS
+        })
 
-    ledger_df.to_csv(STORE_LEDGER_FILE, index=False)
+    if not rows.empty:
+        append_ledger(rows)
 
-    backup_to_drive()
+    request_backup()
 
     return redirect("/stores/reconcile")
 
@@ -4793,11 +8536,9 @@ def delete_reconcile():
 
     ts = request.form.get("timestamp")
 
-    df = pd.read_csv(STORE_LEDGER_FILE)
-    df = df[df["Timestamp"] != ts]
-    df.to_csv(STORE_LEDGER_FILE, index=False)
+    delete_ledger_rows(ts)
 
-    backup_to_drive()
+    request_backup()
 
     return "OK",200
 
@@ -4805,12 +8546,13 @@ def delete_reconcile():
 # LIVE INVENTORY ENGINE (FINAL — WITH RECON SUPPORT)
 # =====================================================
 @app.route("/stores/inventory", methods=["GET"])
+@conditional_get(STORE_ITEM_FILE, STORE_LEDGER_FILE)
 def stores_inventory():
 
-    items_df = pd.read_csv(STORE_ITEM_FILE)
-    ledger_df = pd.read_csv(STORE_LEDGER_FILE)
+    items_df = load_table(STORE_ITEM_FILE)
+    totals = stock_engine.totals()
 
-    if ledger_df.empty or items_df.empty:
+    if totals.empty or items_df.empty:
         return render_template(
             "stores_inventory.html",
             records=[],
@@ -4819,77 +8561,16 @@ def stores_inventory():
             low_stock=0
         )
 
-    ledger_df["Qty"] = pd.to_numeric(ledger_df["Qty"], errors="coerce").fillna(0)
-    ledger_df["Item"] = ledger_df["Item"].astype(str).str.strip()
-
-    summary = []
-
-    for _, row in items_df.iterrows():
-
-        code = str(row["Item Code"]).strip()
-        category = str(row.get("Category",""))
-
-        rm_rate = float(row.get("RM Rate",0) or 0)
-        fg_rate = float(row.get("FG Rate",rm_rate) or rm_rate)
-        min_stock = float(row.get("Min Stock",0) or 0)
-
-        item_ledger = ledger_df[ledger_df["Item"] == code]
-
-        # ================= BASE =================
-        inward_rm = item_ledger[item_ledger["Inward_Type"]=="INWARD"]["Qty"].sum()
-        issued = item_ledger[item_ledger["Inward_Type"]=="ISSUE"]["Qty"].sum()
-
-        return_rm = item_ledger[item_ledger["Inward_Type"]=="RETURN_RM"]["Qty"].sum()
-        return_fg = item_ledger[item_ledger["Inward_Type"]=="RETURN_FG"]["Qty"].sum()
-        return_reject = item_ledger[item_ledger["Inward_Type"]=="RETURN_REJECT"]["Qty"].sum()
-
-        outward_rm = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_RM"]["Qty"].sum()
-        outward_fg = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_FG"]["Qty"].sum()
-        outward_reject = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_REJECT"]["Qty"].sum()
-        outward_wip = item_ledger[item_ledger["Inward_Type"]=="OUTWARD_WIP"]["Qty"].sum()
-
-        # ================= RECON ADDITIONS =================
-        adj_rm = item_ledger[item_ledger["Inward_Type"]=="ADJ_RM"]["Qty"].sum()
-        adj_wip = item_ledger[item_ledger["Inward_Type"]=="ADJ_WIP"]["Qty"].sum()
-        adj_fg = item_ledger[item_ledger["Inward_Type"]=="ADJ_FG"]["Qty"].sum()
-        adj_reject = item_ledger[item_ledger["Inward_Type"]=="ADJ_REJECT"]["Qty"].sum()
-        opening = item_ledger[item_ledger["Inward_Type"]=="OPENING"]["Qty"].sum()
-
-        # ================= STOCK =================
-        rm_stock = inward_rm - issued + return_rm - outward_rm + adj_rm + opening
-        wip_stock = issued - return_fg - return_reject - outward_wip + adj_wip
-        fg_stock = return_fg - outward_fg + adj_fg
-        reject_stock = return_reject - outward_reject + adj_reject
-
-        rm_stock = max(rm_stock,0)
-        wip_stock = max(wip_stock,0)
-        fg_stock = max(fg_stock,0)
-        reject_stock = max(reject_stock,0)
-
-        total_stock = rm_stock + wip_stock + fg_stock + reject_stock
-
-        # ================= VALUE =================
-        rm_value = rm_stock * rm_rate
-        wip_value = wip_stock * (fg_rate * 0.75)
-        fg_value = fg_stock * fg_rate
-        reject_value = reject_stock * rm_rate
-
-        total_value_item = rm_value + wip_value + fg_value + reject_value
-
-        summary.append({
-            "Item Code": code,
-            "Category": category,
-            "RM Stock": round(rm_stock,2),
-            "WIP Stock": round(wip_stock,2),
-            "FG Stock": round(fg_stock,2),
-            "Reject Stock": round(reject_stock,2),
-            "Total Stock": round(total_stock,2),
-            "Total Value": round(total_value_item,2),
-            "Min": min_stock,
-            "Low": rm_stock <= min_stock if min_stock>0 else False
-        })
+    # ================= STOCK (ALL ITEMS, ONE PASS) =================
+    pos = stock_positions(items_df, totals)
+
+    df = pos[["Item Code", "Category"]].copy()
+    for col in ["RM Stock", "WIP Stock", "FG Stock", "Reject Stock",
+                "Total Stock", "Total Value"]:
+        df[col] = pos[col].round(2)
 
-    df = pd.DataFrame(summary)
+    df["Min"] = pos["Min"]
+    df["Low"] = (pos["Min"] > 0) & (pos["RM Stock"] <= pos["Min"])
 
     total_value = df["Total Value"].sum()
     total_items = len(df)
@@ -4908,102 +8589,91 @@ def stores_inventory():
 # =========================================================
 # SHOPFLOOR TV DASHBOARD (FINAL ROTATING SYSTEM)
 # =========================================================
-@app.route("/shopfloor_tv")
-def shopfloor_tv():
+# The TV payload is computed once per production data change and
+# shared by every screen (ShopfloorTvCache). Screens keep an SSE
+# connection to /shopfloor_tv/stream, which only sends an event when
+# the data version changes; the page then reloads from the cache.
+# /shopfloor_tv/data serves the same payload as JSON.
+SHOPFLOOR_TV_TABLES = [path for _, path in PRODUCTION_SOURCES]
+SHOPFLOOR_TV_POLL_SECONDS = 2        # version check (writes in other workers)
+SHOPFLOOR_TV_HEARTBEAT_SECONDS = 15
+SHOPFLOOR_TV_STREAM_SECONDS = 300    # browsers reconnect on their own
 
-    # ---------- LOAD DATA ----------
-    main_df = load_csv("data/production_main.csv")
-    other_df = load_csv("data/production_other_machine.csv")
-    part_df = load_csv("data/part_master.csv")
 
-    prod_df = pd.concat([main_df, other_df], ignore_index=True)
+def share_pct(part, whole):
+    """Row-wise `part / whole * 100 if whole else 0` over two aligned columns."""
+    pct = (part / whole.where(whole != 0) * 100).to_numpy()
+    return [p if w else 0 for p, w in zip(pct, whole.to_numpy())]
 
-    if prod_df.empty:
-        return "<h2>No production data available</h2>"
 
-    # ---------- NORMALIZE ----------
-    prod_df["Date"] = pd.to_datetime(prod_df["Date"], errors="coerce")
-    prod_df["Time_Min"] = pd.to_numeric(prod_df["Time_Min"], errors="coerce").fillna(0)
-    prod_df["Qty"] = pd.to_numeric(prod_df["Qty"], errors="coerce").fillna(0)
-    prod_df["Mach_Rej"] = pd.to_numeric(prod_df.get("Mach_Rej", 0), errors="coerce").fillna(0)
-    prod_df["Cast_Rej"] = pd.to_numeric(prod_df.get("Cast_Rej", 0), errors="coerce").fillna(0)
-    prod_df["Good_Qty"] = pd.to_numeric(prod_df["Good_Qty"], errors="coerce").fillna(0)
+def build_shopfloor_payload():
+    """Template variables of the TV screens, or None without production."""
+
+    # ---------- LOAD DATA ----------
+    # (daily rollup of the facts: Expected_Qty from the part master,
+    #  OT_Yes = rows entered as overtime, missing reject columns = 0)
+    prod_df = get_production_rollup()
+
+    if prod_df.empty:
+        return None
 
     # ---------- LAST PRODUCTION DAY ----------
     last_date = prod_df["Date"].max()
     day_df = prod_df[prod_df["Date"] == last_date].copy()
     last_date_str = last_date.strftime("%d-%m-%Y")
 
-    # ---------- MERGE CYCLE TIME ----------
-    part_df = part_df.rename(columns={
-        "Part Number": "Part",
-        "Operation No": "Operation"
-    })
-
-    part_df["Cycle Time (min)"] = pd.to_numeric(
-        part_df["Cycle Time (min)"], errors="coerce"
-    ).fillna(0)
-
-    day_df = day_df.merge(
-        part_df[["Part", "Operation", "Cycle Time (min)"]],
-        on=["Part", "Operation"],
-        how="left"
-    )
-
     # =========================================================
     # MACHINE OEE CALCULATION
     # =========================================================
-    machines = []
-
-    for machine in sorted(day_df["Machine"].dropna().unique()):
-
-        mdf = day_df[day_df["Machine"] == machine]
-
-        time_spent = mdf["Time_Min"].sum()
-        produced = mdf["Qty"].sum()
-        good = mdf["Good_Qty"].sum()
-
-        expected = (
-            mdf["Time_Min"] / mdf["Cycle Time (min)"]
-        ).replace([float("inf"), -float("inf")], 0).sum()
+    # one groupby for every machine (sorted, as the screens page them)
+    per_machine = day_df.groupby("Machine").agg(
+        time_spent=("Time_Min", "sum"),
+        produced=("Qty", "sum"),
+        good=("Good_Qty", "sum"),
+        expected=("Expected_Qty", "sum"),
+        ot_rows=("OT_Yes", "sum"),
+        shifts=("Shift", "nunique")
+    )
 
-        available_time = (
-            570 if (mdf["OT"].astype(str).str.lower() == "yes").any() else 480
-        ) * mdf["Shift"].nunique()
+    available_time = (
+        per_machine["ot_rows"].gt(0).map({True: 570, False: 480})
+        * per_machine["shifts"]
+    )
 
-        availability = (time_spent / available_time * 100) if available_time else 0
-        performance = (produced / expected * 100) if expected else 0
-        quality = (good / produced * 100) if produced else 0
-        oee = availability * performance * quality / 10000
+    availability = share_pct(per_machine["time_spent"], available_time)
+    performance = share_pct(per_machine["produced"], per_machine["expected"])
+    quality = share_pct(per_machine["good"], per_machine["produced"])
+    oee = [a * p * q / 10000 for a, p, q in zip(availability, performance, quality)]
 
-        machines.append({
+    machines = [
+        {
             "machine": machine,
-            "availability": round(availability, 2),
-            "performance": round(performance, 2),
-            "quality": round(quality, 2),
-            "oee": round(oee, 2)
-        })
+            "availability": round(a, 2),
+            "performance": round(p, 2),
+            "quality": round(q, 2),
+            "oee": round(o, 2)
+        }
+        for machine, a, p, q, o in zip(
+            per_machine.index, availability, performance, quality, oee
+        )
+    ]
 
     # =========================================================
     # OPERATOR PRODUCTIVITY
     # =========================================================
-    operator_data = []
-
-    for op in day_df["Operator"].dropna().unique():
-
-        odf = day_df[day_df["Operator"] == op]
-
-        good = odf["Good_Qty"].sum()
-        expected = (
-            odf["Time_Min"] / odf["Cycle Time (min)"]
-        ).replace([float("inf"), -float("inf")], 0).sum()
-
-        prod_pct = (good / expected * 100) if expected else 0
+    # one groupby, operators in the order they first appear that day
+    per_operator = day_df.groupby("Operator", sort=False).agg(
+        good=("Good_Qty", "sum"),
+        expected=("Expected_Qty", "sum")
+    )
 
-        operator_data.append({
-            "name": op,
-            "value": round(prod_pct, 2)
-        })
+    operator_data = [
+        {"name": op, "value": round(pct, 2)}
+        for op, pct in zip(
+            per_operator.index,
+            share_pct(per_operator["good"], per_operator["expected"])
+        )
+    ]
 
     operator_data = sorted(operator_data, key=lambda x: x["value"], reverse=True)
 
@@ -5072,8 +8742,7 @@ def shopfloor_tv():
 
     total_production = int(day_df["Good_Qty"].sum())
 
-    return render_template(
-        "shopfloor_tv_v2.html",
+    return dict(
         last_date=last_date_str,
         machines=machines,
         total_production=total_production,
@@ -5090,6 +8759,103 @@ def shopfloor_tv():
         operator_rejection=operator_rejection.to_dict(orient="records")
     )
 
+
+class ShopfloorTvCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._sig = None
+        self._version = None
+        self._payload = None
+        self.computes = 0
+        self.hits = 0
+
+    def get(self):
+        """(version, payload); recomputed only when the data changed."""
+        sig = production_data_signature(SHOPFLOOR_TV_TABLES)
+
+        with self._lock:
+            if sig != self._sig:
+                self._payload = build_shopfloor_payload()
+                self._version = hashlib.sha1(repr(sig).encode()).hexdigest()[:12]
+                self._sig = sig
+                self.computes += 1
+            else:
+                self.hits += 1
+            return self._version, self._payload
+
+    def wait(self, timeout):
+        """Sleep until a production write in this process, or timeout."""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def on_write(self, path, *_):
+        if os.path.dirname(path) in [partition_dir(p) for p in SHOPFLOOR_TV_TABLES]:
+            with self._changed:
+                self._changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "computes": self.computes,
+                "hits": self.hits
+            }
+
+
+shopfloor_tv_cache = ShopfloorTvCache()
+TABLE_APPEND_HOOKS.append(shopfloor_tv_cache.on_write)
+TABLE_FILTER_HOOKS.append(shopfloor_tv_cache.on_write)
+
+
+@app.route("/shopfloor_tv")
+@conditional_get(*SHOPFLOOR_TV_TABLES, PART_MASTER_FILE)
+def shopfloor_tv():
+    version, payload = shopfloor_tv_cache.get()
+
+    if payload is None:
+        return "<h2>No production data available</h2>"
+
+    return render_template("shopfloor_tv_v2.html", tv_version=version, **payload)
+
+
+@app.route("/shopfloor_tv/data")
+@conditional_get(*SHOPFLOOR_TV_TABLES, PART_MASTER_FILE)
+def shopfloor_tv_data():
+    version, payload = shopfloor_tv_cache.get()
+    return jsonify({"version": version, **(payload or {})})
+
+
+@app.route("/shopfloor_tv/stream")
+def shopfloor_tv_stream():
+    seen = request.args.get("version")
+
+    def events(seen):
+        yield f"retry: {SHOPFLOOR_TV_POLL_SECONDS * 1000}\n\n"
+
+        end = time.monotonic() + SHOPFLOOR_TV_STREAM_SECONDS
+        beat = time.monotonic()
+
+        while time.monotonic() < end:
+            version, _ = shopfloor_tv_cache.get()
+
+            if version != seen:
+                seen = version
+                beat = time.monotonic()
+                yield f"event: tv\ndata: {json.dumps({'version': version})}\n\n"
+            elif time.monotonic() - beat >= SHOPFLOOR_TV_HEARTBEAT_SECONDS:
+                beat = time.monotonic()
+                yield ": keep-alive\n\n"
+
+            shopfloor_tv_cache.wait(SHOPFLOOR_TV_POLL_SECONDS)
+
+    return Response(
+        events(seen),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # =========================================
 # 🔐 ADMIN RESET PRODUCTION DATA (SAFE VERSION)
 # =========================================
@@ -5097,6 +8863,7 @@ def shopfloor_tv():
 RESET_VERIFICATION_CODE = "resetcati123"
 
 @app.route("/admin/reset_production", methods=["POST"])
+@write_locked(PRODUCTION_MAIN_FILE, PRODUCTION_OTHER_FILE, PRODUCTION_LOSS_FILE)
 def reset_production_data():
     import os
     import pandas as pd
@@ -5115,34 +8882,14 @@ def reset_production_data():
         print("🟢 Backup completed before reset")
 
         files_to_reset = [
-            "data/production_main.csv",
-            "data/production_other_machine.csv",
-            "data/production_loss.csv"
+            PRODUCTION_MAIN_FILE,
+            PRODUCTION_OTHER_FILE,
+            PRODUCTION_LOSS_FILE
         ]
 
-        os.makedirs("data", exist_ok=True)
-
+        # every month partition goes; new entries start fresh files
         for path in files_to_reset:
-
-            if os.path.exists(path) and os.path.getsize(path) > 0:
-
-                # Read existing header structure
-                df = pd.read_csv(path)
-                columns = df.columns.tolist()
-
-            else:
-                # Define fallback headers (in case file missing)
-                if "main" in path:
-                    columns = ["Date","Operator","Shift","OT","Machine","Part","Operation",
-                               "Time_Min","Qty","Cast_Rej","Mach_Rej","Good_Qty"]
-                elif "other" in path:
-                    columns = ["Date","Operator","Shift","OT","Machine","Part","Operation",
-                               "Time_Min","Qty","Cast_Rej","Mach_Rej","Good_Qty"]
-                else:  # loss file
-                    columns = ["Date","Operator","Shift","OT","Machine","Loss_Reason","Time_Min"]
-
-            # Write clean empty file with headers
-            pd.DataFrame(columns=columns).to_csv(path, index=False)
+            drop_partitions(path)
 
         print("🟢 PRODUCTION DATA RESET SUCCESSFUL")
 
@@ -5156,6 +8903,31 @@ def reset_production_data():
 def admin_reset_page():
     return render_template("admin_reset.html", active_report="reset")
 
+# =========================================
+# BACKUP QUEUE STATUS (MONITORING)
+# =========================================
+
+@app.route("/admin/backup_status")
+def backup_status():
+    return jsonify(backup_queue.status())
+
+@app.route("/admin/lock_status")
+def lock_status():
+    return jsonify(table_locks.stats())
+
+@app.route("/admin/cache_status")
+def cache_status():
+    return jsonify({
+        "tables": table_cache.stats(),
+        "columnar": columnar.stats(),
+        "shopfloor_tv": shopfloor_tv_cache.stats(),
+        "exports": export_jobs.stats(),
+        "reports": report_cache.stats(),
+        "keys": key_dictionaries.stats(),
+        "production_entry_masters": production_entry_masters.stats(),
+        "conditional_get": conditional_responses.stats()
+    })
+
 # =========================================
 # MAIN
 # =========================================